@@ -1,24 +1,46 @@
 import os
 import argparse
+import getpass
 import importlib
 from pathlib import Path
 import sys
-import subprocess
 from distutils.dir_util import copy_tree
 import shutil
 import random
+import time
+import pickle
 from itertools import cycle
+from typing import Union
 
 from ludwig import print_ludwig
 from ludwig import __version__
-from ludwig.requests import gen_all_param2vals
+from ludwig.requests import gen_all_param2vals, sample_param2vals, STRATEGIES
 from ludwig.job import Job
+from ludwig.index import ParamIndex
 from ludwig.paths import default_mnt_point
-from ludwig.run import save_job_files
+from ludwig.run import save_job_files, default_results_formats
 from ludwig.uploader import Uploader
+from ludwig.placement import CostModel, assign_jobs, pin_jobs, print_schedule
+from ludwig.fingerprint import CodeFingerprint
+from ludwig.reps import calc_num_reps, calc_ci_half_width
+from ludwig.results import load_final_values
+from ludwig.heartbeats import load_heartbeats, format_heartbeat, find_running_jobs
+from ludwig.asha import start_sweep, load_sweep_id
 from ludwig import config
 
 
+def parse_reps(s: str) -> Union[int, str]:
+    if s == 'auto':
+        return s
+    try:
+        res = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError('must be a positive integer or "auto"')
+    if res < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer or "auto"')
+    return res
+
+
 def add_ssh_config():
     """
     append contents of /media/research_data/.ludwig/config to ~/.ssh/ludwig_config
@@ -31,13 +53,17 @@ def add_ssh_config():
 
 def status():
     """
-    return filtered stdout (to which workers are printing) to get a sense of what workers are doing
+    print the state of each worker, read from heartbeats saved by the watchers on the shared drive
     """
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-w', '--worker', default=None, action='store', dest='worker',
                         choices=config.Remote.online_worker_names, required=False,
                         help='The name of the worker the status of which is requested.')
+    parser.add_argument('--watch', default=None, action='store', dest='watch', type=float, nargs='?',
+                        const=config.Watcher.heartbeat_interval,
+                        required=False,
+                        help='Refresh the status until interrupted. Optionally, the number of seconds between updates.')
     parser.add_argument('-mnt', '--research_data', default=None, action='store', dest='research_data_path',
                         required=False,
                         help='Specify where the shared drive is mounted on your system (if not /media/research_data).')
@@ -48,36 +74,26 @@ def status():
     else:
         research_data_path = Path(default_mnt_point) / config.WorkerDirs.research_data.name
 
-    stdout_path = research_data_path / config.WorkerDirs.stdout.name
+    heartbeats_path = research_data_path / config.WorkerDirs.heartbeats.name
+    if not heartbeats_path.exists():
+        raise SystemExit(f'Cannot find {heartbeats_path}. Check your access to the shared drive. Try using --mnt flag.')
 
     if namespace.worker is None:
         workers = config.Remote.online_worker_names
     else:
         workers = [namespace.worker]
 
-    res = ''
-    for w in workers:
-
-        match_string = str(stdout_path / (w + ".out"))
-        tail_length = 10
-
-        command = f'tail -n {tail_length} {match_string}'
-        status_, output = subprocess.getstatusoutput(command)
-
-        if status_ != 0:
-            return 'Something went wrong. Check your access to the shared drive. Try using --mnt flag.'
-
-        lines = str(output).split('\n')
-        lines_with_ludwig_status = [line for line in lines if 'Ludwig' in line]
-
-        # collect strings
-        try:
-            res += lines_with_ludwig_status[-1]  # second to last shows status
-        except IndexError:  # assume worker is busy
-            res += f'{" ":>27} ({w.capitalize():<8}): Working on job'
-        res += '\n'
-
-    return res.strip('\n')
+    try:
+        while True:
+            heartbeats = load_heartbeats(heartbeats_path, workers)
+            res = '\n'.join(format_heartbeat(w, heartbeat) for w, heartbeat in zip(workers, heartbeats))
+            if namespace.watch is None:
+                print(res)
+                return
+            print('\033[2J\033[H' + time.strftime(config.Time.format) + '\n' + res, flush=True)  # clear screen
+            time.sleep(namespace.watch)
+    except KeyboardInterrupt:
+        pass
 
 
 def submit():
@@ -97,10 +113,22 @@ def submit():
     parser.add_argument('-src', '--src', default=cwd.name.lower(), action='store', dest='src',
                         required=False,
                         help='Specify path to your source code.')
-    parser.add_argument('-r', '--reps', default=1, action='store', dest='reps', type=int,
-                        choices=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 20, 30, 40, 50],
+    parser.add_argument('-r', '--reps', default=1, action='store', dest='reps', type=parse_reps,
+                        required=False,
+                        help='Number of times each job will be executed, '
+                             'or "auto" to execute jobs until the confidence interval of --metric is narrow enough')
+    parser.add_argument('--target_ci', default=None, action='store', dest='target_ci', type=float,
+                        required=False,
+                        help='With --reps auto: half-width of the 95%% confidence interval of the final value of --metric')
+    parser.add_argument('--metric', default=None, action='store', dest='metric',
                         required=False,
-                        help='Number of times each job will be executed')
+                        help='With --reps auto: name of the series whose final value is used')
+    parser.add_argument('--min_reps', default=3, action='store', dest='min_reps', type=int,
+                        required=False,
+                        help='With --reps auto: number of times each job is executed at least')
+    parser.add_argument('--max_reps', default=20, action='store', dest='max_reps', type=int,
+                        required=False,
+                        help='With --reps auto: number of times each job is executed at most')
     parser.add_argument('-m', '--minimal', action='store_true', default=False, dest='minimal',
                         required=False,
                         help='Run minimal parameter configuration for debugging.')
@@ -118,12 +146,50 @@ def submit():
                         choices=config.Remote.group2workers.keys(),
                         required=False,
                         help='Specify a worker group')
+    parser.add_argument('-q', '--shared_queue', action='store_true', default=False, dest='shared_queue',
+                        required=False,
+                        help='Let idle workers claim jobs from a shared queue instead of assigning jobs in advance.')
+    parser.add_argument('-p', '--placement', default='cost', action='store', dest='placement',
+                        choices=['cost', 'cycle'],
+                        required=False,
+                        help='Assign jobs to workers based on predicted duration, or cycle through workers.')
+    parser.add_argument('--warm', default=0, action='store', dest='warm', type=int, nargs='?',
+                        const=config.Watcher.max_jobs_per_process,
+                        required=False,
+                        help='Run jobs in long-lived processes that import the job module once. '
+                             'Optionally, the number of jobs after which a process is replaced.')
+    parser.add_argument('-b', '--batch_size', default=None, action='store', dest='batch_size', type=int,
+                        required=False,
+                        help='Number of jobs run by a single call to main_batch(), if the job module defines it. '
+                             f'Defaults to {config.Watcher.batch_size}.')
+    parser.add_argument('--priority', default='normal', action='store', dest='priority',
+                        choices=config.Watcher.priorities,
+                        required=False,
+                        help='Jobs with higher priority are started first on each worker. '
+                             'Submissions with --minimal or --first_only always have the highest priority.')
+    parser.add_argument('-d', '--dry_run', action='store_true', default=False, dest='dry_run',
+                        required=False,
+                        help='Print predicted schedule, without saving or uploading jobs.')
     parser.add_argument('-x', '--clear_runs', action='store_true', default=False, dest='clear_runs',
                         required=False,
                         help='Delete all saved runs associated with current project on shared drive')
     parser.add_argument('-f', '--first_only', action='store_true', default=False, dest='first_only',
                         required=False,
                         help='Run first job and exit.')
+    parser.add_argument('--sample', default=None, action='store', dest='sample', type=int,
+                        required=False,
+                        help='Number of distinct parameter configurations to draw from param2requests.')
+    parser.add_argument('--strategy', default='random', action='store', dest='strategy',
+                        choices=STRATEGIES,
+                        required=False,
+                        help='How to draw configurations when using --sample.')
+    parser.add_argument('--param2vals_path', default=None, action='store', dest='param2vals_path',
+                        required=False,
+                        help='Path to a pickled list of parameter configurations to submit instead of param2requests, '
+                             'e.g. proposed by ludwig-optimize.')
+    parser.add_argument('--seed', default=0, action='store', dest='seed', type=int,
+                        required=False,
+                        help='Random seed used when using --sample. The same seed draws the same configurations.')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
     parser.add_argument('-mnt', '--research_data', default=None, action='store', dest='research_data_path',
                         required=False,
@@ -131,10 +197,15 @@ def submit():
     parser.add_argument('-e', '--extra_paths', nargs='*', default=[], action='store', dest='extra_paths',
                         required=False,
                         help='Paths to additional Python packages or data. ')
+    parser.add_argument('--ignore_code_changes', action='store_true', default=False, dest='ignore_code_changes',
+                        required=False,
+                        help='Count jobs executed with previous versions of the source code as repetitions.')
     parser.add_argument('-n', '--no-upload', action='store_true', dest='no_upload',
                         required=False,
                         help='Whether to upload jobs to Ludwig. Set false for testing')
     namespace = parser.parse_args()
+    if namespace.reps == 'auto' and (namespace.target_ci is None or namespace.metric is None):
+        parser.error('--reps auto requires --target_ci and --metric')
 
     # ---------------------------------------------- paths
 
@@ -163,6 +234,14 @@ def submit():
     sys.path.append(str(cwd))
     user_params = importlib.import_module(src_path.name + '.params')
     user_job = importlib.import_module(src_path.name + '.job')
+    if namespace.batch_size is None:
+        batch_size = config.Watcher.batch_size if hasattr(user_job, 'main_batch') else 1
+    else:
+        batch_size = namespace.batch_size
+    if batch_size > 1 and not hasattr(user_job, 'main_batch'):
+        raise AttributeError('--batch_size requires main_batch() in job module')
+    if batch_size > 1:
+        print_ludwig(f'Jobs on the same worker are run in batches of {batch_size} by main_batch()')
 
     # ------------------------------------------------ checks
 
@@ -204,15 +283,11 @@ def submit():
 
     uploader = Uploader(project_path, src_path.name)
 
-    # delete job instructions for worker saved on server (do this before uploader.to_disk() )
-    for pkl_path in project_path.glob(f'*.pkl'):
-        pkl_path.unlink()
-
     if namespace.group is None:
         random.shuffle(config.Remote.online_worker_names)
-        workers_cycle = cycle(config.Remote.online_worker_names)
+        workers = config.Remote.online_worker_names
     else:
-        workers_cycle = cycle(config.Remote.group2workers[namespace.group])
+        workers = config.Remote.group2workers[namespace.group]
         print(f'Using workers in group={namespace.group}')
 
     # ---------------------------------------------------
@@ -222,23 +297,55 @@ def submit():
         param2val = user_params.param2default.copy()
         param2val.update(user_params.param2debug)
         param2val_list = [param2val]
+    elif namespace.param2vals_path is not None:
+        with open(namespace.param2vals_path, 'rb') as f:
+            param2val_list = pickle.load(f)
+        print_ludwig(f'Loaded {len(param2val_list)} parameter configurations from {namespace.param2vals_path}')
+    elif namespace.sample is not None:
+        print_ludwig(f'Drawing {namespace.sample} parameter configurations with strategy={namespace.strategy}')
+        param2val_list = sample_param2vals(user_params.param2requests,
+                                           user_params.param2default,
+                                           namespace.sample,
+                                           namespace.strategy,
+                                           namespace.seed)
     else:
         param2val_list = gen_all_param2vals(user_params.param2requests,
                                             user_params.param2default)
+    # jobs executed with different source code (or extra paths) are not counted as repetitions
+    if namespace.ignore_code_changes:
+        code_fingerprint = None
+    else:
+        code_fingerprint = CodeFingerprint([src_path] + [Path(p) for p in namespace.extra_paths],
+                                           exclude=[src_path / 'params.py'])
+
     # iterate over unique jobs
     num_new = 0
-    workers_with_jobs = set()
+    remote_jobs = []
+    param_index = ParamIndex(runs_path)
     for param2val in param2val_list:
 
         # make job
-        job = Job(param2val)
-        job.update_param_name(runs_path, num_new)
+        job = Job(param2val, code_fingerprint(param2val) if code_fingerprint is not None else None)
+        job.update_param_name(runs_path, num_new, param_index)
+
+        # decide number of repetitions based on final values of metric of completed jobs
+        if namespace.reps == 'auto':
+            param_path = runs_path / job.param2val['param_name']
+            values = [] if job.is_new else load_final_values(param_path, namespace.metric, job.code_fingerprint)
+            reps = calc_num_reps(values, namespace.target_ci, namespace.min_reps, namespace.max_reps)
+            half_width = calc_ci_half_width(values)
+            print_ludwig(f'{job.param2val["param_name"]:<10} {namespace.metric} completed {len(values):>3} times, '
+                         f'CI half-width={half_width if half_width is None else round(half_width, 4)}. '
+                         f'Requires {reps} repetitions')
+        else:
+            reps = namespace.reps
 
         # multiply job
         for rep_id in range(job.calc_num_needed(
                 runs_path,
-                namespace.reps,
-                disable=True if (namespace.minimal or namespace.local or namespace.clear_runs) else False)):
+                reps,
+                disable=True if (namespace.minimal or namespace.local or namespace.clear_runs) else False,
+                param_index=param_index)):
             job.update_job_name(rep_id)
 
             # run locally
@@ -246,19 +353,91 @@ def submit():
                 job.param2val['project_path'] = str(project_path)
                 job.param2val['param_name'] += config.Constants.not_ludwig
                 job.param2val['job_name'] += config.Constants.not_ludwig
+                start = time.time()
                 series_list = user_job.main(job.param2val)
-                save_job_files(job.param2val, series_list, runs_path)
+                save_job_files(job.param2val, series_list, runs_path, time.time() - start,
+                               getattr(user_job, 'results_formats', default_results_formats),
+                               code_fingerprint=job.code_fingerprint)
             # upload to Ludwig worker
             else:
                 job.param2val['project_path'] = str(config.WorkerDirs.research_data / project_name)
-                worker = namespace.worker or next(workers_cycle)
-                workers_with_jobs.add(worker)
-                uploader.to_disk(job, worker)
+                remote_jobs.append(Job(job.param2val.copy(), job.code_fingerprint))
 
         num_new += int(job.is_new)
 
         if namespace.first_only:
-            raise SystemExit('Exiting loop after first job because --first_only=True.')
+            if namespace.local or namespace.isolated:
+                raise SystemExit('Exiting loop after first job because --first_only=True.')
+            print_ludwig('Submitting only the first job because --first_only=True.')
+            break
+
+    # predict cost of jobs - the most costly jobs are started first
+    if namespace.placement == 'cost' and remote_jobs:
+        cost_model = CostModel(runs_path, param_index=param_index)
+        worker2speed = cost_model.worker2speed
+        costs = [cost_model.predict_cost(job.param2val) for job in remote_jobs]
+        if not cost_model.history:
+            print_ludwig('No durations of previous jobs found. Assuming all jobs take equally long.')
+    else:
+        worker2speed = {w: 1.0 for w in workers}
+        costs = [1.0] * len(remote_jobs)
+
+    # configurations that are running already stay on their worker - otherwise they are preempted and started again
+    if remote_jobs and not (namespace.shared_queue or namespace.worker):
+        heartbeats = load_heartbeats(research_data_path / config.WorkerDirs.heartbeats.name, workers)
+        pinned = pin_jobs([job.param2val['param_name'] for job in remote_jobs],
+                          find_running_jobs(heartbeats, workers, project_name),
+                          workers)
+        num_pinned = len([w for w in pinned if w is not None])
+        if num_pinned:
+            print_ludwig(f'Keeping {num_pinned} running job(s) with unchanged configuration on their worker')
+    else:
+        pinned = [None] * len(remote_jobs)
+
+    # assign jobs to workers
+    if namespace.shared_queue:
+        assigned_workers = []
+        workers_with_jobs = ({namespace.worker} if namespace.worker else set(workers)) if remote_jobs else set()
+    elif namespace.worker:
+        assigned_workers = [namespace.worker] * len(remote_jobs)
+        workers_with_jobs = set(assigned_workers)
+    elif namespace.placement == 'cost':
+        assigned_workers, worker2finish = assign_jobs(costs, workers, worker2speed, pinned)
+        print_schedule(assigned_workers, worker2finish, worker2speed)
+        workers_with_jobs = set(assigned_workers)
+    else:
+        remaining_workers = cycle(workers)
+        assigned_workers = [w if w is not None else next(remaining_workers) for w in pinned]
+        workers_with_jobs = set(assigned_workers)
+
+    if namespace.dry_run:
+        print_ludwig('Flag --dry_run set. Not saving or uploading jobs.')
+        return
+
+    # delete job instructions for worker saved on server (do this before uploader.to_disk() )
+    for pkl_path in project_path.glob(f'*.pkl'):
+        pkl_path.unlink()
+    if not (namespace.local or namespace.isolated):
+        uploader.clear_queue()
+
+    # save jobs to shared drive
+    if not (namespace.local or namespace.isolated):
+        # jobs stopped early by ludwig.asha are only compared to jobs of the same submission.
+        # jobs that are not uploaded are not a new submission - they keep the sweep of running jobs
+        sweep_id = load_sweep_id(project_path) if namespace.no_upload else start_sweep(project_path)
+        uploader.save_options({'max_jobs_per_process': namespace.warm,
+                               'batch_size': batch_size,
+                               'user': getpass.getuser(),
+                               'priority': config.Watcher.priorities[0] if (namespace.minimal or namespace.first_only)
+                               else namespace.priority,
+                               'fast_lane': namespace.minimal or namespace.first_only,
+                               'sweep_id': sweep_id})
+    if namespace.shared_queue:
+        for priority, i in enumerate(sorted(range(len(remote_jobs)), key=lambda i: costs[i], reverse=True)):
+            uploader.to_queue(remote_jobs[i], priority)
+    else:
+        for job, worker in zip(remote_jobs, assigned_workers):
+            uploader.to_disk(job, worker)
 
     # upload?
     if namespace.no_upload:
@@ -269,22 +448,20 @@ def submit():
 
     # kill running jobs on workers? (do this before removing runs folders)
     # trigger worker without job instructions: kills existing job with matching project_name
-    for worker in set(config.Remote.online_worker_names).difference(workers_with_jobs):
-        uploader.kill_jobs(worker)
+    with uploader:
+        uploader.run_on_workers(uploader.kill_jobs,
+                                set(config.Remote.online_worker_names).difference(workers_with_jobs))
 
-    # delete existing runs?
-    if namespace.clear_runs:
-        for param_path in runs_path.glob('*param*'):
-            print_ludwig('Removing\n{}'.format(param_path))
-            sys.stdout.flush()
-            shutil.rmtree(str(param_path))
+        # delete existing runs?
+        if namespace.clear_runs:
+            for param_path in runs_path.glob('*param*'):
+                print_ludwig('Removing\n{}'.format(param_path))
+                sys.stdout.flush()
+                shutil.rmtree(str(param_path))
 
-    # upload = start jobs
-    for worker in workers_with_jobs:
-        uploader.start_jobs(worker)
+        # upload = start jobs
+        uploader.run_on_workers(uploader.start_jobs, workers_with_jobs)
 
     print('Submitted jobs to:')
     for w in workers_with_jobs:
         print(w)
-
-
@@ -0,0 +1,95 @@
+"""
+Arrays produced by preprocessing (e.g. a tokenized corpus) are saved once per host as .npy files,
+ and loaded by each job as read-only memory maps.
+Concurrent jobs on the same host then share the same pages in memory, instead of each holding a copy.
+Artifacts are evicted least-recently-used first, like local copies made by ludwig.data_cache.
+
+this module is imported by jobs on Ludwig workers - it must be compatible with python3.7.
+"""
+from pathlib import Path
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import socket
+import numpy as np
+from typing import Dict, Any, Callable, Optional, Union
+
+from ludwig import config
+from ludwig.data_cache import evict, open_locked, mark_used
+
+meta_name = 'meta.json'
+
+
+def get_artifacts_path(project_path: Union[str, Path],
+                       ) -> Path:
+    """artifacts are saved on the local disk of a worker, or next to the project when running locally"""
+    project_path = Path(project_path)
+    if config.WorkerDirs.artifacts.is_dir():
+        return config.WorkerDirs.artifacts / project_path.name
+    return project_path / config.Constants.artifacts / socket.gethostname().lower()
+
+
+def save_arrays(path: Path,
+                name2array: Dict[str, np.ndarray],
+                info: Optional[Dict[str, Any]] = None,
+                ) -> None:
+    """save each array to its own .npy file, and shape and dtype of all arrays to a json header"""
+    path.mkdir(parents=True)
+    meta = {'info': info, 'arrays': {}}
+    for name, array in name2array.items():
+        array = np.asarray(array)
+        if array.dtype == object:
+            raise ValueError('Ludwig: Arrays with dtype=object cannot be memory-mapped. Convert {}.'.format(name))
+        np.save(str(path / '{}.npy'.format(name)), array, allow_pickle=False)
+        meta['arrays'][name] = {'shape': list(array.shape), 'dtype': array.dtype.str}
+    meta['num_bytes'] = sum(p.stat().st_size for p in path.iterdir())
+    with (path / meta_name).open('w') as f:
+        json.dump(meta, f)
+
+
+def load_arrays(path: Path,
+                ) -> Dict[str, np.memmap]:
+    """return read-only memory maps of all arrays saved with save_arrays"""
+    with (path / meta_name).open('r') as f:
+        meta = json.load(f)
+    return {name: np.load(str(path / '{}.npy'.format(name)), mmap_mode='r', allow_pickle=False)
+            for name in meta['arrays']}
+
+
+def load_artifact(project_path: Union[str, Path],
+                  name: str,
+                  make: Callable[[], Dict[str, np.ndarray]],
+                  key: Any = None,  # e.g. parameters of preprocessing - a different key makes a different artifact
+                  max_bytes: int = config.Artifacts.max_bytes,
+                  ) -> Dict[str, np.memmap]:
+    """
+    return read-only memory maps of arrays returned by make().
+    make() is called only by the first job on a host that requests the artifact, other jobs wait for it.
+    least-recently-used artifacts of the project are evicted if all artifacts exceed max_bytes,
+     unless they are used by a running job.
+
+    usage in job.main():
+        arrays = load_artifact(param2val['project_path'], 'corpus', lambda: {'tokens': tokenize(corpus)})
+    """
+    key_hash = hashlib.sha1(repr(key).encode('utf8')).hexdigest()[:16]
+    artifacts_path = get_artifacts_path(project_path)
+    artifacts_path.mkdir(parents=True, exist_ok=True)
+    entry_name = '{}_{}'.format(name, key_hash)
+    path = artifacts_path / entry_name
+
+    with open_locked(artifacts_path / '{}.lock'.format(entry_name), fcntl.LOCK_EX):
+        mark_used(artifacts_path, entry_name)
+        if not (path / meta_name).exists():  # not made by another job while waiting for lock
+            name2array = {k: np.asarray(v) for k, v in make().items()}
+            if not evict(artifacts_path, sum(a.nbytes for a in name2array.values()), max_bytes):
+                print('WARNING: Artifact {} does not fit into {} bytes'.format(name, max_bytes))
+            tmp_path = artifacts_path / '.{}.{}.tmp'.format(entry_name, os.getpid())
+            save_arrays(tmp_path, name2array, info={'name': name, 'key': repr(key)})
+            if path.exists():  # incomplete
+                shutil.rmtree(str(path))
+            os.rename(str(tmp_path), str(path))
+        os.utime(str(path / meta_name))  # time of last use
+
+    return load_arrays(path)
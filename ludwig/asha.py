@@ -0,0 +1,173 @@
+"""
+Asynchronous successive halving (ASHA): stop jobs early if their performance is not among the best.
+
+Each job reports a metric during training. When a job reaches a rung (e.g. steps 100, 300, 900 for eta=3),
+ its value is compared to values of all other jobs that reached the same rung so far.
+Only the top 1/eta of jobs continue - the others are told to stop, and return their partial series.
+
+Values at each rung are saved as one small file per configuration in the project folder on the shared drive
+ (asha/<study>/<sweep_id>/rung_<step>/<param_name>.json), so that jobs on different workers can be compared
+ without a central scheduler.
+Each submission to Ludwig workers starts a new sweep (see start_sweep), so that jobs are not compared to jobs of
+ previous submissions, which may have been executed with different code.
+The sweep id is saved to options.yaml in the project folder, next to the other options of the submission.
+Jobs run with --local are compared to jobs of the current sweep, jobs run with --isolated to jobs of sweep "default".
+Sweeps older than config.Time.delete_delta hours are removed.
+
+this module is imported by jobs on Ludwig workers - it must be compatible with python3.7.
+"""
+from pathlib import Path
+import datetime
+import json
+import os
+import shutil
+import time
+import pandas as pd
+import yaml
+from typing import Dict, Any, List, Optional
+
+from ludwig import config
+
+
+def start_sweep(project_path: Path,
+                ) -> str:
+    """
+    called at submission: return a new sweep id, to be saved to options.yaml, and remove expired sweeps
+    """
+    sweep_id = datetime.datetime.now().strftime(config.Time.format)
+
+    asha_path = project_path / config.Constants.asha
+    for sweep_path in asha_path.glob('*/*'):  # <study>/<sweep_id>
+        try:
+            is_expired = time.time() - sweep_path.stat().st_mtime > config.Time.delete_delta * 60 * 60
+        except FileNotFoundError:  # removed by another submission
+            continue
+        if sweep_path.is_dir() and sweep_path.name != sweep_id and is_expired:
+            shutil.rmtree(str(sweep_path), ignore_errors=True)
+    return sweep_id
+
+
+def load_sweep_id(project_path: Path,
+                  ) -> str:
+    """return id of sweep saved by the last submission to Ludwig workers"""
+    try:
+        with (project_path / config.Constants.options).open('r') as f:
+            return yaml.load(f, Loader=yaml.FullLoader).get('sweep_id') or 'default'
+    except (OSError, yaml.YAMLError, AttributeError):  # e.g. submitted with previous version of Ludwig
+        return 'default'
+
+
+def make_rungs(min_step: int,
+               eta: int,
+               max_step: Optional[int] = None,
+               max_num_rungs: int = 32,
+               ) -> List[int]:
+    """steps at which jobs are compared: min_step * eta^k, excluding max_step (when all jobs are complete)"""
+    res = []
+    step = min_step
+    while len(res) < max_num_rungs and (max_step is None or step < max_step):
+        res.append(step)
+        step *= eta
+    return res
+
+
+def is_promoted(value: float,
+                values: List[float],
+                eta: int,
+                mode: str,
+                ) -> bool:
+    """return True if value is among the top 1/eta of values (at least the best value is promoted)"""
+    ranked = sorted(values, reverse=(mode == 'max'))
+    num_promoted = max(1, len(ranked) // eta)
+    threshold = ranked[num_promoted - 1]
+    return value >= threshold if mode == 'max' else value <= threshold
+
+
+class Reporter:
+    """
+    usage in job.main():
+
+        reporter = Reporter(param2val, metric='accuracy', mode='max', min_step=100, max_step=num_steps)
+        for step in range(num_steps):
+            ...
+            if reporter.report(step, accuracy):
+                break
+        return [reporter.series]
+    """
+
+    def __init__(self,
+                 param2val: Dict[str, Any],
+                 metric: str,
+                 mode: str = 'max',  # whether higher values of the metric are better
+                 min_step: int = 1,  # first rung
+                 eta: int = 3,  # only 1/eta jobs continue at each rung
+                 max_step: Optional[int] = None,
+                 study: Optional[str] = None,  # jobs are compared only to jobs of the same study
+                 ):
+        if mode not in ['max', 'min']:
+            raise ValueError('Ludwig: mode must be "max" or "min"')
+        self.param2val = param2val
+        self.metric = metric
+        self.mode = mode
+        self.eta = eta
+        self.rungs = make_rungs(min_step, eta, max_step)
+        project_path = Path(param2val['project_path'])
+        self.asha_path = project_path / config.Constants.asha / (study or metric) / load_sweep_id(project_path)
+        self.save_path = Path(param2val['save_path'])
+        self.step2value = {}
+        self.num_rungs_reached = 0
+        self.should_stop = False
+
+    @property
+    def series(self) -> pd.Series:
+        """values reported so far - can be returned by job.main() like any other series"""
+        res = pd.Series(self.step2value, name=self.metric, dtype=float)
+        res.index.name = 'step'
+        return res
+
+    def save_rung_value(self,
+                        rung: int,
+                        value: float,
+                        ) -> List[float]:
+        """
+        save value of this job at a rung, and return values of all configurations that reached the rung so far.
+        each configuration counts once - a repetition of a configuration replaces the value of previous repetitions
+        """
+        rung_path = self.asha_path / 'rung_{}'.format(rung)
+        rung_path.mkdir(parents=True, exist_ok=True)
+        file_name = '{}.json'.format(self.param2val['param_name'])
+        tmp_path = rung_path / '.{}.{}.tmp'.format(file_name, self.param2val['job_name'])
+        with tmp_path.open('w') as f:
+            json.dump({'value': value}, f)
+        os.replace(str(tmp_path), str(rung_path / file_name))
+
+        res = []
+        for p in rung_path.glob('*.json'):
+            try:
+                with p.open('r') as f:
+                    res.append(json.load(f)['value'])
+            except (OSError, ValueError):  # written concurrently
+                continue
+        return res
+
+    def report(self,
+               step: int,
+               value: float,
+               ) -> bool:
+        """save value of metric at step, and return True if the job should stop"""
+        value = float(value)
+        self.step2value[step] = value
+        if self.save_path.is_dir():  # saved incrementally, in case job is killed
+            with (self.save_path / '{}.csv'.format(self.metric)).open('a') as f:
+                f.write('{},{}\n'.format(step, value))
+
+        while not self.should_stop and self.num_rungs_reached < len(self.rungs) \
+                and step >= self.rungs[self.num_rungs_reached]:
+            rung = self.rungs[self.num_rungs_reached]
+            self.num_rungs_reached += 1
+            values = self.save_rung_value(rung, value)
+            if not is_promoted(value, values, self.eta, self.mode):
+                print('Stopping job at step {}: {}={} is not among the top 1/{} of {} jobs at rung {}'.format(
+                    step, self.metric, value, self.eta, len(values), rung))
+                self.should_stop = True
+        return self.should_stop
@@ -0,0 +1,192 @@
+"""
+Results of expensive functions (e.g. building a vocabulary) are saved to the project folder on the shared drive,
+ so that jobs which share the relevant parameters compute them only once.
+
+usage in the user's job module:
+
+    @cached(param_names=['corpus_name', 'vocab_size'])
+    def make_vocab(param2val):
+        ...
+
+this module is imported by jobs on Ludwig workers - it must be compatible with python3.7.
+"""
+from pathlib import Path
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import socket
+import threading
+import time
+import numpy as np
+from typing import Dict, Any, Callable, List, Optional
+
+from ludwig import config
+
+
+def hash_code(func: Callable) -> str:
+    """hash of the module that defines func - changes to any function in the module invalidate cached results"""
+    try:
+        with open(inspect.getsourcefile(func), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (TypeError, OSError):  # e.g. defined interactively
+        return hashlib.sha1(func.__qualname__.encode('utf8')).hexdigest()
+
+
+def make_key(func: Callable,
+             param2val: Dict[str, Any],
+             param_names: List[str],
+             args: tuple,
+             kwargs: Dict[str, Any],
+             ) -> str:
+    missing = [name for name in param_names if name not in param2val]
+    if missing:
+        raise KeyError('Ludwig: Cannot cache {}. param2val has no {}'.format(func.__name__, missing))
+    items = [(name, param2val[name]) for name in sorted(param_names)]
+    h = hashlib.sha1(repr((func.__qualname__, items, args, sorted(kwargs.items()))).encode('utf8'))
+    h.update(hash_code(func).encode('utf8'))
+    return '{}_{}'.format(func.__name__, h.hexdigest()[:16])
+
+
+def load_result(entry_path: Path,
+                ) -> Any:
+    if (entry_path / 'result.npy').exists():
+        return np.load(str(entry_path / 'result.npy'), allow_pickle=False)
+    with (entry_path / 'result.pkl').open('rb') as f:
+        return pickle.load(f)
+
+
+def save_result(entry_path: Path,
+                result: Any,
+                info: Dict[str, Any],
+                ) -> None:
+    """save to a temporary folder, and rename it once complete - readers never see a partial result"""
+    tmp_path = entry_path.parent / '.{}.{}.{}.tmp'.format(entry_path.name, socket.gethostname(), os.getpid())
+    tmp_path.mkdir()
+    if isinstance(result, np.ndarray) and result.dtype != object:
+        np.save(str(tmp_path / 'result.npy'), result, allow_pickle=False)
+    else:
+        with (tmp_path / 'result.pkl').open('wb') as f:
+            pickle.dump(result, f)
+    info['num_bytes'] = sum(p.stat().st_size for p in tmp_path.iterdir())
+    with (tmp_path / 'meta.json').open('w') as f:
+        json.dump(info, f)
+    os.rename(str(tmp_path), str(entry_path))
+
+
+def evict(cache_path: Path,
+          max_bytes: int,
+          ) -> None:
+    """remove least-recently-used results until the total size is below max_bytes"""
+    entries = []  # (time of last use, path, size)
+    for meta_path in cache_path.glob('*/meta.json'):
+        try:
+            with meta_path.open('r') as f:
+                entries.append((meta_path.stat().st_mtime, meta_path.parent, json.load(f)['num_bytes']))
+        except (OSError, ValueError, KeyError):  # evicted by another job
+            continue
+    total = sum(entry[2] for entry in entries)
+    for last_used, entry_path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(str(entry_path), ignore_errors=True)
+        total -= size
+
+
+def acquire_lock(lock_path: Path,
+                 ) -> bool:
+    """
+    create lock file exclusively - this is atomic on the shared drive, unlike flock.
+    a lock that was not renewed for config.Cache.lock_timeout seconds is considered abandoned, e.g. by a killed job
+    """
+    try:
+        fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            is_abandoned = time.time() - lock_path.stat().st_mtime > config.Cache.lock_timeout
+        except FileNotFoundError:  # released in the meantime
+            return False
+        if is_abandoned:
+            try:
+                lock_path.unlink()
+            except FileNotFoundError:
+                pass
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write('{} {}'.format(socket.gethostname(), os.getpid()))
+    return True
+
+
+def renew_lock(lock_path: Path,
+               is_done: threading.Event,
+               ) -> None:
+    while not is_done.wait(config.Cache.lock_timeout / 4):
+        try:
+            os.utime(str(lock_path))
+        except FileNotFoundError:
+            return
+
+
+def cached(param_names: List[str],
+           max_bytes: Optional[int] = None,  # defaults to config.Cache.max_bytes
+           ) -> Callable:
+    """
+    decorate a function that takes param2val as first argument, and depends only on the parameters in param_names.
+    results are saved in the project folder, and keyed by these parameters, other arguments,
+     and the source code of the module that defines the function.
+
+    only one job computes a result - other jobs that need the same result wait for it.
+    """
+    def decorator(func: Callable) -> Callable:
+
+        @functools.wraps(func)
+        def wrapper(param2val: Dict[str, Any], *args, **kwargs):
+            cache_path = Path(param2val['project_path']) / config.Constants.cache
+            cache_path.mkdir(parents=True, exist_ok=True)
+            key = make_key(func, param2val, param_names, args, kwargs)
+            entry_path = cache_path / key
+            lock_path = cache_path / '.{}.lock'.format(key)
+
+            while True:
+                if (entry_path / 'meta.json').exists():
+                    try:
+                        res = load_result(entry_path)
+                    except OSError:  # evicted while loading
+                        time.sleep(config.Cache.poll_interval)
+                        continue
+                    except (EOFError, ValueError, pickle.UnpicklingError) as e:  # results are renamed once complete
+                        print('Removing corrupt cached result of {} from {}: {}'.format(func.__name__, entry_path, e))
+                        shutil.rmtree(str(entry_path), ignore_errors=True)  # result is computed again
+                        continue
+                    os.utime(str(entry_path / 'meta.json'))  # time of last use
+                    print('Loaded cached result of {} from {}'.format(func.__name__, entry_path))
+                    return res
+                if acquire_lock(lock_path):
+                    break
+                time.sleep(config.Cache.poll_interval)  # another job is computing the result
+
+            is_done = threading.Event()
+            renewer = threading.Thread(target=renew_lock, args=(lock_path, is_done))
+            renewer.daemon = True
+            renewer.start()
+            try:
+                if (entry_path / 'meta.json').exists():  # saved just before lock was acquired
+                    return load_result(entry_path)
+                res = func(param2val, *args, **kwargs)
+                save_result(entry_path, res, {'function': func.__qualname__,
+                                              'params': {name: repr(param2val[name]) for name in param_names}})
+                evict(cache_path, max_bytes if max_bytes is not None else config.Cache.max_bytes)
+                return res
+            finally:
+                is_done.set()
+                try:
+                    lock_path.unlink()
+                except FileNotFoundError:
+                    pass
+
+        return wrapper
+
+    return decorator
@@ -7,6 +7,16 @@ class WorkerDirs:
     research_data = Path('/') / 'media' / 'research_data'
     stdout = research_data / 'stdout'
     watched = Path('/') / 'var' / 'sftp' / 'ludwig_jobs'
+    spool = Path('/') / 'var' / 'sftp' / 'ludwig_spool'  # results on local disk, waiting to be shipped
+    data_cache = Path('/') / 'var' / 'sftp' / 'ludwig_data_cache'  # local copies of data on shared drive
+    artifacts = Path('/') / 'var' / 'sftp' / 'ludwig_artifacts'  # arrays shared by jobs via memory maps
+    state = Path('/') / 'var' / 'sftp' / 'ludwig_state'  # pending jobs, restored when the watcher restarts
+    job_status = state / 'jobs'  # jobs that each process is running, saved by run.py
+    heartbeats = research_data / 'heartbeats'  # state of each worker, read by ludwig-status
+
+
+class LocalDirs:
+    cache = Path.home() / '.cache' / 'ludwig'  # e.g. local copies of param2val index of each project
 
 
 class Remote:
@@ -18,11 +28,54 @@ class Remote:
     group2workers = {'half1': ['hoff', 'norman', 'hebb', 'hinton'],
                      'half2': ['pitts', 'hawkins', 'bengio', 'lecun']}
     disk_max_percent = 90
+    # relative speed used to predict job durations - refined by durations of previous jobs
+    worker2speed = {'hoff': 1.0, 'norman': 1.0, 'hebb': 1.0, 'hinton': 1.0, 'pitts': 1.0,  # GTX 1080 + i7-7700
+                    'hawkins': 1.3, 'bengio': 1.3, 'lecun': 1.3}  # GTX 1080 Ti + i7-8700K
+    manifest_name = '.ludwig_manifest.json'  # lists source code files uploaded to worker
+
+
+class Watcher:
+    max_num_slots = 4  # maximal number of jobs running concurrently on a worker
+    min_available_memory = 4 * 1024 ** 3  # bytes of RAM that must be available to start another job
+    min_gpu_free_memory = 2 * 1024  # MiB of GPU memory that must be free to start another job
+    max_cpu_percent = 80  # another job is not started if CPU utilization is higher
+    ramp_up = 30  # seconds to wait after starting a job before measuring resources again
+    interval = 1  # seconds between checks for free slots
+    debounce = 0.5  # seconds without events after run_*.py was closed, before the upload is considered complete
+    settle_time = 2  # seconds without events and without change in size, if closed files are not reported
+    ship_interval = 5  # seconds between checks for spooled results
+    max_jobs_per_process = 50  # warm processes are replaced after this many jobs, e.g. to release leaked memory
+    grace_period = 120  # seconds a preempted job is given to save a checkpoint before it is killed
+    batch_size = 16  # jobs run by a single call to main_batch(), if the job module defines it
+    # each job may start as many threads as CPUs it is assigned - torch also uses OMP_NUM_THREADS
+    thread_env_names = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+    priorities = ['high', 'normal', 'low']  # jobs of a higher priority class are started first
+    num_fast_lane_slots = 1  # additional slots for jobs submitted with --minimal or --first_only
+    user2weight = {}  # users with a higher weight may run more jobs concurrently (default weight is 1)
+    heartbeat_interval = 5  # seconds between updates of the state of a worker shown by ludwig-status
+    stale_after = 90  # seconds without heartbeat after which a worker is considered stale - includes clock skew
+
+
+class DataCache:
+    max_bytes = 128 * 1024 ** 3  # local copies are evicted least-recently-used first, if they exceed this size
+
+
+class Artifacts:
+    max_bytes = 64 * 1024 ** 3  # arrays of each project on a worker, evicted least-recently-used first
+
+
+class Cache:
+    max_bytes = 64 * 1024 ** 3  # results of cached functions in each project, evicted least-recently-used first
+    lock_timeout = 10 * 60  # seconds after which a lock that is not renewed is considered abandoned
+    poll_interval = 5  # seconds between checks for a result that is computed by another job
 
 
 class Time:
     delete_delta = 24  # hours
     format = '%Y-%m-%d-%H:%M:%S'
+    mtime_resolution = 2  # seconds, modification times on the shared drive may be coarse
+    clock_skew = 60  # seconds, maximal expected difference between clocks of file server and client
+    lease_duration = 10 * 60  # seconds after which a job claimed from the shared queue is requeued
 
 
 class Constants:
@@ -30,7 +83,16 @@ class Constants:
     not_ludwig = '_not-ludwig'
     saves = 'saves'
     runs = 'runs'
-    added_param_names = ['job_name', 'param_name', 'project_path', 'save_path']
+    queue = 'queue'  # shared queue from which idle workers claim jobs
+    job_info = 'job_info.yaml'  # saved in each job folder, e.g. duration of job
+    results = 'results.npz'  # saved in each job folder if job sets results_formats = ('npz',)
+    partial = '.ludwig_partial'  # in runs, job folders that are being shipped from a worker's spool
+    asha = 'asha'  # in project folder, values of metrics reported by jobs at each rung
+    cache = 'cache'  # in project folder, results of functions decorated with ludwig.cache.cached
+    artifacts = 'artifacts'  # in project folder, memory-mapped arrays of each host when running locally
+    options = 'options.yaml'  # saved in project folder at submission, e.g. whether to use warm processes
+    resumable = '.resumable'  # in each param folder, checkpoints of preempted jobs
+    added_param_names = ['job_name', 'param_name', 'project_path', 'save_path']  # must match run.added_param_names
 
 
 hostname = socket.gethostname()
\ No newline at end of file
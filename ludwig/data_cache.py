@@ -0,0 +1,197 @@
+"""
+Jobs that read the same data from the shared drive can use a copy on the local disk of the worker instead.
+Copies are validated against the size and modification time of the original, and evicted least-recently-used first.
+
+this module is imported by jobs on Ludwig workers - it must be compatible with python3.7.
+"""
+from pathlib import Path
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Any, Optional, Union
+
+from ludwig import config
+
+# lock files of entries used by this process - a shared lock prevents eviction by other processes
+_key2use_file = {}
+
+
+def _make_signature(path: Path,
+                    ) -> Dict[str, Any]:
+    """size and modification time of a file, or of all files in a directory"""
+    if path.is_file():
+        stat = path.stat()
+        return {'num_bytes': stat.st_size, 'files': [['', stat.st_size, stat.st_mtime_ns]]}
+    files = []
+    for p in sorted(path.rglob('*')):
+        if p.is_file():
+            stat = p.stat()
+            files.append([p.relative_to(path).as_posix(), stat.st_size, stat.st_mtime_ns])
+    return {'num_bytes': sum(f[1] for f in files), 'files': files}
+
+
+def _hash(path: Path,
+          chunk_size: int = 1024 * 1024,
+          ) -> str:
+    """sha1 of a file, or of all files in a directory including their relative paths"""
+    h = hashlib.sha1()
+    file_paths = [path] if path.is_file() else sorted(p for p in path.rglob('*') if p.is_file())
+    for p in file_paths:
+        h.update(p.relative_to(path).as_posix().encode('utf8') if p != path else b'')
+        with p.open('rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_meta(meta_path: Path,
+               ) -> Optional[Dict[str, Any]]:
+    try:
+        with meta_path.open('r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def open_locked(path: Path,
+                operation: int,
+                ):
+    """
+    open and lock path - lock files of evicted entries are removed,
+     so the lock is only valid if path was not removed while waiting for it
+    """
+    while True:
+        f = path.open('a')
+        fcntl.flock(f, operation)
+        try:
+            if os.stat(str(path)).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def evict(cache_path: Path,
+          num_bytes: int,
+          max_bytes: int,
+          ) -> bool:
+    """
+    remove least-recently-used entries, including their lock files, until num_bytes fit into max_bytes.
+    entries used by running jobs are skipped.
+    each entry is a folder with a meta.json that contains its size in bytes - also used by ludwig.artifacts.
+    return False if not enough space can be freed.
+    """
+    if num_bytes > max_bytes:
+        return False
+
+    with (cache_path / '.evict.lock').open('a') as evict_lock_file:
+        fcntl.flock(evict_lock_file, fcntl.LOCK_EX)
+
+        entries = []  # (time of last use, key, size)
+        for meta_path in cache_path.glob('*/meta.json'):
+            if meta_path.parent.name.startswith('.'):  # copied or saved right now
+                continue
+            meta = _load_meta(meta_path)
+            if meta is not None:
+                entries.append((meta_path.stat().st_mtime, meta_path.parent.name, meta['num_bytes']))
+        total = sum(entry[2] for entry in entries)
+
+        for last_used, key, size in sorted(entries):
+            if total + num_bytes <= max_bytes:
+                break
+            lock_path = cache_path / '{}.lock'.format(key)
+            use_path = cache_path / '{}.use'.format(key)
+            with lock_path.open('a') as lock_file, use_path.open('a') as use_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(use_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # in use, or validated by another process
+                    continue
+                shutil.rmtree(str(cache_path / key))
+                lock_path.unlink()  # while locked - processes waiting for the lock open a new lock file
+                use_path.unlink()
+            total -= size
+        return total + num_bytes <= max_bytes
+
+
+def mark_used(cache_path: Path,
+              key: str,
+              ) -> None:
+    """keep entry from being evicted while this process runs"""
+    if key not in _key2use_file:
+        _key2use_file[key] = open_locked(cache_path / '{}.use'.format(key), fcntl.LOCK_SH)
+
+
+def _copy(src: Path,
+          dst: Path,
+          ) -> None:
+    if src.is_file():
+        dst.mkdir()
+        shutil.copy2(str(src), str(dst / src.name))
+    else:
+        shutil.copytree(str(src), str(dst / src.name))
+
+
+def _update_entry(path: Path,
+                  entry_path: Path,
+                  max_bytes: int,
+                  verify: bool,
+                  ) -> bool:
+    """make a copy of path in entry_path, unless a valid copy exists. return False if path cannot be cached"""
+    cache_path = entry_path.parent
+    meta_path = entry_path / 'meta.json'
+    signature = _make_signature(path)
+    meta = _load_meta(meta_path)
+    is_valid = meta is not None and meta['signature'] == signature and (entry_path / path.name).exists()
+    if is_valid and verify:
+        is_valid = _hash(entry_path / path.name) == meta['sha1']
+
+    if not is_valid:
+        for p in [entry_path] + list(cache_path.glob('.{}.*.tmp'.format(entry_path.name))):  # incl. interrupted
+            if p.exists():
+                shutil.rmtree(str(p))
+        if not evict(cache_path, signature['num_bytes'], max_bytes):
+            print('WARNING: {} does not fit into local data cache. Using shared drive'.format(path))
+            return False
+        tmp_path = cache_path / '.{}.{}.tmp'.format(entry_path.name, os.getpid())
+        _copy(path, tmp_path)
+        if _make_signature(path) != signature:
+            shutil.rmtree(str(tmp_path))
+            print('WARNING: {} changed while copying to local data cache. Using shared drive'.format(path))
+            return False
+        with (tmp_path / 'meta.json').open('w') as f:
+            json.dump({'path': str(path), 'signature': signature, 'sha1': _hash(tmp_path / path.name),
+                       'num_bytes': signature['num_bytes']}, f)
+        os.rename(str(tmp_path), str(entry_path))
+
+    os.utime(str(meta_path))  # time of last use
+    return True
+
+
+def cached_path(path: Union[str, Path],
+                max_bytes: int = config.DataCache.max_bytes,
+                verify: bool = False,  # also compare hash of local copy with hash computed when copying
+                ) -> Path:
+    """
+    return path to a local copy of a file or directory on the shared drive, e.g. a dataset.
+    the copy is made if it does not exist, or if the original changed.
+
+    if there is no cache on this machine (e.g. when running jobs locally) or the data does not fit,
+     the original path is returned.
+    """
+    path = Path(path)
+    cache_path = config.WorkerDirs.data_cache
+    if not cache_path.is_dir():
+        return path
+    key = '{}_{}'.format(hashlib.sha1(str(path.resolve()).encode('utf8')).hexdigest()[:16], path.name)
+
+    # only one process on this machine validates or copies an entry at a time
+    with open_locked(cache_path / '{}.lock'.format(key), fcntl.LOCK_EX):
+        mark_used(cache_path, key)
+        if not _update_entry(path, cache_path / key, max_bytes, verify):
+            _key2use_file.pop(key).close()
+            return path
+
+    return cache_path / key / path.name
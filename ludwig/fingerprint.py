@@ -0,0 +1,77 @@
+"""
+A code fingerprint is a hash of the source code (and extra paths) used to run a job.
+Jobs with the same configuration but a different fingerprint are not counted as completed repetitions.
+
+A module can declare which configurations use it, e.g.:
+    ludwig_depends_on = {'model': ['lstm', 'gru']}
+Changes to such a module only change the fingerprint of configurations with matching parameter values.
+
+The params module is excluded: parameter values are already part of each configuration,
+ and param2requests is edited before nearly every submission.
+"""
+from pathlib import Path
+import ast
+import hashlib
+from typing import Dict, Any, Optional, List
+
+from ludwig import print_ludwig
+from ludwig.manifest import make_manifest, load_ignore_patterns, ignore_file_name
+
+depends_on_name = 'ludwig_depends_on'
+
+
+def load_depends_on(path: Path,
+                    ) -> Optional[Dict[str, list]]:
+    """return value of ludwig_depends_on defined at top level of a module, without importing the module"""
+    try:
+        tree = ast.parse(path.read_text(encoding='utf8'))
+    except (SyntaxError, UnicodeDecodeError):
+        return None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == depends_on_name
+                                                for t in node.targets):
+            try:
+                res = ast.literal_eval(node.value)
+            except ValueError:
+                raise ValueError(f'{depends_on_name} in {path} must be a literal dict')
+            if not isinstance(res, dict) or not all(isinstance(v, (list, tuple)) for v in res.values()):
+                raise ValueError(f'{depends_on_name} in {path} must map parameter names to lists of values')
+            return res
+    return None
+
+
+class CodeFingerprint:
+    """hash each file once per submission, and combine hashes of files used by each configuration"""
+
+    def __init__(self,
+                 paths: List[Path],  # source code folder and extra paths
+                 exclude: Optional[List[Path]] = None,  # e.g. the params module
+                 ):
+        excluded = {p.resolve() for p in exclude or []}
+        self.files = []  # (path, hash of content, depends_on)
+        for root in paths:
+            ignore_patterns = load_ignore_patterns([Path(ignore_file_name), root / ignore_file_name])
+            for rel_path, h in sorted(make_manifest(root, ignore_patterns).items()):
+                if (root / rel_path).resolve() in excluded:
+                    continue
+                depends_on = load_depends_on(root / rel_path) if rel_path.endswith('.py') else None
+                self.files.append((f'{root.name}/{rel_path}', h, depends_on))
+        num_conditional = sum(1 for f in self.files if f[2] is not None)
+        print_ludwig(f'Computed code fingerprint of {len(self.files)} files ({num_conditional} with {depends_on_name})')
+
+    @staticmethod
+    def is_used(depends_on: Optional[Dict[str, list]],
+                param2val: Dict[str, Any],
+                ) -> bool:
+        if depends_on is None:
+            return True
+        return all(param2val.get(k) in v for k, v in depends_on.items())
+
+    def __call__(self,
+                 param2val: Dict[str, Any],
+                 ) -> str:
+        h = hashlib.sha1()
+        for rel_path, file_hash, depends_on in self.files:
+            if self.is_used(depends_on, param2val):
+                h.update(f'{rel_path}:{file_hash}\n'.encode('utf8'))
+        return h.hexdigest()[:16]
@@ -0,0 +1,88 @@
+"""
+Each watcher saves the state of its worker to a small json file (a heartbeat) on the shared drive every few seconds.
+ludwig-status reads the heartbeats of all workers, instead of reading the output of the watchers.
+"""
+from pathlib import Path
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from ludwig import config
+
+
+def load_heartbeat(path: Path,
+                   ) -> Optional[Dict[str, Any]]:
+    try:
+        with path.open('r') as f:
+            return json.load(f)
+    except (OSError, ValueError):  # watcher has not saved a heartbeat
+        return None
+
+
+def load_heartbeats(heartbeats_path: Path,
+                    workers: List[str],
+                    ) -> List[Optional[Dict[str, Any]]]:
+    """read heartbeats of all workers concurrently - each read may take a while on the shared drive"""
+    with ThreadPoolExecutor(max_workers=max(1, len(workers))) as executor:
+        return list(executor.map(lambda w: load_heartbeat(heartbeats_path / f'{w}.json'), workers))
+
+
+def find_running_jobs(heartbeats: List[Optional[Dict[str, Any]]],
+                      workers: List[str],
+                      project_name: str,
+                      now: Optional[float] = None,
+                      ) -> Dict[str, List[str]]:
+    """return the workers on which each param_name of a project is running - one worker per running job"""
+    now = now or time.time()
+    res = {}
+    for worker, heartbeat in zip(workers, heartbeats):
+        if heartbeat is None or now - heartbeat['time'] > config.Watcher.stale_after:
+            continue
+        for job in heartbeat['running']:
+            if job['project'] != project_name or job['is_preempted']:
+                continue
+            for param_name, _ in job['jobs']:
+                res.setdefault(param_name, []).append(worker)
+    return res
+
+
+def format_duration(seconds: float,
+                    ) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f'{minutes}min'
+    return f'{minutes // 60}h{minutes % 60:02}min'
+
+
+def format_heartbeat(worker: str,
+                     heartbeat: Optional[Dict[str, Any]],
+                     now: Optional[float] = None,
+                     ) -> str:
+    """one line with the state of a worker, followed by one line per running job and user"""
+    if heartbeat is None:
+        return f'{worker:<10} NO HEARTBEAT'
+    now = now or time.time()
+    age = now - heartbeat['time']
+    state = 'OK' if age < config.Watcher.stale_after else f'STALE (last heartbeat {format_duration(age)} ago)'
+
+    gpu = heartbeat.get('gpu_free_memory')
+    lines = [f'{worker:<10} {state:<8} '
+             f'cpu {heartbeat.get("cpu_percent", 0):>3.0f}% '
+             f'ram {heartbeat.get("available_memory", 0) / 1024 ** 3:>5.1f}/'
+             f'{heartbeat.get("total_memory", 0) / 1024 ** 3:.1f}GiB free '
+             f'gpu {"-" if gpu is None else f"{gpu}MiB free"} '
+             f'{len(heartbeat["running"])} running {heartbeat["num_pending"]} pending']
+    for job in heartbeat['running']:
+        names = ', '.join('/'.join(job_names) for job_names in job['jobs']) or 'starting'
+        elapsed = '-' if job['elapsed'] is None else format_duration(job['elapsed'])
+        preempted = ' (preempted)' if job['is_preempted'] else ''
+        lines.append(f'{" ":<10} {job["user"]:<12} {job["project"]:<16} {elapsed:>9} {names}{preempted}')
+    for user, s in sorted(heartbeat['user2status'].items()):
+        if s['num_pending']:
+            lines.append(f'{" ":<10} {user:<12} {s["num_pending"]} pending, '
+                         f'waiting for {format_duration(s["max_wait"])}')
+    if heartbeat.get('last_error'):
+        error = heartbeat['last_error']
+        lines.append(f'{" ":<10} last error {format_duration(now - error["time"])} ago: {error["message"]}')
+    return '\n'.join(lines)
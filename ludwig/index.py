@@ -0,0 +1,251 @@
+"""
+The ParamIndex maps hashes of parameter configurations to param_names in a runs folder.
+It is persisted next to the runs folder, so that param2val.yaml files need not be loaded on every submission.
+A copy is kept in a local cache, so that the shared drive is not read if the runs folder did not change.
+"""
+from pathlib import Path
+import hashlib
+import json
+import time
+import yaml
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from ludwig import config
+from ludwig import print_ludwig
+from ludwig.run import param2val_to_hash, param2val_index_name, write_json_atomically
+
+
+class ParamIndex:
+    def __init__(self,
+                 runs_path: Path,
+                 num_threads: int = 16,
+                 use_local_cache: bool = True,
+                 ):
+        self.runs_path = runs_path
+        self.path = runs_path.parent / param2val_index_name
+        self.num_threads = num_threads
+        self.local_path = None
+        if use_local_cache:
+            runs_id = hashlib.sha1(str(runs_path.resolve()).encode('utf8')).hexdigest()[:16]
+            self.local_path = config.LocalDirs.cache / f'param2val_index_{runs_id}.json'
+        self.runs_mtime = None
+        self.is_settled = False
+        self.param_name2hash = {}
+        self.hash2param_names = defaultdict(list)
+        self.param_name2num_jobs = {}  # param_name -> [mtime of param folder, number of jobs]
+        self.param_name2job_infos = {}  # param_name -> [mtime of param folder, job_name -> job info]
+        self.sync()
+
+    @property
+    def param_names(self) -> List[str]:
+        return sorted(self.param_name2hash)
+
+    @staticmethod
+    def _load_json(path: Optional[Path],
+                   ) -> Optional[Dict[str, Any]]:
+        if path is None:
+            return None
+        try:
+            with path.open('r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _load_hash(self,
+                   param_name: str,
+                   ) -> Optional[str]:
+        """return None if param2val.yaml has not been written yet, so that it is loaded at next sync"""
+        try:
+            with (self.runs_path / param_name / 'param2val.yaml').open('r') as f:
+                param2val = yaml.load(f, Loader=yaml.FullLoader)
+        except FileNotFoundError:
+            return None
+        return param2val_to_hash(param2val)
+
+    def _is_stale(self,
+                  index: Dict[str, Any],
+                  runs_mtime: float,
+                  ) -> bool:
+        """
+        index is stale if runs_path changed since last scan,
+         or if runs_path changed so shortly before the last scan that a change may not be reflected in its mtime
+        """
+        if index['runs_mtime'] != runs_mtime:
+            return True
+        try:
+            index_mtime = self.path.stat().st_mtime  # same clock as runs_mtime: both are set by the file server
+        except FileNotFoundError:
+            return True
+        return index_mtime - runs_mtime < config.Time.mtime_resolution
+
+    def sync(self) -> None:
+        """
+        update index with param_names added to or removed from runs_path since last sync.
+        runs_path is only listed if its mtime changed, and param2val.yaml is only loaded for new param_names.
+        """
+        if not self.runs_path.exists():
+            return
+
+        runs_mtime = self.runs_path.stat().st_mtime  # before listing, so that concurrent changes trigger re-scan
+
+        # the local copy is used without reading the index on the shared drive, if runs_path did not change
+        local_index = self._load_json(self.local_path) or {}
+        if local_index.get('runs_mtime') == runs_mtime and local_index.get('is_settled'):
+            index = local_index
+            is_stale = False
+        else:
+            index = self._load_json(self.path) or {'runs_mtime': None, 'param_name2hash': {}}
+            is_stale = self._is_stale(index, runs_mtime)
+        param_name2hash = index['param_name2hash']
+        is_changed = False
+
+        if is_stale:
+            listed = {p.name for p in self.runs_path.glob('param_*')}
+            for param_name in set(param_name2hash).difference(listed):
+                del param_name2hash[param_name]
+            for param_name in listed.difference(param_name2hash):
+                param_name2hash[param_name] = None
+            index['runs_mtime'] = runs_mtime
+            is_changed = True
+
+        # load param2val.yaml files concurrently
+        pending = [param_name for param_name, h in param_name2hash.items() if h is None]
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                param_name2hash.update(zip(pending, executor.map(self._load_hash, pending)))
+            is_changed = True
+
+        if is_changed:
+            try:
+                write_json_atomically({'runs_mtime': index['runs_mtime'], 'param_name2hash': param_name2hash},
+                                      self.path)
+            except OSError as e:  # index is only a cache
+                print_ludwig(f'WARNING: Could not save {self.path}: {e}')
+
+        self.runs_mtime = runs_mtime
+        self.is_settled = not self._is_stale(index, runs_mtime) if is_changed or is_stale else True
+        self.param_name2hash = param_name2hash
+        self.hash2param_names = defaultdict(list)
+        for param_name in sorted(param_name2hash):
+            h = param_name2hash[param_name]
+            if h is not None:
+                self.hash2param_names[h].append(param_name)
+        self.param_name2num_jobs = {k: v for k, v in local_index.get('param_name2num_jobs', {}).items()
+                                    if k in param_name2hash}
+        self.param_name2job_infos = {k: v for k, v in local_index.get('param_name2job_infos', {}).items()
+                                     if k in param_name2hash}
+        self._save_local()
+
+    def _save_local(self) -> None:
+        if self.local_path is None:
+            return
+        local_index = {'runs_mtime': self.runs_mtime,
+                       'is_settled': self.is_settled,
+                       'param_name2hash': self.param_name2hash,
+                       'param_name2num_jobs': self.param_name2num_jobs,
+                       'param_name2job_infos': self.param_name2job_infos}
+        try:
+            self.local_path.parent.mkdir(parents=True, exist_ok=True)
+            write_json_atomically(local_index, self.local_path)
+        except OSError as e:
+            print_ludwig(f'WARNING: Could not save {self.local_path}: {e}')
+
+    def find(self,
+             param2val: Dict[str, Any],
+             ) -> Optional[str]:
+        """return param_name of an existing configuration that is the same as param2val"""
+        param_names = self.hash2param_names.get(param2val_to_hash(param2val))
+        if param_names:
+            return param_names[0]
+        return None
+
+    def count_jobs(self,
+                   param_names: List[str],
+                   ) -> Dict[str, int]:
+        """
+        return number of job folders for each param_name, except for folders that were deleted in the meantime.
+        a folder is only listed if its mtime changed since it was last counted
+        """
+
+        def count(param_name: str) -> Optional[List[Any]]:
+            param_path = self.runs_path / param_name
+            try:
+                mtime = param_path.stat().st_mtime
+            except FileNotFoundError:  # e.g. deleted by another user
+                return None
+            cached = self.param_name2num_jobs.get(param_name)
+            if cached is not None and cached[0] == mtime and cached[2]:
+                return cached
+            # a count is only re-used if the folder had not changed shortly before counting
+            is_settled = time.time() - mtime > config.Time.clock_skew
+            return [mtime, len(list(param_path.glob('*num*'))), is_settled]
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            counts = list(executor.map(count, param_names))
+        is_changed = False
+        for param_name, c in zip(param_names, counts):
+            if c is None:
+                self.param_name2num_jobs.pop(param_name, None)
+                print_ludwig(f'WARNING: {self.runs_path / param_name} was deleted')
+            elif c is not self.param_name2num_jobs.get(param_name):
+                self.param_name2num_jobs[param_name] = c
+                is_changed = True
+        if is_changed:  # the local index is not written per job, if nothing changed
+            self._save_local()
+        return {param_name: c[1] for param_name, c in zip(param_names, counts) if c is not None}
+
+    def load_job_infos(self,
+                       param_names: List[str],
+                       ) -> Dict[str, Dict[str, Optional[Dict[str, Any]]]]:
+        """
+        return hostname, duration and code fingerprint of each job of each param_name,
+         or None for jobs without job_info.yaml, except for folders that were deleted in the meantime.
+        a folder is only listed if its mtime changed since it was last listed,
+         and job_info.yaml is only loaded once per job
+        """
+
+        def list_jobs(param_name: str) -> Optional[List[Any]]:
+            param_path = self.runs_path / param_name
+            try:
+                mtime = param_path.stat().st_mtime
+            except FileNotFoundError:  # e.g. deleted by another user
+                return None
+            cached = self.param_name2job_infos.get(param_name)
+            if cached is not None and cached[0] == mtime and cached[2]:
+                return cached
+            job_name2info = cached[1] if cached is not None else {}
+            is_settled = time.time() - mtime > config.Time.clock_skew
+            return [mtime, {p.name: job_name2info.get(p.name) for p in param_path.glob('*num*')}, is_settled]
+
+        def load(job_path: Path) -> Optional[Dict[str, Any]]:
+            try:
+                with (job_path / config.Constants.job_info).open('r') as f:
+                    job_info = yaml.load(f, Loader=yaml.FullLoader)
+            except (FileNotFoundError, NotADirectoryError, yaml.YAMLError):
+                return None
+            return {k: job_info.get(k) for k in ['hostname', 'duration', 'code_fingerprint']}
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            param_name2entry = dict(zip(param_names, executor.map(list_jobs, param_names)))
+
+            # job_info.yaml is not changed after it is written, so it is only loaded for jobs without job info
+            pending = [(param_name, job_name)
+                       for param_name, entry in param_name2entry.items() if entry is not None
+                       for job_name, job_info in entry[1].items() if job_info is None]
+            job_infos = list(executor.map(load, [self.runs_path / p / j for p, j in pending]))
+        for (param_name, job_name), job_info in zip(pending, job_infos):
+            param_name2entry[param_name][1][job_name] = job_info
+
+        is_changed = any(job_info is not None for job_info in job_infos)
+        for param_name, entry in param_name2entry.items():
+            if entry is None:
+                self.param_name2job_infos.pop(param_name, None)
+                print_ludwig(f'WARNING: {self.runs_path / param_name} was deleted')
+            elif entry is not self.param_name2job_infos.get(param_name):
+                self.param_name2job_infos[param_name] = entry
+                is_changed = True
+        if is_changed:
+            self._save_local()
+        return {param_name: entry[1] for param_name, entry in param_name2entry.items() if entry is not None}
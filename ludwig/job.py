@@ -5,6 +5,7 @@ from typing import List, Dict, Optional, Any, Tuple
 
 from ludwig import config
 from ludwig import print_ludwig
+from ludwig.index import ParamIndex
 
 
 class Job:
@@ -14,8 +15,10 @@ class Job:
 
     def __init__(self,
                  param2val: Dict[str, Any],
+                 code_fingerprint: Optional[str] = None,  # kept out of param2val, which is passed to the user's job
                  ):
         self.param2val = param2val
+        self.code_fingerprint = code_fingerprint
         self.is_new = None
 
     @staticmethod
@@ -27,39 +30,65 @@ class Job:
     def update_param_name(self,
                           runs_path: Path,
                           num_new: int,  # number of new param_names assigned
+                          param_index: Optional[ParamIndex] = None,  # pass index to avoid re-syncing per job
                           ) -> None:
         """
         check if param2val exists in runs.
         only if it doesn't exist, create a new one (otherwise problems with queued runs might occur)
         """
-        param_nums = [int(p.name.split('_')[-1])
-                      for p in runs_path.glob('param*')
-                      if config.Constants.not_ludwig not in p.name] or [0]
-
-        for param_p in runs_path.glob('param_*'):
-            with (param_p / 'param2val.yaml').open('r') as f:
-                loaded_param2val = yaml.load(f, Loader=yaml.FullLoader)
-            if self.is_same(self.param2val, loaded_param2val):
-                print_ludwig('Configuration matches existing configuration')
-                self.is_new = False
-                param_name = param_p.name
-                break
+        if param_index is None:
+            param_index = ParamIndex(runs_path)
+
+        param_nums = [int(param_name.split('_')[-1])
+                      for param_name in param_index.param_names
+                      if config.Constants.not_ludwig not in param_name] or [0]
+
+        param_name = param_index.find(self.param2val)
+        if param_name is not None:
+            print_ludwig('Configuration matches existing configuration')
+            self.is_new = False
         else:
             new_param_num = max(param_nums) + 1 + num_new
-            param_nums.append(new_param_num)
             param_name = 'param_{:0>3}'.format(new_param_num)
             self.is_new = True
 
         self.param2val['param_name'] = param_name
         print_ludwig(f'Assigned job param_name={param_name}')
 
+    @staticmethod
+    def load_code_fingerprint(job_path: Path) -> Optional[str]:
+        try:
+            with (job_path / config.Constants.job_info).open('r') as f:
+                job_info = yaml.load(f, Loader=yaml.FullLoader)
+        except (FileNotFoundError, yaml.YAMLError):
+            return None
+        return job_info.get('code_fingerprint')
+
     def calc_num_needed(self,
                         runs_path: Path,
                         reps: int,
                         disable: bool = False,  # for unit-testing or debugging
+                        param_index: Optional[ParamIndex] = None,  # pass index to avoid re-syncing per job
                         ):
+        """
+        return number of repetitions that still need to be executed.
+        if the job has a code fingerprint, only jobs executed with the same code are counted.
+        jobs saved before code fingerprints were introduced are counted regardless.
+        job counts and fingerprints are cached by the index, keyed by mtime of the param folder.
+        """
+        if param_index is None:
+            param_index = ParamIndex(runs_path)
+
         param_name = self.param2val['param_name']
-        num_times_logged = len(list((runs_path / param_name).glob('*num*')))
+        if not (runs_path / param_name).exists():  # new configuration
+            num_times_logged = 0
+        elif self.code_fingerprint is not None:
+            job_name2info = param_index.load_job_infos([param_name]).get(param_name, {})
+            fingerprints = [None if job_info is None else job_info['code_fingerprint']
+                            for job_info in job_name2info.values()]
+            num_times_logged = len([f for f in fingerprints if f in {None, self.code_fingerprint}])
+        else:
+            num_times_logged = param_index.count_jobs([param_name]).get(param_name, 0)
         num_times_logged = num_times_logged if not disable else 0
         res = reps - num_times_logged
         res = max(0, res)
@@ -0,0 +1,68 @@
+"""
+A manifest maps paths of files (relative to a directory) to hashes of their content.
+Comparing manifests allows uploading only files that changed since the last upload.
+"""
+from pathlib import Path
+from fnmatch import fnmatch
+import hashlib
+import os
+from typing import Dict, List, Iterable
+
+ignore_file_name = '.ludwigignore'
+default_ignore_patterns = ['__pycache__', '*.pyc', '.DS_Store', '.ipynb_checkpoints', ignore_file_name]
+
+
+def load_ignore_patterns(paths: Iterable[Path],
+                         ) -> List[str]:
+    """
+    return default patterns, and glob patterns listed in any of the ignore files (one per line, # for comments).
+    """
+    res = list(default_ignore_patterns)
+    for p in paths:
+        if not p.exists():
+            continue
+        with p.open('r') as f:
+            for line in f.readlines():
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    res.append(line.rstrip('/'))
+    return res
+
+
+def is_ignored(rel_path: str,
+               ignore_patterns: List[str],
+               ) -> bool:
+    """a path is ignored if the full relative path or any of its parts matches a pattern"""
+    parts = rel_path.split('/')
+    for pattern in ignore_patterns:
+        if fnmatch(rel_path, pattern) or any(fnmatch(part, pattern) for part in parts):
+            return True
+    return False
+
+
+def hash_file(path: Path,
+              chunk_size: int = 1024 * 1024,
+              ) -> str:
+    h = hashlib.sha1()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_manifest(root: Path,
+                  ignore_patterns: List[str],
+                  ) -> Dict[str, str]:
+    """
+    return mapping from path relative to root (with forward slashes) to sha1 of file content
+    """
+    res = {}
+    for dir_path, dir_names, file_names in os.walk(str(root)):
+        rel_dir = Path(dir_path).relative_to(root).as_posix()
+        rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+        dir_names[:] = [d for d in dir_names if not is_ignored(rel_dir + d, ignore_patterns)]  # prune
+        for file_name in file_names:
+            rel_path = rel_dir + file_name
+            if not is_ignored(rel_path, ignore_patterns):
+                res[rel_path] = hash_file(Path(dir_path) / file_name)
+    return res
@@ -0,0 +1,265 @@
+"""
+Search param2requests for good configurations, instead of executing all of them.
+
+Configurations are proposed in batches by a tree-structured Parzen estimator (TPE),
+ fit to the final value of a metric of all configurations in runs that are part of param2requests.
+Each batch is submitted with "ludwig", and the next batch is proposed once the results of the current batch are saved.
+Because results are saved to runs like those of any other job, previous results are used by later searches.
+"""
+from pathlib import Path
+import argparse
+import importlib
+import math
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import statistics
+import numpy as np
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from ludwig import print_ludwig
+from ludwig import config
+from ludwig.index import ParamIndex
+from ludwig.paths import default_mnt_point
+from ludwig.requests import ParamGrid, sample_param2vals, MAX_NUM_SOBOL_DIMS
+from ludwig.results import load_final_values
+
+
+def load_history(runs_path: Path,
+                 grid: ParamGrid,
+                 metric: str,
+                 param_name2digits: Dict[str, Optional[List[int]]],  # cache of configurations loaded previously
+                 num_threads: int = 16,
+                 ) -> Dict[int, float]:
+    """return mean final value of metric for each configuration in grid that was executed at least once"""
+    param_index = ParamIndex(runs_path)
+
+    def load_digits(param_name: str) -> Optional[List[int]]:
+        try:
+            with (runs_path / param_name / 'param2val.yaml').open('r') as f:
+                return grid.digits_of(yaml.load(f, Loader=yaml.FullLoader))
+        except FileNotFoundError:  # deleted in the meantime
+            return None
+
+    # param2val.yaml of a new folder may not be written yet - its hash is None, and it is loaded at the next poll
+    new_param_names = [p for p in param_index.param_names
+                       if p not in param_name2digits and param_index.param_name2hash[p] is not None]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        param_name2digits.update(zip(new_param_names, executor.map(load_digits, new_param_names)))
+
+    matching = [(p, digits) for p, digits in param_name2digits.items() if digits is not None]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        values = executor.map(lambda p: load_final_values(runs_path / p, metric), [p for p, _ in matching])
+    res = {}
+    for (param_name, digits), vals in zip(matching, values):
+        if vals:
+            res[grid.index_of(digits)] = statistics.mean(vals)
+    return res
+
+
+class TPE:
+    """
+    tree-structured Parzen estimator for a grid of discrete parameter values.
+
+    the best fraction (gamma) of observed configurations defines a distribution of "good" values for each parameter,
+     the rest defines a distribution of "bad" values.
+    candidates are drawn from the good distribution, and those with the highest ratio good/bad are proposed.
+    """
+
+    def __init__(self,
+                 grid: ParamGrid,
+                 mode: str = 'max',  # whether higher values of the metric are better
+                 gamma: float = 0.25,
+                 num_candidates: int = 64,
+                 seed: int = 0,
+                 ):
+        self.grid = grid
+        self.mode = mode
+        self.gamma = gamma
+        self.num_candidates = num_candidates
+        self.rng = np.random.RandomState(seed)
+
+    def fit(self,
+            index2value: Dict[int, float],
+            ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """return probability of each option of each parameter, under good and bad configurations"""
+        ranked = sorted(index2value, key=index2value.get, reverse=(self.mode == 'max'))
+        num_good = max(1, math.ceil(self.gamma * len(ranked)))
+        good_digits = [self.grid.digits_of(self.grid[i]) for i in ranked[:num_good]]
+        bad_digits = [self.grid.digits_of(self.grid[i]) for i in ranked[num_good:]]
+
+        def estimate(digits_list: List[List[int]]) -> List[np.ndarray]:
+            res = []
+            for n, (k, opts) in enumerate(self.grid.param2opts):
+                counts = np.ones(len(opts))  # prior: each option is equally likely
+                for digits in digits_list:
+                    counts[digits[n]] += 1
+                res.append(counts / counts.sum())
+            return res
+
+        return estimate(good_digits), estimate(bad_digits)
+
+    def propose(self,
+                index2value: Dict[int, float],
+                num_proposals: int,
+                exclude: Set[int],  # e.g. configurations that were executed already
+                ) -> List[int]:
+        p_good, p_bad = self.fit(index2value)
+
+        # draw candidates from good distribution, and score them by log(good / bad)
+        index2score = {}
+        for _ in range(self.num_candidates):
+            digits = [self.rng.choice(len(p), p=p) for p in p_good]
+            i = self.grid.index_of(digits)
+            if i not in exclude:
+                index2score[i] = sum(math.log(pg[d] / pb[d]) for pg, pb, d in zip(p_good, p_bad, digits))
+        res = sorted(index2score, key=index2score.get, reverse=True)[:num_proposals]
+
+        # fill up with random configurations, e.g. if good distribution is concentrated on excluded configurations
+        num_remaining = self.grid.size - len(exclude)
+        while len(res) < min(num_proposals, num_remaining):
+            i = int(self.rng.randint(self.grid.size))
+            if i not in exclude and i not in res:
+                res.append(i)
+        return res
+
+
+def propose_batch(tpe: TPE,
+                  index2value: Dict[int, float],
+                  attempted: Set[int],
+                  startup_indices: List[int],  # drawn by Sobol (or LHS) sampling
+                  num_startup: int,
+                  num_proposals: int,
+                  rng: random.Random,
+                  ) -> List[int]:
+    """
+    propose startup configurations until num_startup configurations completed, and TPE proposals afterwards.
+    TPE is also used once all startup configurations were attempted, e.g. if some of them failed
+    """
+    res = []
+    if len(index2value) < num_startup:
+        res = [i for i in startup_indices if i not in attempted]
+        res = rng.sample(res, len(res))[:num_proposals]
+    if not res:
+        res = tpe.propose(index2value, num_proposals, exclude=attempted)
+    return res
+
+
+def choose_startup_strategy(grid: ParamGrid,
+                            ) -> str:
+    """Sobol sampling is only implemented for up to MAX_NUM_SOBOL_DIMS varied parameters"""
+    num_varied = sum(1 for _, opts in grid.param2opts if len(opts) > 1)
+    if num_varied <= MAX_NUM_SOBOL_DIMS:
+        return 'sobol'
+    print_ludwig(f'Using Latin hypercube instead of Sobol sampling for {num_varied} varied parameters')
+    return 'lhs'
+
+
+def wait_for_results(runs_path: Path,
+                     grid: ParamGrid,
+                     indices: List[int],
+                     metric: str,
+                     param_name2digits: Dict[str, Optional[List[int]]],
+                     timeout: float,
+                     poll_interval: float,
+                     ) -> Dict[int, float]:
+    """return history once all proposed configurations are saved, or after timeout (e.g. if jobs failed)"""
+    start = time.time()
+    while True:
+        index2value = load_history(runs_path, grid, metric, param_name2digits)
+        num_done = sum(1 for i in indices if i in index2value)
+        if num_done == len(indices) or time.time() - start > timeout:
+            break
+        print_ludwig(f'{num_done}/{len(indices)} configurations of current batch completed')
+        time.sleep(poll_interval)
+    if num_done < len(indices):
+        print_ludwig(f'WARNING: Only {num_done}/{len(indices)} configurations completed within {timeout}s')
+    return index2value
+
+
+def main():
+    """
+    propose batches of configurations from param2requests, submit each with "ludwig", and wait for the results.
+    arguments that are not listed below are passed on to "ludwig", e.g. --group or --reps.
+    """
+    cwd = Path.cwd()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metric', required=True, action='store', dest='metric',
+                        help='Name of the series whose final value is optimized')
+    parser.add_argument('--mode', default='max', action='store', dest='mode', choices=['max', 'min'],
+                        help='Whether higher values of the metric are better')
+    parser.add_argument('--num_proposals', default=8, action='store', dest='num_proposals', type=int,
+                        help='Number of configurations submitted at once. '
+                             '--batch_size is passed on to "ludwig", like other arguments')
+    parser.add_argument('--num_batches', default=10, action='store', dest='num_batches', type=int)
+    parser.add_argument('--num_startup', default=None, action='store', dest='num_startup', type=int,
+                        help='Number of configurations drawn with Sobol sampling before TPE is used. '
+                             'Defaults to 2 * num_proposals')
+    parser.add_argument('--gamma', default=0.25, action='store', dest='gamma', type=float,
+                        help='Fraction of configurations considered good by TPE')
+    parser.add_argument('--seed', default=0, action='store', dest='seed', type=int)
+    parser.add_argument('--timeout', default=24 * 60 * 60, action='store', dest='timeout', type=float,
+                        help='Seconds to wait for results of a batch')
+    parser.add_argument('--poll_interval', default=60, action='store', dest='poll_interval', type=float)
+    parser.add_argument('-src', '--src', default=cwd.name.lower(), action='store', dest='src')
+    parser.add_argument('-mnt', '--research_data', default=None, action='store', dest='research_data_path')
+    namespace, ludwig_args = parser.parse_known_args()
+
+    if namespace.research_data_path:
+        research_data_path = Path(namespace.research_data_path)
+        ludwig_args += ['--research_data', str(research_data_path)]
+    else:
+        research_data_path = Path(default_mnt_point) / config.WorkerDirs.research_data.name
+    if '-i' in ludwig_args or '--isolated' in ludwig_args:
+        runs_path = cwd / config.Constants.runs
+    else:
+        runs_path = research_data_path / cwd.name / config.Constants.runs
+
+    # search space
+    sys.path.append(str(cwd))
+    user_params = importlib.import_module(namespace.src + '.params')
+    grid = ParamGrid(user_params.param2requests, user_params.param2default)
+    print_ludwig(f'Searching {grid.size} configurations')
+
+    tpe = TPE(grid, namespace.mode, namespace.gamma, seed=namespace.seed)
+    num_startup = namespace.num_startup or 2 * namespace.num_proposals
+    startup_strategy = choose_startup_strategy(grid)
+    param_name2digits = {}
+    index2value = load_history(runs_path, grid, namespace.metric, param_name2digits) if runs_path.exists() else {}
+    print_ludwig(f'Found results of {len(index2value)} configurations in {runs_path}')
+    attempted = set(index2value)  # configurations that failed are not proposed again
+    param2vals = sample_param2vals(user_params.param2requests, user_params.param2default,
+                                   num_startup, startup_strategy, namespace.seed)
+    startup_indices = [grid.index_of(grid.digits_of(p)) for p in param2vals]
+
+    for batch_id in range(namespace.num_batches):
+
+        # propose
+        indices = propose_batch(tpe, index2value, attempted, startup_indices, num_startup, namespace.num_proposals,
+                                random.Random(namespace.seed + batch_id))
+        if not indices:
+            print_ludwig('All configurations were executed')
+            break
+        attempted.update(indices)
+
+        # submit
+        print_ludwig(f'Submitting batch {batch_id + 1}/{namespace.num_batches} with {len(indices)} configurations')
+        with tempfile.NamedTemporaryFile(suffix='.pkl', delete=False) as f:
+            pickle.dump([grid[i] for i in indices], f)
+        subprocess.run(['ludwig', '--param2vals_path', f.name] + ludwig_args, check=True)
+        Path(f.name).unlink()
+
+        # wait
+        index2value = wait_for_results(runs_path, grid, indices, namespace.metric, param_name2digits,
+                                       namespace.timeout, namespace.poll_interval)
+        best = (max if namespace.mode == 'max' else min)(index2value, key=index2value.get, default=None)
+        if best is not None:
+            print_ludwig(f'Best configuration so far: {namespace.metric}={index2value[best]}')
+            for k, v in sorted(grid[best].items()):
+                print(f'{k:<16} {v}')
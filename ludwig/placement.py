@@ -0,0 +1,180 @@
+"""
+Predict how long jobs take on each worker, based on how long previous jobs took,
+ and assign jobs to workers such that all workers finish as early as possible.
+"""
+from pathlib import Path
+import yaml
+import statistics
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Optional
+
+from ludwig import config
+from ludwig import print_ludwig
+from ludwig.index import ParamIndex
+
+
+class CostModel:
+    """
+    the cost of a job is its duration on a worker with speed=1.0.
+    the duration of a job on a worker is its cost divided by the speed of the worker.
+    """
+
+    def __init__(self,
+                 runs_path: Path,
+                 num_threads: int = 16,
+                 param_index: Optional[ParamIndex] = None,  # pass index to avoid re-syncing
+                 ):
+        self.runs_path = runs_path
+        self.num_threads = num_threads
+        self.param_index = param_index if param_index is not None else ParamIndex(runs_path, num_threads)
+
+        # durations of previous jobs: (param_name, hostname, duration)
+        self.history = self.load_history()
+        self.worker2speed = self.estimate_worker2speed()
+
+        # cost per param_name, and mean cost across all param_names
+        param_name2costs = defaultdict(list)
+        for param_name, worker, duration in self.history:
+            param_name2costs[param_name].append(duration * self.worker2speed[worker])
+        self.param_name2cost = {k: statistics.median(v) for k, v in param_name2costs.items()}
+        self.default_cost = statistics.mean(self.param_name2cost.values()) if self.param_name2cost else 1.0
+        self.param_name2param2val = self.load_param2vals(self.param_name2cost)
+
+    def load_history(self) -> List[Tuple[str, str, float]]:
+        """
+        load duration of each job in runs_path that was executed on a Ludwig worker.
+        job info is cached by the index, so that job_info.yaml files are not loaded on every submission
+        """
+        res = []
+        param_name2job_infos = self.param_index.load_job_infos(self.param_index.param_names)
+        for param_name, job_name2info in sorted(param_name2job_infos.items()):
+            for job_name, job_info in sorted(job_name2info.items()):
+                if job_info is None or not job_info['duration']:
+                    continue
+                if job_info['hostname'] not in config.Remote.worker2speed:  # e.g. executed with --local
+                    continue
+                res.append((param_name, job_info['hostname'], float(job_info['duration'])))
+        print_ludwig(f'Loaded durations of {len(res)} previous jobs')
+        return res
+
+    def load_param2vals(self,
+                        param_names: Dict[str, float],
+                        ) -> Dict[str, Dict[str, Any]]:
+        """
+        load configurations of jobs with known cost, to predict cost of similar configurations.
+        configurations deleted in the meantime are skipped
+        """
+
+        def load(param_name: str) -> Optional[Dict[str, Any]]:
+            try:
+                with (self.runs_path / param_name / 'param2val.yaml').open('r') as f:
+                    return yaml.load(f, Loader=yaml.FullLoader)
+            except FileNotFoundError:  # e.g. deleted by another user
+                return None
+
+        param_names = sorted(param_names)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            return {k: v for k, v in zip(param_names, executor.map(load, param_names)) if v is not None}
+
+    def estimate_worker2speed(self,
+                              num_prior: int = 5,  # weight of config.Remote.worker2speed, in number of jobs
+                              ) -> Dict[str, float]:
+        """
+        estimate speed of each worker relative to the speed other workers achieved on the same configurations.
+        estimates are shrunk towards config.Remote.worker2speed, so that few observations do not dominate
+        """
+        prior = config.Remote.worker2speed
+
+        # cost of each configuration, assuming prior speeds
+        param_name2costs = defaultdict(list)
+        for param_name, worker, duration in self.history:
+            param_name2costs[param_name].append(duration * prior[worker])
+        param_name2cost = {k: statistics.median(v) for k, v in param_name2costs.items()}
+
+        worker2ratios = defaultdict(list)
+        for param_name, worker, duration in self.history:
+            if len(param_name2costs[param_name]) > 1:  # only configurations executed more than once are informative
+                worker2ratios[worker].append(param_name2cost[param_name] / duration)
+
+        res = {}
+        for worker, speed in prior.items():
+            ratios = worker2ratios[worker]
+            estimate = statistics.median(ratios) if ratios else speed
+            res[worker] = (num_prior * speed + len(ratios) * estimate) / (num_prior + len(ratios))
+        return res
+
+    def predict_cost(self,
+                     param2val: Dict[str, Any],
+                     ) -> float:
+        """
+        return median cost of previous jobs with same param_name.
+        otherwise, return mean cost of previous configurations that share the most parameter values
+        """
+        if param2val['param_name'] in self.param_name2cost:
+            return self.param_name2cost[param2val['param_name']]
+
+        best_similarity = 0
+        costs = []
+        for param_name, loaded_param2val in self.param_name2param2val.items():
+            similarity = sum(1 for k, v in param2val.items()
+                             if k not in config.Constants.added_param_names and loaded_param2val.get(k) == v)
+            if similarity > best_similarity:
+                best_similarity = similarity
+                costs = [self.param_name2cost[param_name]]
+            elif similarity == best_similarity and similarity > 0:
+                costs.append(self.param_name2cost[param_name])
+        return statistics.mean(costs) if costs else self.default_cost
+
+
+def pin_jobs(param_names: List[str],
+             param_name2workers: Dict[str, List[str]],  # workers on which each configuration is running
+             workers: List[str],
+             ) -> List[Optional[str]]:
+    """
+    return the worker on which each job is running already, or None.
+    a running job is only kept by the watcher if its worker receives the same configuration again
+    """
+    available = {k: [w for w in v if w in workers] for k, v in param_name2workers.items()}
+    res = []
+    for param_name in param_names:
+        running_on = available.get(param_name)
+        res.append(running_on.pop(0) if running_on else None)
+    return res
+
+
+def assign_jobs(costs: List[float],
+                workers: List[str],
+                worker2speed: Dict[str, float],
+                pinned: Optional[List[Optional[str]]] = None,  # worker of each job that must not be moved
+                ) -> Tuple[List[str], Dict[str, float]]:
+    """
+    longest-processing-time-first: assign the most costly remaining job to the worker that would finish it earliest.
+    pinned jobs are assigned to their worker first.
+
+    return the worker assigned to each job, and the predicted time at which each worker finishes
+    """
+    worker2finish = {w: 0.0 for w in workers}
+    res = list(pinned) if pinned is not None else [None] * len(costs)
+    for i, worker in enumerate(res):
+        if worker is not None:
+            worker2finish[worker] += costs[i] / worker2speed.get(worker, 1.0)
+    for i in sorted((i for i in range(len(costs)) if res[i] is None), key=lambda i: costs[i], reverse=True):
+        worker = min(workers, key=lambda w: worker2finish[w] + costs[i] / worker2speed.get(w, 1.0))
+        worker2finish[worker] += costs[i] / worker2speed.get(worker, 1.0)
+        res[i] = worker
+    return res, worker2finish
+
+
+def print_schedule(assigned_workers: List[str],
+                   worker2finish: Dict[str, float],
+                   worker2speed: Dict[str, float],
+                   ) -> None:
+    print_ludwig('Predicted schedule:')
+    print(f'{"worker":<10} {"speed":>6} {"jobs":>6} {"finish (h:m:s)":>16}')
+    for worker, finish in sorted(worker2finish.items(), key=lambda i: i[1], reverse=True):
+        num_jobs = assigned_workers.count(worker)
+        minutes, seconds = divmod(int(finish), 60)
+        hours, minutes = divmod(minutes, 60)
+        print(f'{worker:<10} {worker2speed.get(worker, 1.0):>6.2f} {num_jobs:>6} '
+              f'{hours:>10}:{minutes:0>2}:{seconds:0>2}')
@@ -0,0 +1,52 @@
+"""
+Decide how many repetitions of a configuration are needed,
+ such that the 95% confidence interval of the final value of a metric is narrower than a target.
+"""
+import math
+import statistics
+from typing import List, Optional
+
+# two-sided 95% critical values of Student's t distribution, by degrees of freedom
+DF2T = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093,
+        20: 2.086, 21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048,
+        29: 2.045, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+
+def t_critical(df: int) -> float:
+    """critical value for the largest tabulated df that is not larger than df - errs on the wide side"""
+    if df < 1:
+        raise ValueError('At least 2 values are required for a confidence interval')
+    return DF2T[max(k for k in DF2T if k <= df)] if df <= 120 else 1.960
+
+
+def calc_ci_half_width(values: List[float],
+                       ) -> Optional[float]:
+    """half-width of the 95% confidence interval of the mean, or None if there are fewer than 2 values"""
+    if len(values) < 2:
+        return None
+    return t_critical(len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+
+
+def calc_num_reps(values: List[float],
+                  target_ci: float,  # half-width of 95% confidence interval
+                  min_reps: int,
+                  max_reps: int,
+                  ) -> int:
+    """
+    return total number of repetitions a configuration needs, given the final values of completed repetitions.
+    if the confidence interval is too wide, the number is estimated from the observed standard deviation.
+    """
+    num_done = len(values)
+    if num_done < min_reps:
+        return min_reps
+    half_width = calc_ci_half_width(values)
+    if num_done >= max_reps or half_width is None or half_width <= target_ci:
+        return max(num_done, min_reps)
+
+    # smallest n for which t * sd / sqrt(n) <= target_ci, assuming the standard deviation does not change
+    sd = statistics.stdev(values)
+    res = num_done + 1
+    while res < max_reps and t_critical(res - 1) * sd / math.sqrt(res) > target_ci:
+        res += 1
+    return res
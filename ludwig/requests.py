@@ -1,65 +1,204 @@
-from itertools import cycle
-from typing import Tuple, Any, Dict, List
-import numpy as np
+import random
+from typing import Any, Dict, List, Iterator, Union, Optional
 
+# primitive polynomials (degree, coefficients) and initial direction numbers for Sobol dimensions 2-21,
+# taken from Joe & Kuo (2008). dimension 1 is the van der Corput sequence.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+SOBOL_BITS = 32
+MAX_NUM_SOBOL_DIMS = len(SOBOL_DIRECTIONS) + 1  # the first dimension needs no direction numbers
+STRATEGIES = ['random', 'lhs', 'sobol']
 
-def _iter_over_cycles(param2opts: Tuple[Any, ...],
-                      ):
+
+class ParamGrid:
+    """
+    lazy Cartesian product of all requested parameter values.
+
+    each configuration is identified by an integer in a mixed-radix number system,
+     where the first parameter varies fastest.
+    this means configurations are computed on demand, and each index maps to a unique configuration.
+    """
+
+    def __init__(self,
+                 param2requests: Dict[str, list],
+                 param2default: Dict[str, Any],
+                 ):
+
+        # check that requests are lists
+        for k, v in param2requests.items():
+            if not isinstance(v, list):
+                raise ValueError('Ludwig: Values in param2requests must be of type list.')
+
+        # complete partial request made by user
+        self.param2opts = tuple((k, [v] if k not in param2requests else param2requests[k])
+                                for k, v in param2default.items())
+
+        # place values of mixed-radix number system
+        self.strides = []
+        stride = 1
+        for k, v in self.param2opts:
+            self.strides.append(stride)
+            stride *= len(v)
+        self.size = stride if self.param2opts else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self,
+                    i: Union[int, slice],
+                    ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(i, slice):  # e.g. to shard a sweep
+            return [self[j] for j in range(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError('ParamGrid index out of range')
+        return {k: v[(i // stride) % len(v)] for (k, v), stride in zip(self.param2opts, self.strides)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.size):
+            yield self[i]
+
+    def index_of(self,
+                 digits: List[int],
+                 ) -> int:
+        """return index of configuration defined by one option index per parameter"""
+        return sum(digit * stride for digit, stride in zip(digits, self.strides))
+
+    def digits_of(self,
+                  param2val: Dict[str, Any],
+                  ) -> Optional[List[int]]:
+        """return option index of each parameter, or None if param2val is not a configuration of the grid"""
+        res = []
+        for k, v in self.param2opts:
+            if k not in param2val or param2val[k] not in v:
+                return None
+            res.append(v.index(param2val[k]))
+        return res
+
+
+def _gen_sobol_points(num_dims: int,
+                      rng: random.Random,
+                      ) -> Iterator[List[float]]:
     """
-    return list of mappings from param name to integer which is index to possible param values
-    all possible combinations are returned
+    generate points of a Sobol sequence in [0, 1)^num_dims.
+    a random digital shift (determined by rng) is applied, which preserves the stratification of the sequence.
     """
-    lengths = []
-    for k, v in param2opts:
-        lengths.append(len(v))
-    total = np.prod(lengths)
-    num_lengths = len(lengths)
-
-    # cycles
-    cycles = []
-    prev_interval = 1
-    for n in range(num_lengths):
-        l = np.concatenate([[i] * prev_interval for i in range(lengths[n])])
-        if n != num_lengths - 1:
-            c = cycle(l)
-        else:
-            c = l
-        cycles.append(c)
-        prev_interval *= lengths[n]
-
-    # iterate over cycles, in effect retrieving all combinations
-    param_ids = []
-    for n, i in enumerate(zip(*cycles)):
-        param_ids.append(i)
-    assert sorted(list(set(param_ids))) == sorted(param_ids)
-    assert len(param_ids) == total
-    return param_ids
+    if num_dims > MAX_NUM_SOBOL_DIMS:
+        raise ValueError(f'Sobol sampling supports at most {MAX_NUM_SOBOL_DIMS} varied parameters. '
+                         f'Use strategy=lhs or strategy=random instead.')
+
+    # direction numbers
+    directions = [[1 << (SOBOL_BITS - 1 - k) for k in range(SOBOL_BITS)]]
+    for degree, a, m in SOBOL_DIRECTIONS[:num_dims - 1]:
+        v = [mk << (SOBOL_BITS - 1 - k) for k, mk in enumerate(m)]
+        for k in range(degree, SOBOL_BITS):
+            vk = v[k - degree] ^ (v[k - degree] >> degree)
+            for j in range(1, degree):
+                if (a >> (degree - 1 - j)) & 1:
+                    vk ^= v[k - j]
+            v.append(vk)
+        directions.append(v)
+
+    shifts = [rng.getrandbits(SOBOL_BITS) for _ in range(num_dims)]
+    x = [0] * num_dims
+    i = 0
+    while i < 1 << SOBOL_BITS:
+        yield [(xd ^ shift) / (1 << SOBOL_BITS) for xd, shift in zip(x, shifts)]
+        # gray code: flip direction number of the rightmost zero bit of i
+        c = (~i & (i + 1)).bit_length() - 1
+        x = [xd ^ v[c] for xd, v in zip(x, directions)]
+        i += 1
+
+
+def _gen_lhs_points(num_dims: int,
+                    num_points: int,
+                    rng: random.Random,
+                    ) -> Iterator[List[float]]:
+    """generate points of a Latin hypercube in [0, 1)^num_dims - each dimension is stratified into num_points bins"""
+    columns = []
+    for _ in range(num_dims):
+        strata = list(range(num_points))
+        rng.shuffle(strata)
+        columns.append([(stratum + rng.random()) / num_points for stratum in strata])
+    for n in range(num_points):
+        yield [column[n] for column in columns]
+
+
+def sample_param2vals(param2requests: Dict[str, list],
+                      param2default: Dict[str, Any],
+                      num_samples: int,
+                      strategy: str = 'random',
+                      seed: int = 0,
+                      ) -> List[Dict[str, Any]]:
+    """
+    return num_samples distinct param2val objects drawn from all requested configurations.
+    draws are deterministic given seed, and the full grid is never enumerated.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'Ludwig: strategy must be one of {STRATEGIES}')
+
+    grid = ParamGrid(param2requests, param2default)
+    if num_samples >= grid.size:
+        return list(grid)
+
+    rng = random.Random(seed)
+    indices = set()
+
+    # only parameters with multiple values span dimensions of the design
+    varied = [(n, len(v)) for n, (k, v) in enumerate(grid.param2opts) if len(v) > 1]
+
+    def index_of_point(point: List[float]) -> int:
+        digits = [0] * len(grid.param2opts)
+        for (n, num_opts), u in zip(varied, point):
+            digits[n] = int(u * num_opts)
+        return grid.index_of(digits)
+
+    if strategy == 'sobol':
+        max_num_points = num_samples * 64  # discretized points may collide
+        for n, point in enumerate(_gen_sobol_points(len(varied), rng)):
+            indices.add(index_of_point(point))
+            if len(indices) == num_samples or n == max_num_points:
+                break
+    elif strategy == 'lhs':
+        for point in _gen_lhs_points(len(varied), num_samples, rng):
+            indices.add(index_of_point(point))
+
+    # fill up with random configurations, e.g. when discretized points collide
+    if num_samples * 2 >= grid.size:  # dense: avoid many rejected draws
+        remaining = [i for i in rng.sample(range(grid.size), grid.size) if i not in indices]
+        indices.update(remaining[:num_samples - len(indices)])
+    while len(indices) < num_samples:
+        indices.add(rng.randrange(grid.size))
+
+    return [grid[i] for i in sorted(indices)]
 
 
 def gen_all_param2vals(param2requests: Dict[str, list],
                        param2default: Dict[str, Any],
-                       ) -> List[Dict[str, Any]]:
+                       ) -> Iterator[Dict[str, Any]]:
     """
     return multiple param2val objects,
      each defining the parameter configuration for a singel job
     """
-
-    # check that requests are lists
-    for k, v in param2requests.items():
-        if not isinstance(v, list):
-            raise ValueError('Ludwig: Values in param2requests must be of type list.')
-
-    # complete partial request made by user
-    full_request = {k: [v] if k not in param2requests else param2requests[k]
-                    for k, v in param2default.items()}
-    #
-    param2opts = tuple(full_request.items())
-    param_ids = _iter_over_cycles(param2opts)
-
-    seen = []
-    for ids in param_ids:
-        # map param names to integers corresponding to which param value to use
-        param2val = {k: v[i] for (k, v), i in zip(param2opts, ids)}
-        assert param2val not in seen
-        seen.append(param2val)
-        yield param2val
+    yield from ParamGrid(param2requests, param2default)
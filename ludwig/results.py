@@ -1,12 +1,18 @@
 from pathlib import Path
-import yaml
 import os
-from typing import List, Dict, Optional, Any
+import yaml
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Iterable, Tuple
 
 from ludwig import print_ludwig
 from ludwig import config
 from ludwig.requests import gen_all_param2vals
 from ludwig.paths import default_mnt_point
+from ludwig.index import ParamIndex
+from ludwig.run import param2val_to_hash
+from ludwig.job import Job
 
 
 def gen_param_paths(project_name: str,
@@ -55,6 +61,7 @@ def gen_param_paths(project_name: str,
                                if val != param2default[param]] + (label_params or [])))
 
     requested_param2vals = list(gen_all_param2vals(param2requests, param2default))
+    hash2requested_param2val = {param2val_to_hash(param2val): param2val for param2val in requested_param2vals}
 
     print_ludwig('Looking for the following parameter configurations:')
     num_requested = 0
@@ -62,39 +69,131 @@ def gen_param_paths(project_name: str,
         print(sorted(requested_param2val.items()))
         num_requested += 1
 
-    # look for param_paths
-    num_found = 0
-    for param_path in runs_path.glob('param_*'):
+    # look for param_paths - matching is done via hashes stored in index
+    param_index = ParamIndex(runs_path)
+    param_name2param2val = {}
+    for param_name in param_index.param_names:
         if verbose:
-            print_ludwig(f'Checking {param_path}...')
-
-        # load param2val
-        with (param_path / 'param2val.yaml').open('r') as f:
-            param2val = yaml.load(f, Loader=yaml.FullLoader)
-        loaded_param2val = param2val.copy()
-
-        for param_name in config.Constants.added_param_names:
-            try:
-                del loaded_param2val[param_name]
-            except KeyError:  # Ludwig < v2.0
-                pass
+            print_ludwig(f'Checking {runs_path / param_name}...')
 
         # is match?
-        if loaded_param2val in requested_param2vals:
-            num_found += 1
-            label_ = '\n'.join([f'{param}={param2val[param]}' for param in label_params])
-            if label_n:
-                n = len(list(param_path.glob('*num*')))
-                label_ += f'\nn={n}'
+        param2val = hash2requested_param2val.get(param_index.param_name2hash[param_name])
+        if param2val is not None:
+            param_name2param2val[param_name] = param2val
             if verbose:
                 print_ludwig('Param2val matches')
-                print_ludwig(label_)
-            yield param_path, label_
         else:
             if verbose:
                 print_ludwig('Params do not match')
 
+    # count jobs of all matching param_paths concurrently
+    if label_n:
+        param_name2n = param_index.count_jobs(list(param_name2param2val))
+        param_name2param2val = {k: v for k, v in param_name2param2val.items() if k in param_name2n}
+
+    num_found = 0
+    for param_name, param2val in param_name2param2val.items():
+        num_found += 1
+        label_ = '\n'.join([f'{param}={param2val[param]}' for param in label_params])
+        if label_n:
+            label_ += f'\nn={param_name2n[param_name]}'
+        if verbose:
+            print_ludwig(label_)
+        yield runs_path / param_name, label_
+
     if num_requested != num_found:
         raise SystemExit(f'Found {num_found} but requested {num_requested}')
 
 
+def _load_job_results(job_path: Path,
+                      series_names: Optional[List[str]],
+                      ) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    return (series name, index, values) for each requested series saved by a single job.
+    results.npz is preferred over csv files, and only requested series are read
+    """
+    res = []
+    npz_path = job_path / config.Constants.results
+    if npz_path.exists():
+        with np.load(str(npz_path)) as npz:
+            names = sorted({key.rsplit('.', 1)[0] for key in npz.files})
+            for name in names:
+                if series_names is None or name in series_names:
+                    res.append((name, npz[f'{name}.index'], npz[f'{name}.values']))
+    else:
+        if series_names is None:
+            csv_paths = sorted(job_path.glob('*.csv'))
+        else:
+            csv_paths = [job_path / f'{name}.csv' for name in series_names if (job_path / f'{name}.csv').exists()]
+        for csv_path in csv_paths:
+            df = pd.read_csv(csv_path, index_col=0)
+            res.append((csv_path.stem, df.index.values, df.iloc[:, 0].values))
+    return res
+
+
+def load_runs(param_paths: Iterable[Path],
+              series_names: Optional[List[str]] = None,
+              param_names: Optional[List[str]] = None,
+              num_threads: int = 16,
+              ) -> pd.DataFrame:
+    """
+    Return results of all jobs in param_paths (e.g. returned by gen_param_paths) in long format:
+     one column for each parameter, and columns param_name, job_name, series, index, value.
+    Use series_names and param_names to load only some series, and to include only some parameters.
+    """
+
+    def load(param_path: Path):
+        with (param_path / 'param2val.yaml').open('r') as f:
+            param2val = yaml.load(f, Loader=yaml.FullLoader)
+        param2val = {k: v for k, v in param2val.items()
+                     if k not in config.Constants.added_param_names and (param_names is None or k in param_names)}
+        job_results = [(job_path.name, _load_job_results(job_path, series_names))
+                       for job_path in sorted(param_path.glob('*num*'))]
+        return param_path.name, param2val, job_results
+
+    param_paths = [Path(p) for p in param_paths]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        loaded = list(executor.map(load, param_paths))
+
+    # concatenate arrays once, instead of building a frame per series
+    labels = {'param_name': [], 'job_name': [], 'series': []}
+    indices = []
+    values = []
+    param_name2param2val = {}
+    for param_name, param2val, job_results in loaded:
+        param_name2param2val[param_name] = param2val
+        for job_name, series_results in job_results:
+            for series_name, index, vals in series_results:
+                labels['param_name'].append((param_name, len(vals)))
+                labels['job_name'].append((job_name, len(vals)))
+                labels['series'].append((series_name, len(vals)))
+                indices.append(index)
+                values.append(vals)
+
+    columns = {}
+    for column, label_and_counts in labels.items():
+        columns[column] = np.repeat(np.array([label for label, _ in label_and_counts], dtype=object),
+                                    [count for _, count in label_and_counts])
+    columns['index'] = np.concatenate(indices) if indices else np.array([])
+    columns['value'] = np.concatenate(values) if values else np.array([])
+    res = pd.DataFrame(columns)
+
+    # add one column per parameter
+    params_df = pd.DataFrame.from_dict(param_name2param2val, orient='index')
+    res = res.join(params_df, on='param_name')
+    return res[list(params_df.columns) + ['param_name', 'job_name', 'series', 'index', 'value']]
+
+
+def load_final_values(param_path: Path,
+                      series_name: str,
+                      code_fingerprint: Optional[str] = None,  # only load jobs executed with the same code
+                      ) -> List[float]:
+    """return the last value of a series, for each job of a parameter configuration that saved the series"""
+    res = []
+    for job_path in sorted(param_path.glob('*num*')):
+        if code_fingerprint is not None and Job.load_code_fingerprint(job_path) not in {None, code_fingerprint}:
+            continue
+        for name, index, values in _load_job_results(job_path, [series_name]):
+            if len(values):
+                res.append(float(values[-1]))
+    return res
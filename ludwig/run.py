@@ -1,54 +1,372 @@
 import pickle
 import socket
 import yaml
+import numpy as np
 import pandas as pd
 import importlib
 from pathlib import Path
 import sys
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, List
 import shutil
+import hashlib
+import json
+import os
+import resource
+import signal
+import threading
+import time
+import traceback
 
 # do not import ludwig here - this file is run on Ludwig workers
 
+# must match config.Constants.added_param_names
+added_param_names = ['job_name', 'param_name', 'project_path', 'save_path']
+param2val_index_name = 'param2val_index.json'
+# must match config.Constants.queue, config.Constants.job_info, config.Constants.results and config.Time.lease_duration
+queue_name = 'queue'
+job_info_name = 'job_info.yaml'
+results_name = 'results.npz'
+# a job can set "results_formats" in its module to save results in another format
+default_results_formats = ('csv',)
+lease_duration = 10 * 60  # seconds
+# must match config.WorkerDirs.spool
+worker_spool_path = Path('/') / 'var' / 'sftp' / 'ludwig_spool'
+# must match config.WorkerDirs.job_status
+worker_job_status_path = Path('/') / 'var' / 'sftp' / 'ludwig_state' / 'jobs'
+# must match config.Constants.resumable
+resumable_name = '.resumable'
+# a job that sets "resumable = True" in its module should save a checkpoint and return when this is set
+preemption_env_name = 'LUDWIG_PREEMPTED'
+
+
+def param2val_to_hash(param2val: Dict[str, Any],
+                      ) -> str:
+    """
+    return a hash of a parameter configuration, ignoring parameters added by Ludwig.
+    two configurations have the same hash if they would be considered the same by Job.is_same()
+    """
+    items = sorted((k, v) for k, v in param2val.items() if k not in added_param_names)
+    return hashlib.sha1(repr(items).encode('utf8')).hexdigest()
+
+
+def write_json_atomically(obj: Any,
+                          path: Path,
+                          ) -> None:
+    """
+    write to a temporary file first, so that readers on other machines never see a partially written file
+    """
+    tmp_path = path.parent / f'.{path.name}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with tmp_path.open('w') as f:
+        json.dump(obj, f)
+    os.replace(str(tmp_path), str(path))
+
+
+def update_param2val_index(runs_path: Path,
+                           param2val: Dict[str, Any],
+                           ) -> None:
+    """
+    add param_name of a newly saved configuration to the index located next to runs_path.
+
+    runs_mtime is not updated here: if concurrent writers overwrite each other's entries,
+     the changed mtime of runs_path causes the next reader to re-scan runs_path.
+    """
+    index_path = runs_path.parent / param2val_index_name
+    try:
+        with index_path.open('r') as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):  # missing or corrupt index is rebuilt by reader
+        index = {'runs_mtime': None, 'param_name2hash': {}}
+    index['param_name2hash'][param2val['param_name']] = param2val_to_hash(param2val)
+    try:
+        write_json_atomically(index, index_path)
+    except OSError as e:  # index is only a cache - never fail a job because of it
+        print(f'WARNING: Could not update {index_path}: {e}')
+
+
+def get_cpu_time() -> float:
+    """seconds of CPU time used by all threads of this process and its terminated child processes"""
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+
+
+def get_num_cpus() -> int:
+    """number of CPUs the process may run on - the watcher restricts jobs to a subset when they share a worker"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def to_array(values: Any,
+             ) -> np.ndarray:
+    """convert index or values of a series to an array that can be loaded without pickle"""
+    res = np.asarray(values)
+    if res.dtype == object:
+        try:
+            res = res.astype(float)
+        except (TypeError, ValueError):
+            res = res.astype(str)
+    return res
+
 
 def save_job_files(param2val: Dict[str, Any],
                    series_list: list,
                    runs_path: Path,
+                   duration: Optional[float] = None,  # seconds
+                   results_formats: Tuple[str, ...] = default_results_formats,  # 'csv' and/or 'npz'
+                   spool_path: Optional[Path] = None,  # save to local disk first, watcher ships to runs_path
+                   cpu_time: Optional[float] = None,  # seconds
+                   code_fingerprint: Optional[str] = None,  # hash of the source code used to run the job
                    ) -> None:
 
     if not series_list:
         print('WARNING: Job did not return any results')
 
     # save series_list
-    job_path = runs_path / param2val['param_name'] / param2val['job_name']
+    dst_job_path = runs_path / param2val['param_name'] / param2val['job_name']
+    if spool_path is None:
+        job_path = dst_job_path
+    else:
+        entry_name = f'{runs_path.parent.name}__{param2val["param_name"]}__{param2val["job_name"]}'
+        job_path = spool_path / entry_name
     if not job_path.exists():
         job_path.mkdir(parents=True)
+    name2array = {}
     for series in series_list:
         if not isinstance(series, pd.Series):
             print('WARNING: Object returned by job must be a pandas.Series.')
             continue
-        with (job_path / '{}.csv'.format(series.name)).open('w') as f:
-            series.to_csv(f, index=True, header=[series.name])  # cannot name the index with "header" arg
+        if 'csv' in results_formats:
+            with (job_path / '{}.csv'.format(series.name)).open('w') as f:
+                series.to_csv(f, index=True, header=[series.name])  # cannot name the index with "header" arg
+        name2array[f'{series.name}.index'] = to_array(series.index)
+        name2array[f'{series.name}.values'] = to_array(series.values)
+
+    # save all series in a single compressed file - each series can be loaded without loading the others
+    if 'npz' in results_formats and name2array:
+        with (job_path / results_name).open('wb') as f:
+            np.savez_compressed(f, **name2array)
 
-    # save param2val
+    # save information about job execution - used to predict duration of future jobs
+    # cpu_time / (duration * num_cpus) close to 1 means the job used its CPUs without competing for them
+    job_info = {'hostname': socket.gethostname().lower(),
+                'duration': duration,
+                'cpu_time': cpu_time,
+                'num_cpus': get_num_cpus(),
+                'code_fingerprint': code_fingerprint}
+    with (job_path / job_info_name).open('w') as f:
+        yaml.dump(job_info, f, default_flow_style=False)
+
+    # save param2val - saved directly to shared drive, so that the next submission finds the configuration
     param2val_path = runs_path / param2val['param_name'] / 'param2val.yaml'
     print(f'Saving param2val to {param2val_path}')
     if not param2val_path.exists():
-        param2val_path.parent.mkdir(exist_ok=True)
+        param2val_path.parent.mkdir(parents=True, exist_ok=True)
         param2val['job_name'] = None
         with param2val_path.open('w', encoding='utf8') as f:
             yaml.dump(param2val, f, default_flow_style=False, allow_unicode=True)
+        update_param2val_index(runs_path, param2val)
 
     # move contents of save_path to shared drive
     save_path = Path(param2val['save_path'])
     src = str(save_path)
     dst = str(job_path)
     if save_path.exists():  # user may not create a directory at save path
-        print(f'Moving {src} to shared drive')
+        print(f'Moving {src} to {"spool" if spool_path is not None else "shared drive"}')
         shutil.move(src, dst)  # src is no longer available afterwards
 
+    # mark spooled job as complete - only complete jobs are shipped
+    if spool_path is not None:
+        write_json_atomically({'job_path': str(dst_job_path)}, spool_path / f'{job_path.name}.json')
+        print(f'Spooled results to {job_path}')
+
+
+def requeue_expired_leases(queue_path: Path,
+                           ) -> None:
+    """
+    return jobs to the shared queue if the worker that claimed them stopped renewing their lease
+    """
+    for lease_path in (queue_path / 'leases').glob('*.pkl'):
+        try:
+            is_expired = time.time() - lease_path.stat().st_mtime > lease_duration
+        except FileNotFoundError:  # finished in the meantime
+            continue
+        if is_expired:
+            original_name = lease_path.name.split('__')[-1]
+            try:
+                os.rename(str(lease_path), str(queue_path / original_name))
+            except OSError:  # requeued by another worker
+                continue
+            print(f'Requeued {original_name} because its lease expired')
+
+
+def claim_job(queue_path: Path,
+              ) -> Optional[Path]:
+    """
+    move the next job in the shared queue to the leases folder.
+    renaming is atomic, so that only one worker can claim a job.
+    """
+    requeue_expired_leases(queue_path)
+    for pkl_path in sorted(queue_path.glob('*.pkl')):
+        lease_path = queue_path / 'leases' / f'{socket.gethostname()}__{os.getpid()}__{pkl_path.name}'
+        try:
+            os.rename(str(pkl_path), str(lease_path))
+        except OSError:  # claimed by another worker
+            continue
+        return lease_path
+    return None
+
+
+def renew_lease(lease_path: Path,
+                is_done: threading.Event,
+                ) -> None:
+    while not is_done.wait(lease_duration / 4):
+        try:
+            os.utime(str(lease_path))
+        except FileNotFoundError:  # queue was cleared by new submission
+            return
+
+
+def load_job(pkl_path: Path,
+             ) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    return param2val and code fingerprint of a pickled job.
+    the fingerprint is pickled after param2val, so that it is not passed to the user's job.
+    jobs saved by previous versions of Ludwig have no fingerprint
+    """
+    with pkl_path.open('rb') as f:
+        param2val = pickle.load(f)
+        try:
+            code_fingerprint = pickle.load(f)
+        except EOFError:
+            code_fingerprint = None
+    return param2val, code_fingerprint
 
-def run_job_on_ludwig_worker(param2val):
+
+def run_job_from_queue(lease_path: Path,
+                       ) -> None:
+    """run a claimed job, renewing its lease while it runs"""
+    is_done = threading.Event()
+    renewer = threading.Thread(target=renew_lease, args=(lease_path, is_done))
+    renewer.daemon = True
+    renewer.start()
+    try:
+        run_job_on_ludwig_worker(*load_job(lease_path))
+    except Exception:  # do not requeue jobs that fail - they would fail again
+        failed_path = lease_path.parent.parent / 'failed'
+        failed_path.mkdir(exist_ok=True)
+        os.rename(str(lease_path), str(failed_path / lease_path.name.split('__')[-1]))
+        raise
+    else:
+        try:
+            lease_path.unlink()
+        except FileNotFoundError:  # queue was cleared by new submission
+            pass
+    finally:
+        is_done.set()
+
+
+def claim_checkpoint(resumable_path: Path,
+                     save_path: Path,
+                     ) -> bool:
+    """
+    move a checkpoint saved by a preempted job with the same configuration to save_path.
+    renaming is atomic, so that each checkpoint is resumed by only one job.
+    """
+    if not resumable_path.exists():
+        return False
+    for checkpoint_path in sorted(resumable_path.iterdir()):
+        if checkpoint_path.name.startswith('.'):  # being saved or claimed
+            continue
+        claimed_path = resumable_path / f'.{socket.gethostname()}__{os.getpid()}__{checkpoint_path.name}'
+        try:
+            os.rename(str(checkpoint_path), str(claimed_path))
+        except OSError:  # claimed by another job
+            continue
+        print(f'Resuming from checkpoint saved by {checkpoint_path.name}')
+        shutil.move(str(claimed_path), str(save_path))
+        return True
+    return False
+
+
+def stash_checkpoint(save_path: Path,
+                     resumable_path: Path,
+                     job_name: str,
+                     ) -> None:
+    """move save_path of a preempted job to the shared drive, so that a re-submitted job can resume from it"""
+    if not save_path.exists():
+        return
+    resumable_path.mkdir(parents=True, exist_ok=True)
+    tmp_path = resumable_path / f'.{job_name}.tmp'
+    print(f'Saving checkpoint to {resumable_path / job_name}')
+    try:
+        shutil.move(str(save_path), str(tmp_path))
+        os.rename(str(tmp_path), str(resumable_path / job_name))
+    except OSError as e:
+        print(f'WARNING: Could not save checkpoint: {e}')
+
+
+def on_sigterm(signal_number, frame):
+    """
+    the watcher sends SIGTERM before killing a job, e.g. because the project was re-submitted.
+    a resumable job is given time to save a checkpoint, other jobs exit immediately.
+    """
+    if getattr(job, 'resumable', False):
+        print('Received SIGTERM. Waiting for job to save a checkpoint')
+        os.environ[preemption_env_name] = '1'
+    else:
+        raise SystemExit('Received SIGTERM')
+
+
+def publish_job_status(param2val_list: List[Dict[str, Any]],
+                       ) -> None:
+    """tell the watcher which jobs this process is running - shown by ludwig-status"""
+    if not worker_job_status_path.exists():  # created by watcher
+        return
+    job_status = {'jobs': [(p['param_name'], p['job_name']) for p in param2val_list],
+                  'start_time': time.time()}
+    try:
+        write_json_atomically(job_status, worker_job_status_path / f'{os.getpid()}.json')
+    except OSError as e:  # status is only informative - never fail a job because of it
+        print(f'WARNING: Could not publish job status: {e}')
+
+
+def prepare_save_path(param2val: Dict[str, Any],
+                      runs_path: Path,
+                      ) -> None:
+    """create save_path of a job, resuming from a checkpoint of a preempted job if the job is resumable"""
+    save_path = Path(param2val['save_path'])
+    resumable_path = runs_path / param2val['param_name'] / resumable_name
+    if getattr(job, 'resumable', False) and not save_path.exists():
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        claim_checkpoint(resumable_path, save_path)
+    if not save_path.exists():
+        save_path.mkdir(parents=True)
+
+
+def finish_job(param2val: Dict[str, Any],
+               series_list: list,
+               runs_path: Path,
+               duration: float,
+               cpu_time: float,
+               code_fingerprint: Optional[str],
+               ) -> None:
+    print(f'Used {cpu_time:.1f}s of CPU time in {duration:.1f}s on {get_num_cpus()} CPUs')
+
+    # job returned early, after saving a checkpoint to save_path
+    if os.environ.get(preemption_env_name):
+        resumable_path = runs_path / param2val['param_name'] / resumable_name
+        stash_checkpoint(Path(param2val['save_path']), resumable_path, param2val['job_name'])
+        return
+
+    # save results
+    results_formats = getattr(job, 'results_formats', default_results_formats)
+    spool_path = worker_spool_path if worker_spool_path.exists() else None  # spool is created by watcher
+    save_job_files(param2val, series_list, runs_path, duration, results_formats, spool_path, cpu_time,
+                   code_fingerprint)
+
+
+def run_job_on_ludwig_worker(param2val, code_fingerprint=None):
     """
     run a single job on on a single worker.
     this function is called on a Ludwig worker.
@@ -57,16 +375,68 @@ def run_job_on_ludwig_worker(param2val):
     """
 
     # prepare save_path - this must be done on worker
-    save_path = Path(param2val['save_path'])
-    if not save_path.exists():
-        save_path.mkdir(parents=True)
+    runs_path = remote_root_path / 'runs'
+    prepare_save_path(param2val, runs_path)
+    publish_job_status([param2val])
 
     # execute job
+    start = time.time()
+    start_cpu_time = get_cpu_time()
     series_list = job.main(param2val)  # name each returned series using 'name' attribute
+    duration = time.time() - start
+    cpu_time = get_cpu_time() - start_cpu_time
 
-    # save results
+    finish_job(param2val, series_list, runs_path, duration, cpu_time, code_fingerprint)
+
+
+def run_batch_on_ludwig_worker(param2val_list, code_fingerprints=None):
+    """
+    run multiple jobs in a single call to main_batch() of the job module, e.g. to vectorize across seeds.
+    main_batch() must return one list of series per configuration, in the order of param2val_list.
+    results of each configuration are saved separately, as if each job was run by main().
+    """
     runs_path = remote_root_path / 'runs'
-    save_job_files(param2val, series_list, runs_path)
+    for param2val in param2val_list:
+        prepare_save_path(param2val, runs_path)
+    publish_job_status(param2val_list)
+
+    # execute jobs
+    start = time.time()
+    start_cpu_time = get_cpu_time()
+    series_lists = job.main_batch(param2val_list)
+    duration = (time.time() - start) / len(param2val_list)  # used to predict duration of single jobs
+    cpu_time = (get_cpu_time() - start_cpu_time) / len(param2val_list)
+    if len(series_lists) != len(param2val_list):
+        raise ValueError(f'main_batch() returned results for {len(series_lists)} '
+                         f'instead of {len(param2val_list)} configurations')
+
+    for param2val, series_list, code_fingerprint in zip(param2val_list, series_lists,
+                                                        code_fingerprints or [None] * len(param2val_list)):
+        finish_job(param2val, series_list, runs_path, duration, cpu_time, code_fingerprint)
+
+
+def serve(reports_fd: int,
+          ) -> None:
+    """
+    run jobs sent by the watcher, one path to a pickled param2val per line on stdin.
+    the job module is imported only once, so that it can keep e.g. datasets in memory across jobs.
+    after each job, the exit status is reported to the watcher, and the process exits if the job failed.
+    """
+    with os.fdopen(reports_fd, 'w') as reports:
+        for line in sys.stdin:
+            param2val_path = Path(line.strip())
+            print(f'Running {param2val_path.name} in warm process')
+            try:
+                run_job_on_ludwig_worker(*load_job(param2val_path))
+            except Exception:  # the state of the job module cannot be trusted anymore
+                traceback.print_exc()
+                reports.write('1\n')
+                reports.flush()
+                raise SystemExit(1)
+            reports.write('0\n')
+            reports.flush()
+            if os.environ.get(preemption_env_name):
+                raise SystemExit('Exiting warm process because job was preempted')
 
 
 if __name__ == '__main__':
@@ -84,11 +454,17 @@ if __name__ == '__main__':
 
     # import user's job to execute
     job = importlib.import_module('{}.job'.format(src_name))
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    # keep running jobs sent by the watcher
+    if sys.argv[1:2] == ['--serve']:
+        serve(int(sys.argv[2]))
+        raise SystemExit
 
-    # find jobs
+    # find jobs - the watcher passes a single job if it runs multiple jobs concurrently
     hostname = socket.gethostname()
     pattern = f'{hostname.lower()}_*.pkl'
-    pickled_param2val_paths = list(remote_root_path.glob(pattern))
+    pickled_param2val_paths = [Path(arg) for arg in sys.argv[1:]] or list(remote_root_path.glob(pattern))
     if not pickled_param2val_paths:
         print('No jobs found.')  # that's okay. run.py was triggered which triggered killing of active jobs on worker
     else:
@@ -96,8 +472,24 @@ if __name__ == '__main__':
         for p in pickled_param2val_paths:
             print(p)
 
+    # run jobs passed by the watcher in a single batch, if the job module supports it
+    if len(pickled_param2val_paths) > 1 and sys.argv[1:] and hasattr(job, 'main_batch'):
+        param2val_list, code_fingerprints = zip(*[load_job(p) for p in pickled_param2val_paths])
+        print(f'Running {len(param2val_list)} jobs with main_batch()')
+        run_batch_on_ludwig_worker(list(param2val_list), list(code_fingerprints))
+        pickled_param2val_paths = []
+
     # run all jobs
     for param2val_path in pickled_param2val_paths:
-        with param2val_path.open('rb') as f:
-            param2val = pickle.load(f)
-        run_job_on_ludwig_worker(param2val)
\ No newline at end of file
+        if os.environ.get(preemption_env_name):
+            raise SystemExit('Not running remaining jobs because job was preempted')
+        run_job_on_ludwig_worker(*load_job(param2val_path))
+
+    # pull jobs from shared queue until it is empty
+    if not sys.argv[1:]:
+        queue_path = remote_root_path / queue_name
+        lease_path = claim_job(queue_path) if queue_path.exists() else None
+        while lease_path is not None and not os.environ.get(preemption_env_name):
+            print(f'Claimed {lease_path.name}')
+            run_job_from_queue(lease_path)
+            lease_path = claim_job(queue_path)
\ No newline at end of file
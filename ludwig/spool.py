@@ -0,0 +1,48 @@
+"""
+Jobs save results to a spool folder on the local disk of a worker, so that the next job can start immediately.
+The watcher ships spooled results to the shared drive in the background.
+Because the spool is on disk, results that have not been shipped when the watcher stops are shipped after restart.
+"""
+from pathlib import Path
+import json
+import shutil
+import os
+from typing import List
+
+from ludwig import config
+
+
+def find_spooled_jobs(spool_path: Path,
+                      ) -> List[Path]:
+    """return marker files of completely spooled jobs, oldest first"""
+    res = []
+    for marker_path in spool_path.glob('*.json'):
+        try:
+            res.append((marker_path.stat().st_mtime, marker_path))
+        except FileNotFoundError:  # shipped in the meantime
+            continue
+    return [marker_path for mtime, marker_path in sorted(res)]
+
+
+def ship(marker_path: Path,
+         ) -> Path:
+    """
+    copy a spooled job folder to a hidden folder in runs, and rename it once it is complete.
+    renaming is atomic, so that a job folder in runs is never incomplete.
+    the spooled job folder is only removed after renaming, so that interrupted shipping can be repeated.
+    """
+    with marker_path.open('r') as f:
+        dst = Path(json.load(f)['job_path'])
+    src = marker_path.parent / marker_path.stem
+
+    if not dst.exists():  # otherwise, shipping was interrupted after renaming
+        partial_path = dst.parent.parent / config.Constants.partial / src.name
+        if partial_path.exists():  # left over from interrupted shipping
+            shutil.rmtree(str(partial_path))
+        shutil.copytree(str(src), str(partial_path))
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(str(partial_path), str(dst))
+
+    shutil.rmtree(str(src))
+    marker_path.unlink()
+    return dst
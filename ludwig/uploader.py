@@ -3,16 +3,23 @@ The Uploader is used to submit jobs to one or more workers at the UIUC Learning
 An sftp-client library is used to upload code files to each machine.
 """
 from pathlib import Path
+import os
 import pysftp
 import platform
 import psutil
 import pickle
-from typing import Union, Optional
+import time
+import json
+import yaml
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Optional, Iterable, Callable, Dict, Any
 
 from ludwig import config
 from ludwig import print_ludwig
 from ludwig import run
 from ludwig.job import Job
+from ludwig.manifest import make_manifest, load_ignore_patterns, ignore_file_name
 
 
 class Uploader:
@@ -25,6 +32,9 @@ class Uploader:
         self.src_name = src_name
         self.runs_path = self.project_path / 'runs'
         self.worker2ip = self.make_worker2ip()
+        self.worker2sftp = {}  # one connection per worker, shared by start_jobs() and sync_src()
+        self.local_manifest = None
+        self.manifest_lock = threading.Lock()
 
     @staticmethod
     def make_worker2ip():
@@ -45,6 +55,130 @@ class Uploader:
                     res[h] = ip
         return res
 
+    def connect(self,
+                worker: str,
+                ) -> pysftp.Connection:
+        """return open sftp connection to worker, creating it only if it does not exist yet"""
+        if worker not in self.worker2sftp:
+            research_data_path = self.project_path.parent
+            private_key_path = research_data_path / '.ludwig' / 'id_rsa'
+            self.worker2sftp[worker] = pysftp.Connection(username='ludwig',
+                                                         host=self.worker2ip[worker],
+                                                         private_key=str(private_key_path))
+        return self.worker2sftp[worker]
+
+    def close(self) -> None:
+        for sftp in self.worker2sftp.values():
+            sftp.close()
+        self.worker2sftp.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run_on_workers(self,
+                       method: Callable[[str], None],
+                       workers: Iterable[str],
+                       ) -> None:
+        """
+        call method (e.g. self.start_jobs) for each worker concurrently, so that total latency is that of slowest worker.
+        errors are collected per worker, and raised after all workers are done.
+        """
+        workers = sorted(workers)
+        if not workers:
+            return
+
+        def timed(worker: str) -> float:
+            start = time.time()
+            method(worker)
+            return time.time() - start
+
+        start = time.time()
+        worker2future = {}
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            for worker in workers:
+                worker2future[worker] = executor.submit(timed, worker)
+        total_duration = time.time() - start
+
+        # summary
+        worker2error = {}
+        print_ludwig(f'Summary of {method.__name__}:')
+        for worker, future in worker2future.items():
+            error = future.exception()
+            if error is None:
+                print_ludwig(f'{worker:<8} done in {future.result():>6.1f} sec')
+            else:
+                worker2error[worker] = error
+                print_ludwig(f'{worker:<8} failed: {error!r}')
+        print_ludwig(f'{method.__name__} took {total_duration:.1f} sec for {len(workers)} worker(s)')
+
+        if worker2error:
+            raise RuntimeError(f'{method.__name__} failed on {", ".join(worker2error)}')
+
+    def make_local_manifest(self) -> Dict[str, str]:
+        """hash source code once per submission, not once per worker"""
+        with self.manifest_lock:
+            if self.local_manifest is None:
+                src_path = Path(self.src_name).resolve()
+                ignore_patterns = load_ignore_patterns([Path(ignore_file_name), src_path / ignore_file_name])
+                self.local_manifest = make_manifest(src_path, ignore_patterns)
+        return self.local_manifest
+
+    def sync_src(self,
+                 worker: str,
+                 remote_path: str,
+                 ) -> None:
+        """
+        upload only files that changed since last upload, and remove files that no longer exist locally.
+        a manifest of the uploaded files is stored in remote_path.
+
+        pysftp.Connection.put_r() is not used because it changes the working directory of the whole process,
+         which is not safe when uploading to multiple workers concurrently.
+        """
+        sftp = self.connect(worker)
+        local_path = Path(self.src_name).resolve()
+        local_manifest = self.make_local_manifest()
+        remote_manifest_path = f'{remote_path}/{config.Remote.manifest_name}'
+
+        # load manifest of previous upload
+        try:
+            with sftp.open(remote_manifest_path, 'r') as f:
+                remote_manifest = json.loads(f.read())
+        except (IOError, ValueError):  # first upload or corrupt manifest
+            remote_manifest = {}
+
+        changed = [rel_path for rel_path, h in local_manifest.items() if remote_manifest.get(rel_path) != h]
+        stale = [rel_path for rel_path in remote_manifest if rel_path not in local_manifest]
+        if not changed and not stale:
+            print_ludwig(f'Source code on {worker} is up to date')
+            return
+
+        # remove manifest first - if upload is interrupted, all files are uploaded next time
+        if remote_manifest:
+            sftp.remove(remote_manifest_path)
+
+        made_dirs = set()
+        for rel_path in changed:
+            remote_dir = '/'.join([remote_path] + rel_path.split('/')[:-1])
+            if remote_dir not in made_dirs:
+                sftp.makedirs(remote_dir)
+                made_dirs.add(remote_dir)
+            sftp.put(localpath=str(local_path / rel_path),
+                     remotepath=f'{remote_path}/{rel_path}')
+        for rel_path in stale:
+            try:
+                sftp.remove(f'{remote_path}/{rel_path}')
+            except IOError:  # already removed
+                pass
+
+        sftp.makedirs(remote_path)
+        with sftp.open(remote_manifest_path, 'w') as f:
+            f.write(json.dumps(local_manifest))
+
+        print_ludwig(f'Uploaded {len(changed)} and removed {len(stale)} file(s) on {worker}')
+
     def check_disk_space(self, verbose=False):
         if platform.system() in {'Linux'}:
             p = self.project_path.parent
@@ -74,6 +208,7 @@ class Uploader:
         p = self.project_path / f'{worker}_{unique_id}.pkl'
         with p.open('wb') as f:
             pickle.dump(job.param2val, f)
+            pickle.dump(job.code_fingerprint, f)  # loaded separately by run.load_job
 
         # console
         print_ludwig(f'Parameter configuration for {worker} saved to disk')
@@ -81,6 +216,51 @@ class Uploader:
             print(job)
             print()
 
+    def save_options(self,
+                     options: Dict[str, Any],
+                     ) -> None:
+        """save options that tell workers how to run jobs of the project, e.g. whether to use warm processes"""
+        p = self.project_path / config.Constants.options
+        tmp_path = p.parent / f'.{p.name}.tmp'
+        with tmp_path.open('w') as f:
+            yaml.dump(options, f, default_flow_style=False)
+        os.replace(str(tmp_path), str(p))
+
+    def clear_queue(self) -> None:
+        """remove jobs of previous submission from shared queue, including jobs that were claimed"""
+        queue_path = self.project_path / config.Constants.queue
+        for folder in [queue_path, queue_path / 'leases', queue_path / 'failed']:
+            for pkl_path in folder.glob('*.pkl'):
+                pkl_path.unlink()
+        (queue_path / 'leases').mkdir(parents=True, exist_ok=True)
+
+    def to_queue(self,
+                 job: Job,
+                 priority: int = 0,  # jobs are claimed in order of priority, starting with 0
+                 verbose: bool = False,
+                 ) -> None:
+        """
+        saves parameter configuration for a single job to the shared queue.
+        This allows any idle Ludwig worker to claim the job
+        """
+        if not job.is_ready():
+            raise SystemExit('Cannot save job. Job is not ready. Update job.param2val')
+
+        # write to temporary file first - workers must not claim a partially written job
+        unique_id = f'{priority:0>6}_{job.param2val["param_name"]}_{job.param2val["job_name"]}'
+        queue_path = self.project_path / config.Constants.queue
+        tmp_path = queue_path / f'.{unique_id}.tmp'
+        with tmp_path.open('wb') as f:
+            pickle.dump(job.param2val, f)
+            pickle.dump(job.code_fingerprint, f)  # loaded separately by run.load_job
+        os.replace(str(tmp_path), str(queue_path / f'{unique_id}.pkl'))
+
+        # console
+        print_ludwig('Parameter configuration saved to shared queue')
+        if verbose:
+            print(job)
+            print()
+
     def start_jobs(self,
                    worker: str,
                    ) -> None:
@@ -100,26 +280,17 @@ class Uploader:
 
         # -------------------------------------- prepare paths
 
-        if not self.project_path.exists():
-            self.project_path.mkdir()
-        if not self.runs_path.exists():
-            self.runs_path.mkdir(parents=True)
+        self.runs_path.mkdir(parents=True, exist_ok=True)  # called concurrently for multiple workers
 
         remote_path = f'{config.WorkerDirs.watched.name}/{self.src_name}'
 
         # ------------------------------------- sftp
 
-        # connect via sftp
-        research_data_path = self.project_path.parent
-        private_key_path = research_data_path / '.ludwig' / 'id_rsa'
-        sftp = pysftp.Connection(username='ludwig',
-                                 host=self.worker2ip[worker],
-                                 private_key=str(private_key_path))
+        sftp = self.connect(worker)
 
         # upload code files
         print_ludwig(f'Will upload {self.src_name} to {remote_path} on {worker}')
-        sftp.makedirs(remote_path)
-        sftp.put_r(localpath=self.src_name, remotepath=remote_path)
+        self.sync_src(worker, remote_path)
 
         # upload run.py
         run_file_name = f'run_{self.project_name}.py'
@@ -147,19 +318,11 @@ class Uploader:
 
         # -------------------------------------- prepare paths
 
-        if not self.project_path.exists():
-            self.project_path.mkdir()
-        if not self.runs_path.exists():
-            self.runs_path.mkdir(parents=True)
+        self.runs_path.mkdir(parents=True, exist_ok=True)  # called concurrently for multiple workers
 
         # ------------------------------------- sftp
 
-        # connect via sftp
-        research_data_path = self.project_path.parent
-        private_key_path = research_data_path / '.ludwig' / 'id_rsa'
-        sftp = pysftp.Connection(username='ludwig',
-                                 host=self.worker2ip[worker],
-                                 private_key=str(private_key_path))
+        sftp = self.connect(worker)
 
         # upload run.py - this triggers watcher which kills active jobs associated with project
         run_file_name = f'run_{self.project_name}.py'
@@ -0,0 +1,69 @@
+"""
+Compare memory used by concurrent jobs that load the same array,
+ either each into its own memory (np.load), or as a shared memory map (ludwig.artifacts.load_artifact).
+
+usage: python3 benchmark_artifacts.py --num_readers 4 --megabytes 1024
+
+USS is memory used only by one process, PSS splits shared pages evenly across the processes that map them.
+"""
+from pathlib import Path
+import argparse
+import multiprocessing as mp
+import tempfile
+import sys
+import numpy as np
+import psutil
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from ludwig.artifacts import load_artifact
+
+
+def make_corpus(num_bytes):
+    return {'tokens': np.random.RandomState(0).randint(0, 4096, size=num_bytes // 4, dtype=np.int32)}
+
+
+def read(mode, project_path, npy_path, num_bytes, barrier, q):
+    if mode == 'copy':
+        tokens = np.load(str(npy_path))
+    else:
+        tokens = load_artifact(project_path, 'corpus', lambda: make_corpus(num_bytes))['tokens']
+    checksum = int(tokens.sum(dtype=np.int64))  # touch every page
+    barrier.wait()  # measure while all readers hold the array
+    info = psutil.Process().memory_full_info()
+    q.put((checksum, info.rss, info.uss, getattr(info, 'pss', float('nan'))))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_readers', default=4, type=int)
+    parser.add_argument('--megabytes', default=1024, type=int)
+    namespace = parser.parse_args()
+    num_bytes = namespace.megabytes * 1024 ** 2
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_path = Path(tmp_dir) / 'Project'
+        npy_path = Path(tmp_dir) / 'tokens.npy'
+        np.save(str(npy_path), make_corpus(num_bytes)['tokens'])
+        load_artifact(project_path, 'corpus', lambda: make_corpus(num_bytes))  # as if made by a previous job
+
+        print('{:<8} {:>10} {:>12} {:>12} {:>12}'.format('mode', 'readers', 'RSS (MiB)', 'USS (MiB)', 'PSS (MiB)'))
+        for mode in ['copy', 'memmap']:
+            barrier = mp.Barrier(namespace.num_readers)
+            q = mp.Queue()
+            processes = [mp.Process(target=read, args=(mode, project_path, npy_path, num_bytes, barrier, q))
+                         for _ in range(namespace.num_readers)]
+            for p in processes:
+                p.start()
+            res = [q.get() for _ in processes]
+            for p in processes:
+                p.join()
+            assert len({r[0] for r in res}) == 1, 'Readers saw different data'
+            total_rss, total_uss, total_pss = [sum(r[i] for r in res) / 1024 ** 2 for i in [1, 2, 3]]
+            print('{:<8} {:>10} {:>12.0f} {:>12.0f} {:>12.0f}'.format(
+                mode, namespace.num_readers, total_rss, total_uss, total_pss))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,22 @@ if [[ "$#" -ne 1 ]]
 fi
 
 
+# seconds that jobs are given to save a checkpoint - should match config.Watcher.grace_period
+grace_period=120
+
 for hostname in bengio hebb hinton hoff norman pitts hawkins;  # TODO yash is using lecun
 do
-    echo Killing run_${1}.py on ${hostname}
-    ssh ${hostname} "pkill -9 -f -c run_${1}.py"
+    echo Stopping run_${1}.py on ${hostname}
+    ssh ${hostname} "pkill -TERM -f -c run_${1}.py"
 
 echo
 done
+
+echo Waiting ${grace_period} seconds for jobs to save checkpoints
+sleep ${grace_period}
+
+for hostname in bengio hebb hinton hoff norman pitts hawkins;
+do
+    echo Killing run_${1}.py on ${hostname}
+    ssh ${hostname} "pkill -9 -f -c run_${1}.py"
+done
@@ -26,6 +26,7 @@ setup(
         'console_scripts': [
             'ludwig=ludwig.__main__:submit',
             'ludwig-status=ludwig.__main__:status',
+            'ludwig-optimize=ludwig.optimize:main',
             'ludwig-add-ssh-config=ludwig.__main__:add_ssh_config'
         ]
     }
@@ -0,0 +1,56 @@
+import unittest
+import tempfile
+import numpy as np
+from pathlib import Path
+
+from ludwig import data_cache
+from ludwig.artifacts import load_artifact, get_artifacts_path
+
+
+class MyTest(unittest.TestCase):
+
+    def test_load_artifact(self):
+        """arrays must be made once per key, and be loaded as read-only memory maps"""
+        num_calls = []
+
+        def make():
+            num_calls.append(1)
+            return {'tokens': np.arange(10, dtype=np.int32), 'mask': np.ones((2, 5), dtype=bool)}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            project_path = Path(tmp_dir) / 'Project'
+            arrays = load_artifact(project_path, 'corpus', make, key={'vocab_size': 10})
+            arrays = load_artifact(project_path, 'corpus', make, key={'vocab_size': 10})
+            self.assertEqual(len(num_calls), 1)
+            self.assertIsInstance(arrays['tokens'], np.memmap)
+            self.assertFalse(arrays['tokens'].flags.writeable)
+            np.testing.assert_array_equal(arrays['tokens'], np.arange(10))
+            self.assertEqual(arrays['mask'].shape, (2, 5))
+
+            load_artifact(project_path, 'corpus', make, key={'vocab_size': 20})
+            self.assertEqual(len(num_calls), 2)
+
+    def test_evict(self):
+        """least recently used artifacts must be evicted, unless they are used by a running job"""
+        def make():
+            return {'tokens': np.arange(10, dtype=np.int8)}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            project_path = Path(tmp_dir) / 'Project'
+            try:
+                for vocab_size in [10, 20, 30]:  # each artifact is a .npy file of 138 bytes
+                    load_artifact(project_path, 'corpus', make, key=vocab_size, max_bytes=200)
+                    if vocab_size == 10:  # job that used the first artifact finished
+                        key, = data_cache._key2use_file
+                        data_cache._key2use_file.pop(key).close()
+                artifacts_path = get_artifacts_path(project_path)
+                self.assertEqual(len(list(artifacts_path.glob('corpus_*/meta.json'))), 2)
+                self.assertEqual(list(artifacts_path.glob(key + '*')), [])
+            finally:
+                for use_file in data_cache._key2use_file.values():
+                    use_file.close()
+                data_cache._key2use_file.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
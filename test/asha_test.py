@@ -0,0 +1,83 @@
+import unittest
+import tempfile
+import time
+import yaml
+
+from pathlib import Path
+
+from ludwig import config
+from ludwig.asha import Reporter, make_rungs, is_promoted, start_sweep, load_sweep_id
+
+
+class MyTest(unittest.TestCase):
+
+    def test_rungs(self):
+        self.assertEqual(make_rungs(min_step=10, eta=3, max_step=300), [10, 30, 90, 270])
+
+    def test_is_promoted(self):
+        """only the top 1/eta must be promoted, but at least the best"""
+        self.assertTrue(is_promoted(0.5, [0.5], eta=3, mode='max'))
+        self.assertFalse(is_promoted(0.4, [0.5, 0.4], eta=3, mode='max'))
+        self.assertTrue(is_promoted(0.1, [0.1, 0.4, 0.5, 0.6, 0.7, 0.8], eta=3, mode='min'))
+        self.assertTrue(is_promoted(0.4, [0.1, 0.4, 0.5, 0.6, 0.7, 0.8], eta=3, mode='min'))
+        self.assertFalse(is_promoted(0.5, [0.1, 0.4, 0.5, 0.6, 0.7, 0.8], eta=3, mode='min'))
+
+    def test_report(self):
+        """a job that is worse than previous jobs at a rung must stop, and return its partial series"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            num_steps = []
+            for n, accuracy in enumerate([0.9, 0.8, 0.7]):
+                param2val = {'project_path': tmp_dir, 'save_path': 'does-not-exist',
+                             'param_name': f'param_00{n}', 'job_name': 'job_num0'}
+                reporter = Reporter(param2val, metric='accuracy', mode='max', min_step=2, eta=2, max_step=10)
+                for step in range(10):
+                    if reporter.report(step, accuracy):
+                        break
+                num_steps.append(len(reporter.series))
+
+            self.assertEqual(num_steps, [10, 3, 3])
+
+    def test_new_sweep(self):
+        """jobs of a new submission must not be stopped because of values saved by previous submissions"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            num_steps = []
+            for n, accuracy in enumerate([0.9, 0.8]):
+                with (Path(tmp_dir) / config.Constants.options).open('w') as f:
+                    yaml.dump({'sweep_id': start_sweep(Path(tmp_dir))}, f)  # as saved by the uploader
+                time.sleep(1)  # sweep ids have a resolution of 1 second
+                param2val = {'project_path': tmp_dir, 'save_path': 'does-not-exist',
+                             'param_name': f'param_00{n}', 'job_name': 'job_num0'}
+                reporter = Reporter(param2val, metric='accuracy', mode='max', min_step=2, eta=2, max_step=10)
+                for step in range(10):
+                    if reporter.report(step, accuracy):
+                        break
+                num_steps.append(len(reporter.series))
+
+            self.assertEqual(num_steps, [10, 10])
+
+    def test_repetitions_count_once(self):
+        """repetitions of a configuration must not outnumber other configurations at a rung"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for job_name, accuracy in [('job_num0', 0.9), ('job_num1', 0.9), ('job_num2', 0.9)]:
+                param2val = {'project_path': tmp_dir, 'save_path': 'does-not-exist',
+                             'param_name': 'param_000', 'job_name': job_name}
+                Reporter(param2val, metric='accuracy', min_step=2, eta=2).report(2, accuracy)
+            param2val = {'project_path': tmp_dir, 'save_path': 'does-not-exist',
+                         'param_name': 'param_001', 'job_name': 'job_num0'}
+            reporter = Reporter(param2val, metric='accuracy', min_step=2, eta=2)
+            self.assertEqual(sorted(reporter.save_rung_value(2, 0.8)), [0.8, 0.9])
+
+    def test_sweep_id(self):
+        """starting a sweep must not create files, and jobs without a saved sweep id must use the default sweep"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sweep_id = start_sweep(Path(tmp_dir))
+            self.assertEqual(list(Path(tmp_dir).iterdir()), [])
+            self.assertEqual(load_sweep_id(Path(tmp_dir)), 'default')
+
+            with (Path(tmp_dir) / config.Constants.options).open('w') as f:
+                yaml.dump({'max_jobs_per_process': 1, 'sweep_id': sweep_id}, f)
+            self.assertEqual(load_sweep_id(Path(tmp_dir)), sweep_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import types
+from unittest import mock
+from pathlib import Path
+import pandas as pd
+import yaml
+
+from ludwig import config
+from ludwig import run
+
+
+def main_batch(param2val_list):
+    """vectorized across learning rates"""
+    return [[pd.Series([lr, lr * 2], name='loss')] for lr in (p['lr'] for p in param2val_list)]
+
+
+class MyTest(unittest.TestCase):
+
+    def test_run_batch(self):
+        """results of each configuration in a batch must be saved separately"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            project_path = Path(tmp_dir) / 'project'
+            param2val_list = []
+            for n, lr in enumerate([0.1, 0.2, 0.3]):
+                param2val_list.append({'lr': lr,
+                                       'param_name': f'param_{n}',
+                                       'job_name': 'job_num0',
+                                       'save_path': str(Path(tmp_dir) / 'saves' / f'param_{n}')})
+            with mock.patch.object(run, 'remote_root_path', project_path, create=True), \
+                    mock.patch.object(run, 'job', types.SimpleNamespace(main_batch=main_batch), create=True):
+                run.run_batch_on_ludwig_worker(param2val_list)
+
+            for n, lr in enumerate([0.1, 0.2, 0.3]):
+                job_path = project_path / config.Constants.runs / f'param_{n}' / 'job_num0'
+                df = pd.read_csv(job_path / 'loss.csv', index_col=0)
+                self.assertEqual(df['loss'].tolist(), [lr, lr * 2])
+                self.assertTrue((job_path.parent / 'param2val.yaml').exists())
+                with (job_path / config.Constants.job_info).open('r') as f:
+                    job_info = yaml.load(f, Loader=yaml.FullLoader)
+                self.assertGreaterEqual(job_info['cpu_time'], 0)
+                self.assertGreaterEqual(job_info['num_cpus'], 1)
+
+    def test_run_batch_wrong_length(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            param2val = {'param_name': 'param_0', 'job_name': 'job_num0', 'save_path': str(Path(tmp_dir) / 'save')}
+            with mock.patch.object(run, 'remote_root_path', Path(tmp_dir) / 'project', create=True), \
+                    mock.patch.object(run, 'job', types.SimpleNamespace(main_batch=lambda p: []), create=True), \
+                    self.assertRaises(ValueError):
+                run.run_batch_on_ludwig_worker([param2val])
+
+
+if __name__ == '__main__':
+    unittest.main()
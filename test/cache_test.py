@@ -0,0 +1,58 @@
+import unittest
+import tempfile
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from ludwig import config
+from ludwig.cache import cached
+
+
+class MyTest(unittest.TestCase):
+
+    def test_cached(self):
+        """a result must be computed once per key, also when requested concurrently"""
+        num_calls = []
+
+        @cached(param_names=['vocab_size'])
+        def make_vocab(param2val):
+            num_calls.append(1)
+            return np.arange(param2val['vocab_size'])
+
+        poll_interval = config.Cache.poll_interval
+        config.Cache.poll_interval = 0.01
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                param2vals = [{'project_path': tmp_dir, 'vocab_size': 4, 'learning_rate': lr} for lr in range(8)]
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    results = list(executor.map(make_vocab, param2vals))
+                self.assertEqual(len(num_calls), 1)
+                for res in results:
+                    np.testing.assert_array_equal(res, np.arange(4))
+
+                make_vocab({'project_path': tmp_dir, 'vocab_size': 5})
+                self.assertEqual(len(num_calls), 2)
+                self.assertEqual(len(list((Path(tmp_dir) / config.Constants.cache).glob('make_vocab_*'))), 2)
+        finally:
+            config.Cache.poll_interval = poll_interval
+
+    def test_corrupt(self):
+        """a result that cannot be loaded is computed again"""
+        num_calls = []
+
+        @cached(param_names=['vocab_size'])
+        def make_vocab(param2val):
+            num_calls.append(1)
+            return list(range(param2val['vocab_size']))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            param2val = {'project_path': tmp_dir, 'vocab_size': 4}
+            make_vocab(param2val)
+            result_path, = (Path(tmp_dir) / config.Constants.cache).glob('make_vocab_*/result.pkl')
+            result_path.write_bytes(b'not a pickle')
+            self.assertEqual(make_vocab(param2val), [0, 1, 2, 3])
+            self.assertEqual(len(num_calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import os
+from pathlib import Path
+
+from ludwig import config
+from ludwig import data_cache
+from ludwig.data_cache import cached_path
+
+
+class MyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_cache = config.WorkerDirs.data_cache
+        config.WorkerDirs.data_cache = Path(self.tmp_dir.name) / 'cache'
+        config.WorkerDirs.data_cache.mkdir()
+
+    def tearDown(self):
+        for use_file in data_cache._key2use_file.values():
+            use_file.close()
+        data_cache._key2use_file.clear()
+        config.WorkerDirs.data_cache = self.data_cache
+        self.tmp_dir.cleanup()
+
+    def test_cached_path(self):
+        """local copy must be identical to the original, and be replaced when the original changes"""
+        src = Path(self.tmp_dir.name) / 'corpus.txt'
+        src.write_text('a b c')
+        res = cached_path(src)
+        self.assertNotEqual(res, src)
+        self.assertEqual(res.read_text(), 'a b c')
+        self.assertEqual(cached_path(src, verify=True), res)
+
+        src.write_text('a b c d')
+        os.utime(str(src), (0, 0))
+        self.assertEqual(cached_path(src).read_text(), 'a b c d')
+
+    def test_evict(self):
+        """least recently used copies must be evicted, unless they are in use"""
+        paths = []
+        for name in ['a', 'b', 'c']:
+            src = Path(self.tmp_dir.name) / name
+            src.mkdir()
+            (src / 'data.txt').write_text('0123456789')
+            paths.append(src)
+
+        res_a = cached_path(paths[0], max_bytes=20)
+        data_cache._key2use_file.pop(res_a.parent.name).close()  # job that used a finished
+        res_b = cached_path(paths[1], max_bytes=20)
+        res_c = cached_path(paths[2], max_bytes=20)
+        self.assertFalse(res_a.exists())
+        self.assertEqual(sorted(p.name for p in config.WorkerDirs.data_cache.glob(res_a.parent.name + '*')), [])
+        self.assertTrue(res_b.exists())
+        self.assertEqual((res_c / 'data.txt').read_text(), '0123456789')
+
+        # b and c are in use
+        self.assertEqual(cached_path(paths[0], max_bytes=20), paths[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
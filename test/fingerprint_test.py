@@ -0,0 +1,115 @@
+import unittest
+import tempfile
+import time
+import os
+from unittest import mock
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.fingerprint import CodeFingerprint
+from ludwig.index import ParamIndex
+from ludwig.job import Job
+from ludwig.uploader import Uploader
+
+
+class MyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.local_cache_dir = tempfile.TemporaryDirectory()
+        self.local_cache = config.LocalDirs.cache
+        config.LocalDirs.cache = Path(self.local_cache_dir.name)
+
+    def tearDown(self):
+        config.LocalDirs.cache = self.local_cache
+        self.local_cache_dir.cleanup()
+
+    def test_depends_on(self):
+        """a change to a module must only change fingerprints of configurations that use it"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = Path(tmp_dir) / 'project'
+            src_path.mkdir()
+            (src_path / 'job.py').write_text('def main(param2val):\n    return []\n')
+            (src_path / 'lstm.py').write_text("ludwig_depends_on = {'model': ['lstm']}\n")
+            lstm = {'model': 'lstm'}
+            gru = {'model': 'gru'}
+            before = CodeFingerprint([src_path])
+
+            (src_path / 'lstm.py').write_text("ludwig_depends_on = {'model': ['lstm']}\nnum_layers = 2\n")
+            after = CodeFingerprint([src_path])
+            self.assertNotEqual(before(lstm), after(lstm))
+            self.assertEqual(before(gru), after(gru))
+
+            (src_path / 'job.py').write_text('def main(param2val):\n    return None\n')
+            self.assertNotEqual(after(gru), CodeFingerprint([src_path])(gru))
+
+    def test_params_excluded(self):
+        """editing param2requests must not change fingerprints, so that completed repetitions are still counted"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = Path(tmp_dir) / 'project'
+            src_path.mkdir()
+            (src_path / 'job.py').write_text('def main(param2val):\n    return []\n')
+            (src_path / 'params.py').write_text("param2requests = {'learning_rate': [0.1]}\n")
+            param2val = {'learning_rate': 0.1, 'param_name': 'param_001'}
+            before = CodeFingerprint([src_path], exclude=[src_path / 'params.py'])
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            run.save_job_files(dict(param2val, job_name='job_num0', save_path='does-not-exist'), [], runs_path,
+                               code_fingerprint=before(param2val))
+
+            (src_path / 'params.py').write_text("param2requests = {'learning_rate': [0.1, 0.2]}\n")
+            after = CodeFingerprint([src_path], exclude=[src_path / 'params.py'])
+            self.assertEqual(before(param2val), after(param2val))
+            job = Job(param2val.copy(), code_fingerprint=after(param2val))
+            self.assertEqual(job.calc_num_needed(runs_path, reps=1), 0)
+
+    def test_calc_num_needed(self):
+        """only jobs executed with the same code, or without a fingerprint, must be counted"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, code_fingerprint in enumerate([None, 'a', 'b']):
+                param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': f'job_num{n}',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path, code_fingerprint=code_fingerprint)
+
+            job = Job({'learning_rate': 0.1, 'param_name': 'param_001'}, code_fingerprint='b')
+            self.assertEqual(job.calc_num_needed(runs_path, reps=3), 1)
+            job.code_fingerprint = None
+            self.assertEqual(job.calc_num_needed(runs_path, reps=3), 0)
+
+    def test_calc_num_needed_cached(self):
+        """fingerprints must be loaded from the local cache if the param folder did not change"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, code_fingerprint in enumerate(['a', 'b']):
+                param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': f'job_num{n}',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path, code_fingerprint=code_fingerprint)
+            past = time.time() - 120
+            os.utime(str(runs_path / 'param_001'), (past, past))
+
+            job = Job({'learning_rate': 0.1, 'param_name': 'param_001'}, code_fingerprint='b')
+            self.assertEqual(job.calc_num_needed(runs_path, reps=2, param_index=ParamIndex(runs_path)), 1)
+            with mock.patch('yaml.load', side_effect=AssertionError('job_info.yaml must not be loaded')):
+                self.assertEqual(job.calc_num_needed(runs_path, reps=2, param_index=ParamIndex(runs_path)), 1)
+
+    def test_fingerprint_not_in_param2val(self):
+        """the fingerprint is pickled next to param2val, and must not reach the user's job or param2val.yaml"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            project_path = Path(tmp_dir) / 'project'
+            project_path.mkdir()
+            job = Job({'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': 'job_num0',
+                       'project_path': str(project_path), 'save_path': 'does-not-exist'}, code_fingerprint='b')
+            with mock.patch.object(Uploader, 'make_worker2ip', return_value={}):  # no ssh config needed
+                Uploader(project_path, 'project').to_disk(job, 'hoff')
+            param2val, code_fingerprint = run.load_job(next(project_path.glob('*.pkl')))
+            self.assertEqual(code_fingerprint, 'b')
+            self.assertNotIn('code_fingerprint', param2val)
+
+            runs_path = project_path / config.Constants.runs
+            run.save_job_files(param2val, [], runs_path, code_fingerprint=code_fingerprint)
+            self.assertEqual(Job.load_code_fingerprint(runs_path / 'param_001' / 'job_num0'), 'b')
+            self.assertNotIn('code_fingerprint', (runs_path / 'param_001' / 'param2val.yaml').read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import json
+import tempfile
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.heartbeats import load_heartbeats, format_heartbeat, find_running_jobs
+
+
+def make_heartbeat(t):
+    return {'hostname': 'hoff',
+            'time': t,
+            'running': [{'pid': 1, 'project': 'Example', 'user': 'alice', 'jobs': [['param_001', 'job_num0']],
+                         'elapsed': 3900, 'is_preempted': False}],
+            'num_pending': 2,
+            'user2status': {'alice': {'num_running': 1, 'num_pending': 2, 'max_wait': 120}},
+            'last_error': None,
+            'cpu_percent': 50.0,
+            'available_memory': 8 * 1024 ** 3,
+            'total_memory': 32 * 1024 ** 3,
+            'gpu_free_memory': None}
+
+
+class MyTest(unittest.TestCase):
+
+    def test_job_status_path(self):
+        """run.py cannot import ludwig, so it keeps its own copy of the path"""
+        self.assertEqual(run.worker_job_status_path, config.WorkerDirs.job_status)
+
+    def test_load_heartbeats(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with (Path(tmp_dir) / 'hoff.json').open('w') as f:
+                json.dump(make_heartbeat(100.0), f)
+            (Path(tmp_dir) / 'norman.json').write_text('{"time": ')  # partially written by old watcher
+            heartbeats = load_heartbeats(Path(tmp_dir), ['hoff', 'norman', 'hebb'])
+        self.assertEqual(heartbeats[0]['num_pending'], 2)
+        self.assertIsNone(heartbeats[1])
+        self.assertIsNone(heartbeats[2])
+
+    def test_format_heartbeat(self):
+        res = format_heartbeat('hoff', make_heartbeat(100.0), now=110.0)
+        self.assertIn('OK', res)
+        self.assertIn('param_001/job_num0', res)
+        self.assertIn('1h05min', res)
+        self.assertIn('STALE', format_heartbeat('hoff', make_heartbeat(100.0), now=100.0 + 3600))
+        self.assertIn('NO HEARTBEAT', format_heartbeat('hoff', None))
+
+    def test_find_running_jobs(self):
+        """only jobs of the project that are not preempted, on workers with a recent heartbeat, are running"""
+        heartbeat = make_heartbeat(100.0)
+        heartbeat['running'].append({'pid': 2, 'project': 'Example', 'user': 'alice',
+                                     'jobs': [['param_002', 'job_num0']], 'elapsed': 10, 'is_preempted': True})
+        heartbeat['running'].append({'pid': 3, 'project': 'Other', 'user': 'bob',
+                                     'jobs': [['param_001', 'job_num0']], 'elapsed': 10, 'is_preempted': False})
+        heartbeats = [heartbeat, make_heartbeat(100.0 - 3600), None]
+        self.assertEqual(find_running_jobs(heartbeats, ['hoff', 'norman', 'hebb'], 'Example', now=110.0),
+                         {'param_001': ['hoff']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import tempfile
+import shutil
+import time
+import os
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.index import ParamIndex
+from ludwig.job import Job
+
+
+class MyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.local_cache_dir = tempfile.TemporaryDirectory()
+        self.local_cache = config.LocalDirs.cache
+        config.LocalDirs.cache = Path(self.local_cache_dir.name)
+
+    def tearDown(self):
+        config.LocalDirs.cache = self.local_cache
+        self.local_cache_dir.cleanup()
+
+    def test_added_param_names(self):
+        """run.py cannot import ludwig, so it keeps its own copy of added_param_names"""
+        self.assertEqual(run.added_param_names, config.Constants.added_param_names)
+
+    def test_update_param_name(self):
+        """
+        configurations saved to runs must be found via the index, new configurations must get a new param_name
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            param2val = {'learning_rate': 0.1, 'configuration': (1, 0)}
+
+            job = Job(param2val.copy())
+            job.update_param_name(runs_path, num_new=0)
+            self.assertTrue(job.is_new)
+            job.update_job_name(0)
+            run.save_job_files(job.param2val.copy(), [], runs_path)
+
+            # same configuration
+            job = Job(param2val.copy())
+            job.update_param_name(runs_path, num_new=0)
+            self.assertFalse(job.is_new)
+            self.assertEqual(job.param2val['param_name'], 'param_001')
+
+            # different configuration
+            job = Job({'learning_rate': 0.2, 'configuration': (1, 0)})
+            job.update_param_name(runs_path, num_new=0, param_index=ParamIndex(runs_path))
+            self.assertTrue(job.is_new)
+            self.assertEqual(job.param2val['param_name'], 'param_002')
+
+    def test_sync(self):
+        """index must be rebuilt if it is deleted, and must forget param_names that were removed from runs"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, lr in enumerate([0.1, 0.2]):
+                param2val = {'learning_rate': lr, 'param_name': f'param_00{n + 1}', 'job_name': 'job_num0',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path)
+
+            (runs_path.parent / run.param2val_index_name).unlink()
+            param_index = ParamIndex(runs_path)
+            self.assertEqual(param_index.param_names, ['param_001', 'param_002'])
+            self.assertEqual(param_index.find({'learning_rate': 0.2}), 'param_002')
+
+            shutil.rmtree(str(runs_path / 'param_002'))
+            param_index = ParamIndex(runs_path)
+            self.assertEqual(param_index.param_names, ['param_001'])
+            self.assertIsNone(param_index.find({'learning_rate': 0.2}))
+
+    def test_local_cache(self):
+        """index on shared drive must not be read if runs did not change since last sync"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': 'job_num0',
+                         'save_path': 'does-not-exist'}
+            run.save_job_files(param2val, [], runs_path)
+            past = time.time() - 60
+            os.utime(str(runs_path), (past, past))
+            param_index = ParamIndex(runs_path)
+            self.assertTrue(param_index.is_settled)
+            self.assertEqual(param_index.count_jobs(['param_001']), {'param_001': 1})
+
+            (runs_path.parent / run.param2val_index_name).unlink()
+            param_index = ParamIndex(runs_path)
+            self.assertEqual(param_index.find({'learning_rate': 0.1}), 'param_001')
+            self.assertFalse((runs_path.parent / run.param2val_index_name).exists())
+
+    def test_count_deleted(self):
+        """a param folder that is deleted after the index was synced must be skipped when counting jobs"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, lr in enumerate([0.1, 0.2]):
+                param2val = {'learning_rate': lr, 'param_name': f'param_00{n + 1}', 'job_name': 'job_num0',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path)
+            param_index = ParamIndex(runs_path)
+            self.assertEqual(param_index.count_jobs(param_index.param_names), {'param_001': 1, 'param_002': 1})
+
+            shutil.rmtree(str(runs_path / 'param_002'))
+            self.assertEqual(param_index.count_jobs(param_index.param_names), {'param_001': 1})
+
+    def test_load_job_infos(self):
+        """job_info.yaml must only be loaded once, and folders deleted after syncing must be skipped"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, lr in enumerate([0.1, 0.2]):
+                param2val = {'learning_rate': lr, 'param_name': f'param_00{n + 1}', 'job_name': 'job_num0',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path, duration=10.0, code_fingerprint='a')
+            past = time.time() - 120
+            for param_name in ['param_001', 'param_002']:
+                os.utime(str(runs_path / param_name), (past, past))
+            param_index = ParamIndex(runs_path)
+            param_name2job_infos = param_index.load_job_infos(param_index.param_names)
+            self.assertEqual(param_name2job_infos['param_001']['job_num0']['duration'], 10.0)
+            self.assertEqual(param_name2job_infos['param_002']['job_num0']['code_fingerprint'], 'a')
+
+            # job info is loaded from the local cache
+            (runs_path / 'param_001' / 'job_num0' / config.Constants.job_info).unlink()
+            param_index = ParamIndex(runs_path)
+            param_name2job_infos = param_index.load_job_infos(param_index.param_names)
+            self.assertEqual(param_name2job_infos['param_001']['job_num0']['duration'], 10.0)
+
+            shutil.rmtree(str(runs_path / 'param_002'))
+            self.assertEqual(list(param_index.load_job_infos(['param_001', 'param_002'])), ['param_001'])
+
+
+if __name__ == '__main__':
+    unittest.main()
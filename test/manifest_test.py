@@ -0,0 +1,31 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from ludwig.manifest import make_manifest, load_ignore_patterns, ignore_file_name
+
+
+class MyTest(unittest.TestCase):
+
+    def test_make_manifest(self):
+        """ignored files must not be listed, and hashes must change only when content changes"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            (root / 'data').mkdir()
+            (root / '__pycache__').mkdir()
+            (root / 'job.py').write_text('print(1)')
+            (root / 'data' / 'corpus.txt').write_text('big')
+            (root / '__pycache__' / 'job.cpython-37.pyc').write_text('')
+            (root / ignore_file_name).write_text('# data is uploaded separately\ndata/\n')
+
+            ignore_patterns = load_ignore_patterns([root / ignore_file_name])
+            manifest1 = make_manifest(root, ignore_patterns)
+            self.assertEqual(list(manifest1), ['job.py'])
+
+            (root / 'job.py').write_text('print(2)')
+            manifest2 = make_manifest(root, ignore_patterns)
+            self.assertNotEqual(manifest1['job.py'], manifest2['job.py'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import random
+
+from ludwig.requests import ParamGrid, sample_param2vals
+from ludwig.optimize import TPE, choose_startup_strategy, propose_batch
+
+
+class MyTest(unittest.TestCase):
+
+    def test_digits_of(self):
+        grid = ParamGrid({'a': [1, 2, 3], 'b': ['x', 'y']}, {'a': 1, 'b': 'x', 'c': 0})
+        for i in range(grid.size):
+            self.assertEqual(grid.index_of(grid.digits_of(grid[i])), i)
+        self.assertIsNone(grid.digits_of({'a': 4, 'b': 'x', 'c': 0}))
+
+    def test_propose(self):
+        """proposals must be distinct, not executed previously, and concentrated where values are good"""
+        grid = ParamGrid({'a': list(range(10)), 'b': list(range(10))}, {'a': 0, 'b': 0})
+        index2value = {i: -abs(grid[i]['a'] - 7) for i in range(0, grid.size, 3)}  # best at a=7
+        tpe = TPE(grid, mode='max', seed=1)
+        proposals = tpe.propose(index2value, num_proposals=8, exclude=set(index2value))
+
+        self.assertEqual(len(proposals), 8)
+        self.assertEqual(len(set(proposals)), 8)
+        self.assertFalse(set(proposals) & set(index2value))
+        num_good = sum(1 for i in proposals if abs(grid[i]['a'] - 7) <= 1)
+        self.assertGreaterEqual(num_good, 6)
+
+    def test_propose_exhausted(self):
+        grid = ParamGrid({'a': [1, 2]}, {'a': 1})
+        tpe = TPE(grid, mode='min')
+        self.assertEqual(tpe.propose({0: 1.0}, num_proposals=4, exclude={0}), [1])
+        self.assertEqual(tpe.propose({0: 1.0, 1: 0.0}, num_proposals=4, exclude={0, 1}), [])
+
+    def test_startup_strategy(self):
+        """startup configurations must be drawn also if more parameters are varied than Sobol sampling supports"""
+        for num_params, strategy in [(21, 'sobol'), (22, 'lhs')]:
+            param2requests = {f'p{n}': [0, 1] for n in range(num_params)}
+            param2default = {f'p{n}': 0 for n in range(num_params)}
+            grid = ParamGrid(param2requests, param2default)
+            self.assertEqual(choose_startup_strategy(grid), strategy)
+            param2vals = sample_param2vals(param2requests, param2default, 16, choose_startup_strategy(grid))
+            self.assertEqual(len(param2vals), 16)
+
+    def test_failed_startup(self):
+        """the search must continue with TPE if startup configurations failed, instead of ending early"""
+        grid = ParamGrid({'a': list(range(10)), 'b': list(range(10))}, {'a': 0, 'b': 0})
+        tpe = TPE(grid)
+        startup_indices = [0, 11, 22, 33]
+        index2value = {0: 1.0}  # the other startup configurations failed
+        attempted = set(startup_indices)
+        indices = propose_batch(tpe, index2value, attempted, startup_indices,
+                                num_startup=4, num_proposals=4, rng=random.Random(0))
+        self.assertEqual(len(indices), 4)
+        self.assertFalse(attempted.intersection(indices))
+
+        # startup configurations that were not attempted yet are proposed first
+        indices = propose_batch(tpe, {}, {0}, startup_indices, num_startup=4, num_proposals=4, rng=random.Random(0))
+        self.assertEqual(sorted(indices), [11, 22, 33])
+
+
+if __name__ == '__main__':
+    unittest.main()
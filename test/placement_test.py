@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.index import ParamIndex
+from ludwig.placement import CostModel, assign_jobs, pin_jobs
+
+
+class MyTest(unittest.TestCase):
+
+    def test_assign_jobs(self):
+        """longest jobs are assigned first, and faster workers receive more work"""
+        worker2speed = {'hoff': 1.0, 'lecun': 2.0}
+        costs = [4.0, 1.0, 2.0, 2.0, 1.0]
+        assigned_workers, worker2finish = assign_jobs(costs, ['hoff', 'lecun'], worker2speed)
+
+        self.assertEqual(assigned_workers[0], 'lecun')
+        self.assertEqual(assigned_workers, ['lecun', 'hoff', 'hoff', 'lecun', 'lecun'])
+        self.assertEqual(worker2finish, {'hoff': 3.0, 'lecun': 3.5})
+        self.assertEqual(sum(worker2finish[w] * worker2speed[w] for w in worker2finish), sum(costs))
+
+    def test_pin_jobs(self):
+        """configurations that are running already must be assigned to the worker on which they are running"""
+        param_name2workers = {'param_001': ['hoff', 'hoff'], 'param_002': ['norman']}
+        pinned = pin_jobs(['param_001', 'param_001', 'param_001', 'param_002', 'param_003'],
+                          param_name2workers, ['hoff', 'lecun'])
+        self.assertEqual(pinned, ['hoff', 'hoff', None, None, None])  # norman is not among the requested workers
+
+        assigned_workers, worker2finish = assign_jobs([1.0] * 5, ['hoff', 'lecun'], {}, pinned)
+        self.assertEqual(assigned_workers[:2], ['hoff', 'hoff'])
+        self.assertEqual(assigned_workers[2:], ['lecun', 'lecun', 'hoff'])
+        self.assertEqual(worker2finish, {'hoff': 3.0, 'lecun': 2.0})
+
+    def test_load_param2vals_deleted(self):
+        """configurations deleted while the cost model is built must be skipped"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, lr in enumerate([0.1, 0.2]):
+                param2val = {'learning_rate': lr, 'param_name': f'param_00{n + 1}', 'job_name': 'job_num0',
+                             'save_path': 'does-not-exist'}
+                run.save_job_files(param2val, [], runs_path, duration=10.0)
+            cost_model = CostModel(runs_path, param_index=ParamIndex(runs_path, use_local_cache=False))
+
+            shutil.rmtree(str(runs_path / 'param_002'))
+            param_name2param2val = cost_model.load_param2vals({'param_001': 1.0, 'param_002': 1.0})
+            self.assertEqual(list(param_name2param2val), ['param_001'])
+            self.assertEqual(param_name2param2val['param_001']['learning_rate'], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
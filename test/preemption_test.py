@@ -0,0 +1,33 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+
+
+class MyTest(unittest.TestCase):
+
+    def test_resumable_name(self):
+        """run.py cannot import ludwig, so it keeps its own copy of resumable_name"""
+        self.assertEqual(run.resumable_name, config.Constants.resumable)
+
+    def test_resume(self):
+        """a checkpoint of a preempted job must be resumed by exactly one job"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            resumable_path = Path(tmp_dir) / 'runs' / 'param_001' / config.Constants.resumable
+            save_path = Path(tmp_dir) / 'param_001' / 'job_num0' / config.Constants.saves
+            save_path.mkdir(parents=True)
+            (save_path / 'checkpoint.txt').write_text('epoch 3')
+            run.stash_checkpoint(save_path, resumable_path, 'job_num0')
+            self.assertFalse(save_path.exists())
+
+            new_save_path = Path(tmp_dir) / 'param_001' / 'job_num1' / config.Constants.saves
+            new_save_path.parent.mkdir(parents=True)
+            self.assertTrue(run.claim_checkpoint(resumable_path, new_save_path))
+            self.assertEqual((new_save_path / 'checkpoint.txt').read_text(), 'epoch 3')
+            self.assertFalse(run.claim_checkpoint(resumable_path, Path(tmp_dir) / 'other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
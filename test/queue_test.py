@@ -0,0 +1,58 @@
+import unittest
+import tempfile
+import os
+import time
+import pickle
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from ludwig import config
+from ludwig import run
+
+
+class MyTest(unittest.TestCase):
+
+    def test_lease_duration(self):
+        """run.py cannot import ludwig, so it keeps its own copy of queue settings"""
+        self.assertEqual(run.queue_name, config.Constants.queue)
+        self.assertEqual(run.lease_duration, config.Time.lease_duration)
+
+    def test_claim_job(self):
+        """each job must be claimed exactly once, even when claimed concurrently"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            queue_path = Path(tmp_dir) / config.Constants.queue
+            (queue_path / 'leases').mkdir(parents=True)
+            for n in range(20):
+                with (queue_path / f'param_{n:0>3}_num0.pkl').open('wb') as f:
+                    pickle.dump({'param_name': f'param_{n:0>3}'}, f)
+
+            def claim_all():
+                res = []
+                lease_path = run.claim_job(queue_path)
+                while lease_path is not None:
+                    res.append(lease_path.name.split('__')[-1])
+                    lease_path = run.claim_job(queue_path)
+                return res
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(claim_all) for _ in range(4)]
+            claimed = [name for future in futures for name in future.result()]
+            self.assertEqual(sorted(claimed), sorted(f'param_{n:0>3}_num0.pkl' for n in range(20)))
+
+    def test_requeue_expired_leases(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            queue_path = Path(tmp_dir) / config.Constants.queue
+            (queue_path / 'leases').mkdir(parents=True)
+            (queue_path / 'param_001_num0.pkl').touch()
+            lease_path = run.claim_job(queue_path)
+            self.assertIsNone(run.claim_job(queue_path))
+
+            # worker stopped renewing lease
+            expired = time.time() - run.lease_duration - 1
+            os.utime(str(lease_path), (expired, expired))
+            lease_path = run.claim_job(queue_path)
+            self.assertEqual(lease_path.name.split('__')[-1], 'param_001_num0.pkl')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from ludwig.reps import calc_num_reps, calc_ci_half_width, t_critical
+
+
+class MyTest(unittest.TestCase):
+
+    def test_t_critical(self):
+        self.assertEqual(t_critical(1), 12.706)
+        self.assertEqual(t_critical(35), 2.042)  # errs on the wide side
+        self.assertEqual(t_critical(1000), 1.96)
+
+    def test_calc_num_reps(self):
+        """more repetitions must be requested only if the confidence interval is too wide, up to max_reps"""
+        self.assertEqual(calc_num_reps([], target_ci=0.1, min_reps=3, max_reps=10), 3)
+        self.assertEqual(calc_num_reps([0.5, 0.5, 0.5], target_ci=0.1, min_reps=3, max_reps=10), 3)
+
+        noisy = [0.2, 0.5, 0.8]
+        self.assertGreater(calc_ci_half_width(noisy), 0.1)
+        num_reps = calc_num_reps(noisy, target_ci=0.1, min_reps=3, max_reps=10)
+        self.assertEqual(num_reps, 10)
+        self.assertEqual(calc_num_reps(noisy, target_ci=0.5, min_reps=3, max_reps=10), 4)
+        self.assertEqual(calc_num_reps(noisy * 4, target_ci=0.01, min_reps=3, max_reps=10), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from ludwig.requests import ParamGrid, gen_all_param2vals, sample_param2vals, STRATEGIES
+
+from Example.example import params
+
+
+class MyTest(unittest.TestCase):
+
+    def test_order(self):
+        """first parameter varies fastest"""
+        param2vals = list(gen_all_param2vals(params.param2requests, params.param2default))
+        self.assertEqual(param2vals, [
+            {'learning_rate': 0.1, 'configuration': (1, 0)},
+            {'learning_rate': 0.2, 'configuration': (1, 0)},
+            {'learning_rate': 0.3, 'configuration': (1, 0)},
+            {'learning_rate': 0.1, 'configuration': (0, 1)},
+            {'learning_rate': 0.2, 'configuration': (0, 1)},
+            {'learning_rate': 0.3, 'configuration': (0, 1)},
+        ])
+
+    def test_random_access(self):
+        """a large grid must be indexable without enumerating it"""
+        param2requests = {f'p{n}': list(range(10)) for n in range(10)}
+        param2default = {f'p{n}': 0 for n in range(12)}
+        grid = ParamGrid(param2requests, param2default)
+
+        self.assertEqual(len(grid), 10 ** 10)
+        self.assertEqual(grid[0], param2default)
+        self.assertEqual(grid[-1], {**{f'p{n}': 9 for n in range(10)}, 'p10': 0, 'p11': 0})
+        self.assertEqual(grid[1234567890]['p0'], 0)
+        self.assertEqual(grid[1234567890]['p9'], 1)
+        self.assertEqual(grid[10:13], [grid[10], grid[11], grid[12]])
+        with self.assertRaises(IndexError):
+            grid[10 ** 10]
+
+    def test_sample(self):
+        """samples must be distinct, requested, and deterministic given seed"""
+        param2requests = {f'p{n}': list(range(10)) for n in range(8)}
+        param2default = {f'p{n}': 0 for n in range(9)}
+        grid = ParamGrid(param2requests, param2default)
+
+        for strategy in STRATEGIES:
+            param2vals = sample_param2vals(param2requests, param2default, 50, strategy, seed=1)
+            self.assertEqual(len(param2vals), 50)
+            self.assertEqual(len({tuple(param2val.values()) for param2val in param2vals}), 50)
+            self.assertEqual(param2vals, sample_param2vals(param2requests, param2default, 50, strategy, seed=1))
+            self.assertEqual(set(param2vals[0]), set(grid[0]))
+
+        # budget larger than grid returns all configurations
+        param2vals = sample_param2vals(params.param2requests, params.param2default, 100, 'sobol')
+        self.assertEqual(param2vals, list(gen_all_param2vals(params.param2requests, params.param2default)))
+
+
+if __name__ == '__main__':
+    unittest.main()
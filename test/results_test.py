@@ -0,0 +1,79 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.results import load_runs, _load_job_results
+
+
+def make_series(name, values):
+    res = pd.Series(values, index=[10 * i for i in range(len(values))], name=name)
+    res.index.name = 'step'
+    return res
+
+
+class MyTest(unittest.TestCase):
+
+    def test_npz(self):
+        """series saved to results.npz must be loaded with the same index and values"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': 'job_num0',
+                         'save_path': 'does-not-exist'}
+            series_list = [make_series('accuracy', [0.5, 0.7, 0.9]), make_series('loss', [2.0, 1.0])]
+            run.save_job_files(param2val, series_list, runs_path, results_formats=('npz',))
+
+            job_path = runs_path / 'param_001' / 'job_num0'
+            self.assertTrue((job_path / config.Constants.results).exists())
+            self.assertFalse((job_path / 'accuracy.csv').exists())
+            res = _load_job_results(job_path, None)
+            self.assertEqual([name for name, _, _ in res], ['accuracy', 'loss'])
+            np.testing.assert_array_equal(res[0][1], [0, 10, 20])
+            np.testing.assert_array_equal(res[0][2], [0.5, 0.7, 0.9])
+            np.testing.assert_array_equal(res[1][2], [2.0, 1.0])
+
+    def test_npz_preferred(self):
+        """results.npz must be loaded instead of csv files, if a job saved both"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': 'job_num0',
+                         'save_path': 'does-not-exist'}
+            run.save_job_files(param2val, [make_series('accuracy', [0.5, 0.7])], runs_path,
+                               results_formats=('csv', 'npz'))
+            job_path = runs_path / 'param_001' / 'job_num0'
+            (job_path / 'accuracy.csv').write_text('step,accuracy\n0,0.0\n')
+
+            res = _load_job_results(job_path, ['accuracy'])
+            self.assertEqual(len(res), 1)
+            np.testing.assert_array_equal(res[0][2], [0.5, 0.7])
+
+    def test_load_runs(self):
+        """results must be returned in long format, with only the requested series and parameters"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / config.Constants.runs
+            for n, lr in enumerate([0.1, 0.2]):
+                param2val = {'learning_rate': lr, 'batch_size': 32, 'param_name': f'param_00{n + 1}',
+                             'job_name': 'job_num0', 'save_path': 'does-not-exist'}
+                series_list = [make_series('accuracy', [lr, 2 * lr]), make_series('loss', [1.0, 0.5, 0.1])]
+                run.save_job_files(param2val, series_list, runs_path, results_formats=('csv', 'npz')[n:n + 1])
+            param_paths = [runs_path / 'param_001', runs_path / 'param_002']
+
+            df = load_runs(param_paths)
+            self.assertEqual(list(df.columns), ['batch_size', 'learning_rate',  # sorted in param2val.yaml
+                                                'param_name', 'job_name', 'series', 'index', 'value'])
+            self.assertEqual(len(df), 10)
+
+            df = load_runs(param_paths, series_names=['accuracy'], param_names=['learning_rate'])
+            self.assertEqual(list(df.columns), ['learning_rate', 'param_name', 'job_name', 'series', 'index', 'value'])
+            self.assertEqual(set(df['series']), {'accuracy'})
+            self.assertEqual(df['param_name'].tolist(), ['param_001', 'param_001', 'param_002', 'param_002'])
+            self.assertEqual(df['index'].tolist(), [0, 10, 0, 10])
+            self.assertEqual(df['value'].tolist(), [0.1, 0.2, 0.2, 0.4])
+            self.assertEqual(df['learning_rate'].tolist(), [0.1, 0.1, 0.2, 0.2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import tempfile
+import pandas as pd
+from pathlib import Path
+
+from ludwig import config
+from ludwig import run
+from ludwig.spool import find_spooled_jobs, ship
+
+
+class MyTest(unittest.TestCase):
+
+    def test_spool_path(self):
+        """run.py cannot import ludwig, so it keeps its own copy of spool settings"""
+        self.assertEqual(run.worker_spool_path, config.WorkerDirs.spool)
+
+    def test_ship(self):
+        """spooled results must only appear in runs once shipped, and shipping must survive interruption"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs_path = Path(tmp_dir) / 'project' / config.Constants.runs
+            spool_path = Path(tmp_dir) / 'spool'
+            spool_path.mkdir()
+            param2val = {'learning_rate': 0.1, 'param_name': 'param_001', 'job_name': 'job_num0',
+                         'save_path': 'does-not-exist'}
+            series = pd.Series([1.0, 2.0], index=[10, 20], name='accuracy')
+            run.save_job_files(param2val, [series], runs_path, spool_path=spool_path)
+
+            job_path = runs_path / 'param_001' / 'job_num0'
+            self.assertTrue((runs_path / 'param_001' / 'param2val.yaml').exists())
+            self.assertFalse(job_path.exists())
+
+            # interrupted shipping leaves an incomplete copy behind
+            marker_path, = find_spooled_jobs(spool_path)
+            partial_path = runs_path / config.Constants.partial / marker_path.stem
+            partial_path.mkdir(parents=True)
+
+            self.assertEqual(ship(marker_path), job_path)
+            self.assertTrue((job_path / 'accuracy.csv').exists())
+            self.assertFalse(partial_path.exists())
+            self.assertEqual(list(spool_path.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+import os
+from pathlib import Path
+from unittest import mock
+
+from ludwig import config
+from ludwig import uploader
+from ludwig.uploader import Uploader
+
+
+class FakeSFTP:
+    """records uploads instead of connecting to a worker"""
+
+    def __init__(self, host, is_full=False):
+        self.host = host
+        self.is_full = is_full
+        self.uploaded = []
+        self.is_closed = False
+
+    def open(self, path, mode):
+        if mode == 'r':  # no manifest of a previous upload
+            raise IOError(path)
+        return open(os.devnull, mode)
+
+    def put(self, localpath, remotepath):
+        if self.is_full:
+            raise IOError('No space left on device')
+        self.uploaded.append(remotepath)
+
+    def makedirs(self, path):
+        pass
+
+    def remove(self, path):
+        pass
+
+    def close(self):
+        self.is_closed = True
+
+
+class MyTest(unittest.TestCase):
+
+    def test_start_jobs(self):
+        """each worker is uploaded to over a single connection, and an error on one worker is raised"""
+        connections = []
+
+        def connect(username, host, private_key):
+            connections.append(FakeSFTP(host, is_full=host == '10.0.0.2'))
+            return connections[-1]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            project_path = Path(tmp_dir) / 'research_data' / 'project'
+            project_path.mkdir(parents=True)
+            (Path(tmp_dir) / 'project').mkdir()
+            (Path(tmp_dir) / 'project' / 'job.py').write_text('def main(param2val): return []')
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                with mock.patch.object(Uploader, 'make_worker2ip', return_value={'hoff': '10.0.0.1',
+                                                                                 'norman': '10.0.0.2'}), \
+                        mock.patch.object(uploader.pysftp, 'Connection', side_effect=connect):
+                    with Uploader(project_path, 'project') as u:
+                        with self.assertRaises(RuntimeError) as cm:
+                            u.run_on_workers(u.start_jobs, ['hoff', 'norman'])
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(str(cm.exception), 'start_jobs failed on norman')
+        self.assertEqual(sorted(c.host for c in connections), ['10.0.0.1', '10.0.0.2'])
+        hoff, = [c for c in connections if c.host == '10.0.0.1']
+        watched = config.WorkerDirs.watched.name
+        self.assertEqual(hoff.uploaded, [f'{watched}/project/job.py', f'{watched}/run_project.py'])
+        self.assertTrue(all(c.is_closed for c in connections))
+
+
+if __name__ == '__main__':
+    unittest.main()
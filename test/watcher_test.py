@@ -0,0 +1,303 @@
+import unittest
+import tempfile
+import datetime
+import pickle
+import io
+import os
+import time
+from pathlib import Path
+from unittest import mock
+from watchdog.events import FileModifiedEvent, FileClosedEvent, FileCreatedEvent, FileOpenedEvent, \
+    FileClosedNoWriteEvent
+
+from ludwig import config
+from ludwig import run
+import watcher
+from watcher import Handler
+
+
+class MyTest(unittest.TestCase):
+
+    @staticmethod
+    def make_handler(src2options):
+        handler = Handler()
+        handler.src2options.update(src2options)
+        return handler
+
+    def test_select_next_job_priority(self):
+        """jobs of a higher priority class go first, regardless of when they were queued"""
+        handler = self.make_handler({'run_a.py': {'user': 'ann', 'priority': 'low'},
+                                     'run_b.py': {'user': 'bob', 'priority': 'normal'},
+                                     'run_c.py': {'user': 'cid', 'priority': 'high'}})
+        handler.pending.extend([('run_a.py', None, 1.0), ('run_b.py', None, 2.0), ('run_c.py', None, 3.0)])
+        started = []
+        while handler.pending:
+            n = handler.select_next_job()
+            started.append(handler.pending[n][0])
+            del handler.pending[n]
+        self.assertEqual(started, ['run_c.py', 'run_b.py', 'run_a.py'])
+
+    def test_select_next_job_fair_share(self):
+        """within a priority class, the next job belongs to the user with the fewest running jobs per weight"""
+        handler = self.make_handler({'run_a.py': {'user': 'ann'},
+                                     'run_b.py': {'user': 'bob'}})
+        handler.process2job = {mock.Mock(): ('run_a.py', None), mock.Mock(): ('run_a.py', None),
+                               mock.Mock(): ('run_b.py', None)}
+        handler.pending.extend([('run_a.py', None, 1.0), ('run_b.py', None, 2.0)])
+        self.assertEqual(handler.pending[handler.select_next_job()][0], 'run_b.py')
+
+        # a user with a higher weight may run more jobs
+        with mock.patch.object(config.Watcher, 'user2weight', {'ann': 3}):
+            self.assertEqual(handler.pending[handler.select_next_job()][0], 'run_a.py')
+
+    def test_fast_lane(self):
+        """jobs with high priority do not get an additional slot, unless they were submitted with --minimal"""
+        handler = self.make_handler({'run_a.py': {'priority': 'high'},
+                                     'run_b.py': {'priority': 'high', 'fast_lane': True}})
+        self.assertFalse(handler.is_fast_lane('run_a.py'))
+        self.assertTrue(handler.is_fast_lane('run_b.py'))
+
+    def test_cpu_percent(self):
+        """scheduler and heartbeat must not reset each other's measurement of CPU utilization"""
+        handler = Handler()
+        with mock.patch.object(watcher.psutil, 'cpu_percent', side_effect=[50.0, 10.0]) as cpu_percent:
+            self.assertEqual(handler.sample_cpu_percent(), 50.0)
+            self.assertEqual(handler.sample_cpu_percent(), 50.0)  # called again within interval
+            self.assertEqual(cpu_percent.call_count, 1)
+
+    def test_pending_round_trip(self):
+        """pending jobs, including batches and jobs from the shared queue, are restored after restart"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir)
+            src_path = tmp_path / 'run_project.py'
+            src_path.touch()
+            pkl_paths = [tmp_path / 'worker_{}.pkl'.format(n) for n in range(3)]
+            for p in pkl_paths:
+                p.touch()
+            pending = [(str(src_path), pkl_paths[0], 1.0),
+                       (str(src_path), tuple(pkl_paths[1:]), 2.0),
+                       (str(src_path), None, 3.0)]
+
+            with mock.patch.object(config.WorkerDirs, 'state', tmp_path), \
+                    mock.patch.object(config.WorkerDirs, 'research_data', tmp_path):
+                handler = Handler()
+                handler.pending.extend(pending)
+                handler.save_pending()
+
+                pkl_paths[0].unlink()  # removed by a new submission in the meantime
+                restored = Handler()
+                restored.restore_pending()
+
+            self.assertEqual(list(restored.pending), pending[1:])
+
+    def test_partition_cpus(self):
+        """CPU sets of concurrent jobs must be disjoint and cover all CPUs of the worker"""
+        cpus = set(range(8))
+        with mock.patch.object(watcher.os, 'sched_getaffinity', return_value=cpus):
+            for num_parts in range(1, len(cpus) + 1):
+                parts = watcher.partition_cpus(num_parts)
+                self.assertEqual(len(parts), num_parts)
+                self.assertEqual(sum(len(p) for p in parts), len(cpus))
+                self.assertEqual(set.union(*parts), cpus)
+
+    def test_partition_cpus_by_core(self):
+        """hyper-threads of the same physical core are assigned to the same job"""
+        with mock.patch.object(watcher.os, 'sched_getaffinity', return_value=set(range(8))), \
+                mock.patch.object(watcher, 'group_cpus_by_core', return_value=[[0, 4], [1, 5], [2, 6], [3, 7]]):
+            self.assertEqual(watcher.partition_cpus(2), [{0, 1, 4, 5}, {2, 3, 6, 7}])
+            self.assertEqual(watcher.partition_cpus(4), [{0, 4}, {1, 5}, {2, 6}, {3, 7}])
+
+    def test_repartition_after_reap(self):
+        """once a job finishes, its CPUs are given to the remaining jobs"""
+        handler = Handler()
+        finished, running = mock.Mock(pid=1), mock.Mock(pid=2)
+        finished.poll.return_value = 0
+        running.poll.return_value = None
+        with mock.patch.object(watcher.os, 'sched_getaffinity', return_value=set(range(4))), \
+                mock.patch.object(watcher, 'group_cpus_by_core', return_value=[[0], [1], [2], [3]]), \
+                mock.patch.object(watcher, 'set_affinity') as set_affinity, \
+                mock.patch.object(config.WorkerDirs, 'job_status', Path(tempfile.gettempdir())):
+            for process in [finished, running]:
+                handler.process2slot[process] = handler.assign_cpus()[0]
+                handler.process2job[process] = ('run_a.py', None)
+                handler.process2hash[process] = None
+            handler.reap_jobs()
+        set_affinity.assert_called_with(running.pid, {0, 1, 2, 3})
+        self.assertEqual(handler.num_parts, 1)
+
+    @staticmethod
+    def mock_stats(available_memory=16 * 1024 ** 3, cpu_percent=10.0, nvidia_smi=(0, '8000')):
+        return [mock.patch.object(watcher.psutil, 'virtual_memory', return_value=mock.Mock(available=available_memory)),
+                mock.patch.object(watcher.psutil, 'cpu_percent', return_value=cpu_percent),
+                mock.patch.object(watcher.subprocess, 'getstatusoutput', return_value=nvidia_smi)]
+
+    @staticmethod
+    def with_jobs(num_jobs):
+        handler = Handler()
+        handler.process2job = {mock.Mock(): ('run_a.py', None) for _ in range(num_jobs)}
+        return handler
+
+    def has_free_slot(self, handler, **kwargs):
+        patches = self.mock_stats(**kwargs)
+        for p in patches:
+            p.start()
+        try:
+            return handler.has_free_slot()
+        finally:
+            for p in patches:
+                p.stop()
+
+    def test_has_free_slot(self):
+        """another job is started only if enough RAM, CPU and GPU memory are available"""
+        handler = Handler()
+        self.assertTrue(self.has_free_slot(handler, available_memory=0))  # first job is always started
+
+        handler.process2job = {mock.Mock(): ('run_a.py', None)}
+        self.assertTrue(self.has_free_slot(handler))
+        self.assertTrue(self.has_free_slot(handler, nvidia_smi=(127, 'command not found')))  # no GPU
+        self.assertFalse(self.has_free_slot(handler, available_memory=1024))
+        self.assertFalse(self.has_free_slot(self.with_jobs(1), cpu_percent=100.0))  # CPU utilization is cached
+        self.assertFalse(self.has_free_slot(handler, nvidia_smi=(0, '8000\n100')))  # one of two GPUs is full
+
+        handler.time_of_last_start = datetime.datetime.now()  # job has not yet allocated its memory
+        self.assertFalse(self.has_free_slot(handler))
+
+        handler = self.with_jobs(config.Watcher.max_num_slots)
+        self.assertFalse(self.has_free_slot(handler))
+
+    def test_start_job(self):
+        """a job is executed in its own process, restricted to the CPUs of its slot"""
+        handler = Handler()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pkl_path = Path(tmp_dir) / 'worker_param_001_job_num0.pkl'
+            with pkl_path.open('wb') as f:
+                pickle.dump({'param_name': 'param_001', 'lr': 0.1}, f)
+            with mock.patch.object(watcher.subprocess, 'Popen') as popen, \
+                    mock.patch.object(watcher, 'partition_cpus', return_value=[{0, 1}]), \
+                    mock.patch.object(watcher, 'set_affinity') as set_affinity:
+                popen.return_value = mock.Mock(pid=123)
+                handler.start_job('run_a.py', pkl_path)
+
+        command = popen.call_args[0][0]
+        self.assertEqual(command[1:], ['run_a.py', str(pkl_path)])
+        self.assertEqual(popen.call_args[1]['env']['OMP_NUM_THREADS'], '2')
+        set_affinity.assert_called_once_with(123, {0, 1})
+        self.assertEqual(handler.process2job, {popen.return_value: ('run_a.py', pkl_path)})
+        self.assertEqual(handler.process2hash[popen.return_value], watcher.param2val_to_hash({'lr': 0.1}))
+
+    def test_stop_active_jobs(self):
+        """running jobs are kept if their configuration is submitted again, and preempted otherwise"""
+        handler = Handler()
+        kept, preempted, other_project = mock.Mock(pid=1), mock.Mock(pid=2), mock.Mock(pid=3)
+        handler.process2job = {kept: ('run_a.py', None),
+                               preempted: ('run_a.py', None),
+                               other_project: ('run_b.py', None)}
+        handler.process2hash = {kept: watcher.param2val_to_hash({'lr': 0.1}),
+                                preempted: watcher.param2val_to_hash({'lr': 0.2}),
+                                other_project: watcher.param2val_to_hash({'lr': 0.3})}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jobs = []
+            for n, lr in enumerate([0.1, 0.3]):
+                pkl_path = Path(tmp_dir) / 'worker_param_00{}_job_num0.pkl'.format(n)
+                with pkl_path.open('wb') as f:
+                    pickle.dump({'param_name': 'param_00{}'.format(n), 'lr': lr}, f)
+                jobs.append(('run_a.py', pkl_path))
+            with mock.patch.object(watcher.psutil, 'Process') as process, \
+                    mock.patch.object(watcher.psutil, 'process_iter', return_value=[]), \
+                    mock.patch.object(Handler, 'preempt') as preempt:
+                process.return_value.children.return_value = []
+                res = handler.stop_active_jobs('run_a.py', jobs)
+
+        self.assertEqual(res, jobs[1:])
+        preempt.assert_called_once_with([preempted])
+        self.assertEqual(handler.preempted, {preempted})
+
+    def test_serve(self):
+        """a warm process reports the exit status of each job to the watcher, and exits after a failed job"""
+        fds = []
+
+        def popen(*args, **kwargs):
+            fds.append(os.dup(kwargs['pass_fds'][0]))  # the end of the pipe that is passed to run.py
+            return mock.Mock(pid=123, **{'poll.return_value': None})
+
+        with mock.patch.object(watcher.subprocess, 'Popen', side_effect=popen):
+            warm_process = watcher.WarmProcess('run_a.py', {0})
+        self.assertIsNone(warm_process.poll())  # no job finished yet
+
+        stdin = io.StringIO('worker_param_001_job_num0.pkl\nworker_param_002_job_num0.pkl\n')
+        with mock.patch.object(run.sys, 'stdin', stdin), \
+                mock.patch.object(run, 'load_job', return_value=({}, None)), \
+                mock.patch.object(run, 'run_job_on_ludwig_worker', side_effect=[None, ValueError]), \
+                mock.patch.object(run.traceback, 'print_exc'):
+            with self.assertRaises(SystemExit):
+                run.serve(fds[0])
+
+        self.assertEqual(warm_process.poll(), 0)
+        self.assertEqual(warm_process.poll(), 1)
+        warm_process.close()
+
+    def test_close_idle_warm_processes(self):
+        """idle warm processes are closed once their project has no running or pending jobs"""
+        handler = Handler()
+        finished, pending = mock.Mock(), mock.Mock()
+        handler.src2idle = {'run_a.py': [finished], 'run_b.py': [pending]}
+        handler.pending.append(('run_b.py', None, 1.0))
+        handler.reap_jobs()
+        finished.close.assert_called_once_with()
+        pending.close.assert_not_called()
+        self.assertEqual(handler.src2idle, {'run_b.py': [pending]})
+
+    def test_debounce(self):
+        """events of an upload trigger a single run per run_*.py, once the upload is complete"""
+        handler = Handler()
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(config.Watcher, 'debounce', 0.1), \
+                mock.patch.object(config.Watcher, 'settle_time', 0.3):
+            closed_path = str(Path(tmp_dir) / 'run_a.py')  # watchdog reports that the file was closed
+            unclosed_path = str(Path(tmp_dir) / 'run_b.py')  # watchdog does not report closed files
+            for path in [closed_path, unclosed_path]:
+                Path(path).write_text('import job')
+            handler.on_any_event(FileCreatedEvent(closed_path))
+            for _ in range(5):
+                handler.on_any_event(FileModifiedEvent(closed_path))
+                handler.on_any_event(FileModifiedEvent(unclosed_path))
+                handler.on_any_event(FileModifiedEvent(str(Path(tmp_dir) / 'params.py')))  # not a run_*.py
+            handler.on_any_event(FileClosedEvent(closed_path))
+
+            handler.settle()
+            self.assertTrue(handler.q.empty())  # events may follow
+
+            time.sleep(0.15)
+            handler.settle()
+            self.assertEqual(handler.q.get_nowait(), closed_path)
+            self.assertTrue(handler.q.empty())  # size of unclosed file was not yet stable for settle_time
+
+            time.sleep(0.2)
+            handler.settle()
+            self.assertEqual(handler.q.get_nowait(), unclosed_path)
+
+            for _ in range(3):
+                time.sleep(0.15)
+                handler.settle()
+            self.assertTrue(handler.q.empty())
+            self.assertEqual(handler.path2upload, {})
+
+    def test_read_events(self):
+        """reading run_*.py, e.g. when a job or a warm process starts, must not queue the project again"""
+        handler = Handler()
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(config.Watcher, 'debounce', 0.1), \
+                mock.patch.object(config.Watcher, 'settle_time', 0.1):
+            path = str(Path(tmp_dir) / 'run_a.py')
+            Path(path).write_text('import job')
+            handler.on_any_event(FileOpenedEvent(path))
+            handler.on_any_event(FileClosedNoWriteEvent(path))
+            for _ in range(3):
+                handler.settle()
+                time.sleep(0.15)
+            self.assertTrue(handler.q.empty())
+            self.assertEqual(handler.path2upload, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,26 @@
 from datetime import datetime
 import threading
 import time
-from subprocess import CalledProcessError
 import subprocess
 from pathlib import Path
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 from queue import Queue
+from collections import deque
 import sys
 import re
 import datetime
 import psutil
 import socket
+import pickle
+import os
+import select
+import json
+import yaml
 
 from ludwig import config
+from ludwig.spool import find_spooled_jobs, ship
+from ludwig.run import param2val_to_hash
 
 hostname = socket.gethostname()
 
@@ -26,32 +33,227 @@ def custom_print(string):
     sys.stdout.flush()
 
 
+def make_job_env(cpus=None):
+    """
+    jobs can import ludwig, e.g. to use the local data cache.
+    numerical libraries start as many threads as CPUs the job is assigned, instead of one per core of the worker
+    """
+    res = dict(os.environ)
+    res['PYTHONPATH'] = os.pathsep.join(p for p in [str(config.WorkerDirs.root), res.get('PYTHONPATH')] if p)
+    if cpus is not None:
+        for name in config.Watcher.thread_env_names:
+            res[name] = str(len(cpus))
+    return res
+
+
+def group_cpus_by_core(cpus):
+    """return lists of CPUs that are hyper-threads of the same physical core - or one CPU per core if unknown"""
+    core2cpus = {}
+    for cpu in cpus:
+        topology_path = Path('/sys/devices/system/cpu/cpu{}/topology'.format(cpu))
+        try:
+            core = ((topology_path / 'physical_package_id').read_text().strip(),
+                    (topology_path / 'core_id').read_text().strip())
+        except OSError:
+            core = cpu
+        core2cpus.setdefault(core, []).append(cpu)
+    return sorted(core2cpus.values())
+
+
+def partition_cpus(num_parts):
+    """
+    split CPUs available to the watcher into num_parts disjoint sets of (nearly) equal size.
+    each set is a contiguous block of physical cores, including all their hyper-threads,
+     so that jobs do not share a core unless there are more jobs than cores.
+    """
+    cores = group_cpus_by_core(sorted(os.sched_getaffinity(0)))
+    if num_parts > len(cores):  # hyper-threads of a core must be split among jobs
+        cores = [[cpu] for core in cores for cpu in core]
+    if num_parts > len(cores):  # more jobs than CPUs
+        return [set(cores[i % len(cores)]) for i in range(num_parts)]
+    return [{cpu for core in cores[len(cores) * i // num_parts:len(cores) * (i + 1) // num_parts] for cpu in core}
+            for i in range(num_parts)]
+
+
+def set_affinity(pid, cpus):
+    """restrict all threads of a process and its child processes (e.g. data loaders) to cpus"""
+    try:
+        pids = [pid] + [p.pid for p in psutil.Process(pid).children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return
+    for pid in pids:
+        try:
+            tids = [int(tid) for tid in os.listdir('/proc/{}/task'.format(pid))]
+        except OSError:  # exited in the meantime
+            continue
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError:
+                pass
+
+
+class WarmProcess:
+    """
+    long-lived interpreter that imports the job module of a project once, and runs jobs sent over a pipe.
+    provides the methods of subprocess.Popen that are used by the Handler.
+
+    the number of threads of numerical libraries (config.Watcher.thread_env_names) is fixed when the process starts.
+    if CPUs are re-partitioned while a job runs, only its affinity changes -
+     an idle process is therefore only reused for a job with the same number of CPUs.
+    """
+
+    def __init__(self, event_src_path, cpus):
+        read_fd, write_fd = os.pipe()  # run.py reports exit status of each job
+        self.process = subprocess.Popen(['python3.7', event_src_path, '--serve', str(write_fd)],
+                                        stdin=subprocess.PIPE, pass_fds=(write_fd,), universal_newlines=True,
+                                        env=make_job_env(cpus))
+        os.close(write_fd)
+        self.reports = os.fdopen(read_fd, 'r')
+        self.pid = self.process.pid
+        self.num_jobs = 0
+        self.num_cpus = len(cpus)
+
+    def submit(self, pkl_path):
+        self.num_jobs += 1
+        self.process.stdin.write('{}\n'.format(pkl_path))
+        self.process.stdin.flush()
+
+    def poll(self):
+        """return exit status of current job, or None if it is still running"""
+        if select.select([self.reports], [], [], 0)[0]:
+            line = self.reports.readline()
+            if line:
+                return int(line)
+        return self.process.poll()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def terminate(self):
+        self.process.terminate()
+
+    def kill(self):
+        self.process.kill()
+
+    def close(self):
+        """process exits once it reads the end of stdin"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.reports.close()
+
+
+class UploadState:
+    """events of a run_*.py that was uploaded, but not yet queued"""
+
+    def __init__(self):
+        self.first_event_time = time.time()
+        self.last_event_time = self.first_event_time
+        self.num_events = 0
+        self.is_closed = False
+        self.size = None
+
+
 class Handler(FileSystemEventHandler):
     def __init__(self):
         self.thread = None
+        self.scheduler_thread = None
+        self.shipper_thread = None
+        self.settler_thread = None
+        self.heartbeat_thread = None
         self.q = Queue()
         self.run_pattern = re.compile('(run)')
-        self.time_stamps = [datetime.datetime.now()]
+        self.path2upload = {}  # uploads of run_*.py that may be incomplete: path -> UploadState
+        self.upload_lock = threading.Lock()
+        self.queued = set()  # paths in self.q - a project is queued at most once
+        self.src2trigger_time = {}  # time of first event of the most recent upload of each project
+        self.lock = threading.Lock()
+        self.pending = deque()  # jobs waiting for a free slot: (event_src_path, pkl_path, time queued)
+        self.last_error = None  # shown by ludwig-status: {'time', 'message'}
+        self.process2job = {}  # running jobs
+        self.process2hash = {}  # configuration of running jobs, None if job was claimed from shared queue
+        self.preempted = set()  # running jobs that were asked to stop
+        self.src2options = {}  # options saved at submission, e.g. whether to use warm processes
+        self.src2idle = {}  # warm processes waiting for the next job
+        self.stale = set()  # warm processes that imported source code of a previous submission
+        self.process2slot = {}  # index of the set of CPUs assigned to each running job
+        self.num_parts = 1  # number of sets into which CPUs are partitioned
+        self.cpu_lock = threading.Lock()
+        self.cpu_percent = 0.0  # most recent CPU utilization - shared by scheduler and heartbeat
+        self.time_of_cpu_sample = 0.0
+        self.time_of_last_start = datetime.datetime.min
 
     def start(self):
         self.thread = threading.Thread(target=self._process_q)
         self.thread.daemon = True
         self.thread.start()
 
+        self.scheduler_thread = threading.Thread(target=self._schedule)
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
+
+        self.shipper_thread = threading.Thread(target=self._ship)
+        self.shipper_thread.daemon = True
+        self.shipper_thread.start()
+
+        self.settler_thread = threading.Thread(target=self._settle)
+        self.settler_thread.daemon = True
+        self.settler_thread.start()
+
+        self.heartbeat_thread = threading.Thread(target=self._beat)
+        self.heartbeat_thread.daemon = True
+        self.heartbeat_thread.start()
+
     def on_any_event(self, event):
-        if self.run_pattern.match(Path(event.src_path).name):  # True if detected event concerns run_*.py
-            # sftp produces 2 events within 1 sec - ignore 2nd event
-            ts = datetime.datetime.now()
-            time_delta = ts - self.time_stamps.pop()
-            if time_delta.total_seconds() < 1:
-                # Ignoring trigger event because it happened less than 1 sec after previous
-                pass
-            else:
-                custom_print('Killing "{}"'.format(event.src_path))  # TODO test
-                self.stop_active_jobs(event.src_path)
-                custom_print('Adding to queue: {}'.format(event.src_path))
-                self.q.put(event)
-            self.time_stamps.append(ts)
+        """
+        record events of each run_*.py separately - an upload produces multiple events (e.g. one per write).
+        a project is queued once its upload is complete (see is_complete).
+        events of reading a file (e.g. opened and closed_no_write when a job starts) are ignored,
+         otherwise starting a job would queue its project again
+        """
+        if event.is_directory or event.event_type not in ['created', 'modified', 'closed', 'moved']:
+            return
+        path = getattr(event, 'dest_path', None) or event.src_path  # files may be uploaded and then renamed
+        if not self.run_pattern.match(Path(path).name):  # True if detected event concerns run_*.py
+            return
+        with self.upload_lock:
+            upload = self.path2upload.setdefault(path, UploadState())
+            upload.last_event_time = time.time()
+            upload.num_events += 1
+            if event.event_type in ['closed', 'moved']:  # file will not be written anymore
+                upload.is_closed = True
+            elif event.event_type in ['created', 'modified']:  # e.g. the same file is uploaded again
+                upload.is_closed = False
+
+    @staticmethod
+    def is_complete(path, upload):
+        """
+        an upload is complete if the file was closed (or moved into place) and no events followed for a moment.
+        watchdog on some systems does not report closed files - then, the file size must not change for a while
+        """
+        seconds_since_event = time.time() - upload.last_event_time
+        if upload.is_closed and seconds_since_event > config.Watcher.debounce:
+            return True
+        try:
+            size = os.path.getsize(path)
+        except OSError:  # deleted
+            return False
+        is_stable = size == upload.size
+        upload.size = size
+        return is_stable and seconds_since_event > config.Watcher.settle_time
+
+    def enqueue(self, path, upload):
+        self.remove_pending_jobs(path)
+        self.src2trigger_time[path] = upload.first_event_time
+        if path in self.queued:  # processed once, with the most recent upload
+            custom_print('Already queued: {}'.format(path))
+            return
+        self.queued.add(path)
+        custom_print('Adding to queue: {} ({} event(s) in {:.1f}s)'.format(
+            path, upload.num_events, time.time() - upload.first_event_time))
+        self.q.put(path)
 
     @staticmethod
     def housekeeping():
@@ -60,51 +262,509 @@ class Handler(FileSystemEventHandler):
 
         # TODO what exactly needs to be deleted?
 
-    @staticmethod
-    def stats():
-        ps = []
-        for proc in psutil.process_iter():
+    def sample_cpu_percent(self):
+        """
+        psutil measures CPU utilization since its previous call - each call resets the measurement of all other callers.
+        CPU utilization is therefore measured in one place, at most once per interval, and cached in between
+        """
+        with self.cpu_lock:
+            if time.time() - self.time_of_cpu_sample >= config.Watcher.interval:
+                self.cpu_percent = psutil.cpu_percent(interval=None)
+                self.time_of_cpu_sample = time.time()
+            return self.cpu_percent
+
+    def stats(self):
+        """return resources available for starting another job"""
+        res = {'available_memory': psutil.virtual_memory().available,
+               'cpu_percent': self.sample_cpu_percent(),
+               'gpu_free_memory': None}
+
+        # GPU memory in MiB - not available if nvidia-smi is not installed
+        command = 'nvidia-smi --query-gpu=memory.free --format=csv,noheader,nounits'
+        status, output = subprocess.getstatusoutput(command)
+        if status == 0:
             try:
-                pinfo = proc.as_dict(attrs=['pid', 'name', 'username'])
-                pinfo['vms'] = proc.memory_info().vms / (1024 * 1024)
-                ps.append(pinfo)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                res['gpu_free_memory'] = min(int(line) for line in output.split())
+            except ValueError:
                 pass
 
-        # Sort by 'vms' (virtual memory usage)
-        ps = sorted(ps, key=lambda p: p['vms'], reverse=True)  # a list of processes, including their 'vms'
+        return res
+
+    def has_free_slot(self, is_fast_lane=False) -> bool:
+        num_running = len(self.process2job)
+        if num_running == 0:
+            return True
+        max_num_slots = config.Watcher.max_num_slots + (config.Watcher.num_fast_lane_slots if is_fast_lane else 0)
+        if num_running >= max_num_slots:
+            return False
 
-        # TODO use this function to calculate overall memory usage,
-        #  to determine if jobs should be allowed to run simultaneously
+        # give most recently started job time to allocate memory before measuring
+        seconds_since_start = (datetime.datetime.now() - self.time_of_last_start).total_seconds()
+        if seconds_since_start < config.Watcher.ramp_up:
+            return False
+
+        stats = self.stats()
+        if stats['available_memory'] < config.Watcher.min_available_memory:
+            return False
+        if stats['cpu_percent'] > config.Watcher.max_cpu_percent:
+            return False
+        if stats['gpu_free_memory'] is not None and stats['gpu_free_memory'] < config.Watcher.min_gpu_free_memory:
+            return False
+        return True
+
+    @staticmethod
+    def load_hash(pkl_path):
+        if pkl_path is None:
+            return None
+        if isinstance(pkl_path, tuple):  # batch of jobs run by a single process
+            return tuple(Handler.load_hash(p) for p in pkl_path)
+        try:
+            with pkl_path.open('rb') as f:
+                return param2val_to_hash(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError):  # e.g. deleted by new submission
+            return None
 
     @staticmethod
-    def stop_active_jobs(event_src_path):
-        command = 'pkill -f -c {}'.format(event_src_path)
-        num_killed = subprocess.getoutput(command)
-        custom_print('Killed {} process(es)'.format(num_killed))
+    def is_alive(process):
+        if isinstance(process, WarmProcess):
+            return process.is_alive()
+        if not isinstance(process, psutil.Process):  # started by this watcher
+            return process.poll() is None
+        try:
+            return process.status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
+
+    def preempt(self, processes):
+        """send SIGTERM, so that jobs can save a checkpoint, and kill jobs that are still alive after grace period"""
+        for process in processes:
+            try:
+                process.terminate()
+            except (ProcessLookupError, psutil.NoSuchProcess):
+                pass
+
+        deadline = time.time() + config.Watcher.grace_period
+        while time.time() < deadline and any(self.is_alive(p) for p in processes):
+            time.sleep(config.Watcher.interval)
+        remaining = [p for p in processes if self.is_alive(p)]
+        for process in remaining:
+            try:
+                process.kill()
+            except (ProcessLookupError, psutil.NoSuchProcess):
+                pass
+        custom_print('Preempted {} job(s), killed {} job(s) after grace period'.format(
+            len(processes) - len(remaining), len(remaining)))
+
+    def stop_active_jobs(self, event_src_path, jobs):
+        """
+        preempt running jobs of a project, unless their configuration is among the newly submitted jobs.
+        return newly submitted jobs that are not already running.
+        """
+        # warm processes must not run jobs with source code of the new submission
+        for warm_process in self.src2idle.pop(event_src_path, []):
+            warm_process.close()
+        self.stale.update(p for p, job in self.process2job.items()
+                          if isinstance(p, WarmProcess) and job[0] == event_src_path)
+
+        hashes = [self.load_hash(pkl_path) for _, pkl_path in jobs]
+        is_running = [False] * len(jobs)
+
+        to_preempt = []
+        for process, (src_path, pkl_path) in self.process2job.items():
+            if src_path != event_src_path or process in self.preempted:
+                continue
+            h = self.process2hash[process]
+            matches = []
+            for hi in (h if isinstance(h, tuple) else (h,)):  # a batch is kept only if all its jobs are requested
+                match = next((n for n, hn in enumerate(hashes)
+                              if hi is not None and hn == hi and not is_running[n] and n not in matches), None)
+                matches.append(match)
+            if None not in matches:  # same configuration is running already
+                for n in matches:
+                    is_running[n] = True
+            else:
+                to_preempt.append(process)
+
+        # processes started before the watcher was restarted - processes started by this watcher are its descendants
+        descendant_pids = {p.pid for p in psutil.Process().children(recursive=True)}
+        for process in psutil.process_iter():
+            try:
+                cmdline = process.cmdline()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if process.pid not in descendant_pids and process.pid != os.getpid() and event_src_path in cmdline:
+                to_preempt.append(process)
+
+        res = [job for job, is_running_n in zip(jobs, is_running) if not is_running_n]
+        custom_print('Keeping {} running job(s) of "{}" with unchanged configuration'.format(
+            len(jobs) - len(res), event_src_path))
+        if to_preempt:
+            custom_print('Preempting {} job(s) of "{}"'.format(len(to_preempt), event_src_path))
+            self.preempted.update(p for p in to_preempt if p in self.process2job)
+            thread = threading.Thread(target=self.preempt, args=(to_preempt,))
+            thread.daemon = True
+            thread.start()
+        return res
+
+    def remove_pending_jobs(self, event_src_path):
+        with self.lock:
+            num_pending = len(self.pending)
+            self.pending = deque(job for job in self.pending if job[0] != event_src_path)
+            num_removed = num_pending - len(self.pending)
+            self.save_pending()
+        if num_removed:
+            custom_print('Removed {} queued job(s) of "{}"'.format(num_removed, event_src_path))
+
+    def add_jobs(self, event_src_path):
+        """
+        each pickled param2val assigned to this worker is executed in its own process,
+         or together with other jobs in a batch, if the job module defines main_batch().
+        if jobs are in the project's shared queue, processes are started that claim jobs until the queue is empty.
+        """
+        project_path = self.get_project_path(event_src_path)
+        pattern = '{}_*.pkl'.format(hostname.lower())
+        jobs = [(event_src_path, pkl_path) for pkl_path in sorted(project_path.glob(pattern))]
+        if not jobs and list((project_path / config.Constants.queue).glob('*.pkl')):
+            jobs = [(event_src_path, None)] * config.Watcher.max_num_slots  # pkl_path=None: claim from queue
+        if not jobs:
+            custom_print('No jobs found for "{}"'.format(event_src_path))
+        with self.lock:
+            self.src2options[event_src_path] = self.load_options(project_path)
+            jobs = self.stop_active_jobs(event_src_path, jobs)
+            jobs = self.make_batches(jobs, self.src2options[event_src_path].get('batch_size') or 1)
+            self.pending.extend((src_path, pkl_path, time.time()) for src_path, pkl_path in jobs)
+            self.save_pending()
+        custom_print('Queued {} job(s) of "{}" for user {} with priority {}'.format(
+            len(jobs), event_src_path, self.get_user(event_src_path), self.get_priority(event_src_path)))
 
     @staticmethod
-    def start_jobs(event_src_path):
-        custom_print('Executing "{}"'.format(event_src_path))
+    def get_project_path(event_src_path):
+        return config.WorkerDirs.research_data / Path(event_src_path).stem.replace('run_', '')
 
-        command = 'python3.7 {}'.format(event_src_path)
+    def get_user(self, event_src_path):
+        return self.src2options.get(event_src_path, {}).get('user') or 'unknown'
 
+    def get_priority(self, event_src_path):
+        priority = self.src2options.get(event_src_path, {}).get('priority')
+        return priority if priority in config.Watcher.priorities else 'normal'
+
+    def is_fast_lane(self, event_src_path):
+        """only quick tests (--minimal or --first_only) may use additional slots - not every job with high priority"""
+        return bool(self.src2options.get(event_src_path, {}).get('fast_lane'))
+
+    def select_next_job(self):
+        """
+        return index of the pending job that is started next.
+        jobs of a higher priority class go first. within a class, users share slots in proportion to their weight:
+         the next job belongs to the user with the fewest running jobs per weight.
+        ties are broken by the time jobs were queued
+        """
+        user2num_running = {}
+        for event_src_path, _ in self.process2job.values():
+            user = self.get_user(event_src_path)
+            user2num_running[user] = user2num_running.get(user, 0) + 1
+
+        def key(n):
+            event_src_path, _, time_queued = self.pending[n]
+            user = self.get_user(event_src_path)
+            return (config.Watcher.priorities.index(self.get_priority(event_src_path)),
+                    user2num_running.get(user, 0) / config.Watcher.user2weight.get(user, 1),
+                    time_queued)
+
+        return min(range(len(self.pending)), key=key)
+
+    def save_pending(self):
+        """save pending jobs to local disk, so that they are not lost when the watcher is restarted"""
+        pending = []
+        for event_src_path, pkl_path, time_queued in self.pending:
+            if isinstance(pkl_path, tuple):  # batch
+                pkl_path = [str(p) for p in pkl_path]
+            elif pkl_path is not None:
+                pkl_path = str(pkl_path)
+            pending.append((event_src_path, pkl_path, time_queued))
+        path = config.WorkerDirs.state / 'pending.json'
+        tmp_path = path.parent / '.{}.tmp'.format(path.name)
         try:
-            subprocess.check_call([command], shell=True)  # stdout is already redirected, cannot do it here
-        except CalledProcessError as e:  # this is required to continue to the next item in queue if current item fails
-            custom_print(str(e))
-            custom_print('Failed to execute: {}'.format(command))
-            print()
+            with tmp_path.open('w') as f:
+                json.dump(pending, f)
+            os.replace(str(tmp_path), str(path))
+        except OSError as e:
+            custom_print('Could not save pending jobs: {}'.format(e))
+
+    def restore_pending(self):
+        """queue jobs that were pending when the watcher was stopped, unless they were removed in the meantime"""
+        try:
+            with (config.WorkerDirs.state / 'pending.json').open('r') as f:
+                pending = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for event_src_path, pkl_path, time_queued in pending:
+                if isinstance(pkl_path, list):
+                    pkl_path = tuple(Path(p) for p in pkl_path)
+                elif pkl_path is not None:
+                    pkl_path = Path(pkl_path)
+                pkl_paths = pkl_path if isinstance(pkl_path, tuple) else (pkl_path,)
+                if not os.path.exists(event_src_path) or not all(p is None or p.exists() for p in pkl_paths):
+                    continue
+                if event_src_path not in self.src2options:
+                    self.src2options[event_src_path] = self.load_options(self.get_project_path(event_src_path))
+                self.pending.append((event_src_path, pkl_path, time_queued))
+            self.save_pending()
+        custom_print('Restored {} pending job(s)'.format(len(self.pending)))
+
+    def make_queue_status(self):
+        """number of running and pending jobs of each user, and how long the oldest pending job has waited"""
+        user2status = {}
+        for event_src_path, _ in self.process2job.values():
+            status = user2status.setdefault(self.get_user(event_src_path),
+                                            {'num_running': 0, 'num_pending': 0, 'max_wait': 0.0})
+            status['num_running'] += 1
+        for event_src_path, pkl_path, time_queued in self.pending:
+            status = user2status.setdefault(self.get_user(event_src_path),
+                                            {'num_running': 0, 'num_pending': 0, 'max_wait': 0.0})
+            status['num_pending'] += len(pkl_path) if isinstance(pkl_path, tuple) else 1
+            status['max_wait'] = max(status['max_wait'], time.time() - time_queued)
+        return user2status
+
+    def make_heartbeat(self):
+        """state of running and pending jobs - jobs report what they are running in job_status"""
+        jobs = []
+        for process, (event_src_path, pkl_path) in self.process2job.items():
+            job = {'pid': process.pid,
+                   'project': self.get_project_path(event_src_path).name,
+                   'user': self.get_user(event_src_path),
+                   'jobs': [],  # (param_name, job_name) of each job run by the process
+                   'elapsed': None,
+                   'is_preempted': process in self.preempted}
+            try:
+                with (config.WorkerDirs.job_status / '{}.json'.format(process.pid)).open('r') as f:
+                    job_status = json.load(f)
+            except (OSError, ValueError):  # job has not started yet
+                pass
+            else:
+                job['jobs'] = job_status['jobs']
+                job['elapsed'] = time.time() - job_status['start_time']
+            jobs.append(job)
+        return {'hostname': hostname.lower(),
+                'time': time.time(),
+                'running': jobs,
+                'num_pending': sum(len(p) if isinstance(p, tuple) else 1 for _, p, _ in self.pending),
+                'user2status': self.make_queue_status(),
+                'last_error': self.last_error}
+
+    @staticmethod
+    def save_heartbeat(heartbeat):
+        path = config.WorkerDirs.heartbeats / '{}.json'.format(hostname.lower())
+        tmp_path = path.parent / '.{}.tmp'.format(path.name)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with tmp_path.open('w') as f:
+                json.dump(heartbeat, f)
+            os.replace(str(tmp_path), str(path))
+        except OSError as e:  # e.g. shared drive not available
+            custom_print('Could not save heartbeat: {}'.format(e))
+
+    @staticmethod
+    def load_options(project_path):
+        try:
+            with (project_path / config.Constants.options).open('r') as f:
+                return yaml.load(f, Loader=yaml.FullLoader) or {}
+        except (OSError, yaml.YAMLError):  # submitted with previous version of Ludwig
+            return {}
+
+    @staticmethod
+    def make_batches(jobs, batch_size):
+        """group pickled jobs, so that each batch is run by a single process with main_batch() of the job module"""
+        if batch_size <= 1:
+            return jobs
+        pkl_paths = [pkl_path for _, pkl_path in jobs if pkl_path is not None]
+        res = [job for job in jobs if job[1] is None]
+        for i in range(0, len(pkl_paths), batch_size):
+            batch = tuple(pkl_paths[i:i + batch_size])
+            res.append((jobs[0][0], batch if len(batch) > 1 else batch[0]))
+        return res
+
+    @staticmethod
+    def describe(pkl_path):
+        if isinstance(pkl_path, tuple):
+            return 'batch of {} jobs ({}, ...)'.format(len(pkl_path), pkl_path[0].name)
+        return pkl_path.name if pkl_path is not None else 'jobs from shared queue'
+
+    def partition_cpus(self, num_new=0):
+        """
+        return CPU sets, and re-partition CPUs of running jobs if the number of jobs changed.
+        CPUs are partitioned among the jobs that run (or will run) concurrently, up to the number of slots
+        """
+        num_running = len(self.process2job) + num_new
+        num_parts = max(num_running, 1,  # jobs in fast lane may exceed the number of slots
+                        min(config.Watcher.max_num_slots, num_running + len(self.pending)))
+        parts = partition_cpus(num_parts)
+        if num_parts != self.num_parts:
+            self.num_parts = num_parts
+            for slot, process in enumerate(sorted(self.process2slot, key=self.process2slot.get)):
+                self.process2slot[process] = slot
+                set_affinity(process.pid, parts[slot])
+            custom_print('Partitioned CPUs into {} set(s) of {} CPUs'.format(num_parts, len(parts[-1])))
+        return parts
+
+    def assign_cpus(self):
+        """return slot and set of CPUs for a new job"""
+        parts = self.partition_cpus(num_new=1)
+        slot = min(set(range(len(parts))) - set(self.process2slot.values()))
+        return slot, parts[slot]
+
+    def seconds_since_upload(self, event_src_path):
+        """latency between submission and start of a job - includes waiting for a free slot"""
+        if event_src_path not in self.src2trigger_time:  # e.g. restored after restart of watcher
+            return 0.0
+        return time.time() - self.src2trigger_time[event_src_path]
+
+    def start_job(self, event_src_path, pkl_path):
+        slot, cpus = self.assign_cpus()
+        if isinstance(pkl_path, Path) and self.src2options.get(event_src_path, {}).get('max_jobs_per_process'):
+            process = self.get_warm_process(event_src_path, cpus)
+            custom_print('Executing "{}" with {} in warm process {} ({:.1f}s after upload)'.format(
+                event_src_path, self.describe(pkl_path), process.pid, self.seconds_since_upload(event_src_path)))
+            process.submit(pkl_path)
+        else:
+            custom_print('Executing "{}" with {} ({:.1f}s after upload)'.format(
+                event_src_path, self.describe(pkl_path), self.seconds_since_upload(event_src_path)))
+            command = ['python3.7', event_src_path]
+            if pkl_path is not None:
+                command.extend(str(p) for p in (pkl_path if isinstance(pkl_path, tuple) else (pkl_path,)))
+            process = subprocess.Popen(command, env=make_job_env(cpus))  # stdout is already redirected
+        set_affinity(process.pid, cpus)  # before the job starts threads, which inherit the affinity
+        self.process2slot[process] = slot
+        self.process2job[process] = (event_src_path, pkl_path)
+        self.process2hash[process] = self.load_hash(pkl_path)
+        self.time_of_last_start = datetime.datetime.now()
+
+    def get_warm_process(self, event_src_path, cpus):
+        idle = self.src2idle.get(event_src_path, [])
+        while idle:
+            process = idle.pop()
+            if process.is_alive() and process.num_cpus == len(cpus):
+                return process
+            process.close()  # number of threads cannot be changed after start
+        return WarmProcess(event_src_path, cpus)
+
+    def release_warm_process(self, process, event_src_path, return_code):
+        """keep a warm process for the next job, unless it should be replaced"""
+        max_num_jobs = self.src2options.get(event_src_path, {}).get('max_jobs_per_process') or 0
+        if return_code == 0 and process.is_alive() and process.num_jobs < max_num_jobs \
+                and process not in self.stale and process not in self.preempted:
+            self.src2idle.setdefault(event_src_path, []).append(process)
         else:
-            custom_print('Successfully executed: {}'.format(command))
+            process.close()
+
+    def reap_jobs(self):
+        num_running = len(self.process2job)
+        for process, (event_src_path, pkl_path) in list(self.process2job.items()):
+            return_code = process.poll()
+            if return_code is None:
+                continue
+            del self.process2job[process]
+            del self.process2hash[process]
+            del self.process2slot[process]
+            if isinstance(process, WarmProcess):
+                self.release_warm_process(process, event_src_path, return_code)
+                self.stale.discard(process)
+            self.preempted.discard(process)
+            try:
+                (config.WorkerDirs.job_status / '{}.json'.format(process.pid)).unlink()
+            except FileNotFoundError:
+                pass
+            if return_code == 0:  # this is required to continue to the next item in queue if current item fails
+                custom_print('Successfully executed: {} with {}'.format(event_src_path, self.describe(pkl_path)))
+            else:
+                message = 'Failed to execute: {} with {} (exit code {})'.format(
+                    event_src_path, self.describe(pkl_path), return_code)
+                custom_print(message)
+                self.last_error = {'time': time.time(), 'message': message}
             print()
+        if len(self.process2job) != num_running:  # remaining jobs may use CPUs of finished jobs
+            self.partition_cpus()
+        self.close_idle_warm_processes()
+
+    def close_idle_warm_processes(self):
+        """warm processes keep e.g. datasets in memory - they are closed once their project has no more jobs"""
+        active = {event_src_path for event_src_path, _ in self.process2job.values()}
+        active.update(event_src_path for event_src_path, _, _ in self.pending)
+        for event_src_path in [p for p in self.src2idle if p not in active]:
+            idle = self.src2idle.pop(event_src_path)
+            for process in idle:
+                process.close()
+            if idle:
+                custom_print('Closed {} idle warm process(es) of "{}"'.format(len(idle), event_src_path))
 
     def _process_q(self):
 
         while True:
-            event = self.q.get()
+            event_src_path = self.q.get()
+            with self.upload_lock:
+                self.queued.discard(event_src_path)  # uploads from now on are queued again
             self.housekeeping()
-            self.start_jobs(event.src_path)
+            self.add_jobs(event_src_path)
+
+    def settle(self):
+        """queue projects whose run_*.py was completely uploaded"""
+        with self.upload_lock:
+            for path, upload in list(self.path2upload.items()):
+                if not os.path.exists(path):
+                    del self.path2upload[path]
+                elif self.is_complete(path, upload):
+                    del self.path2upload[path]
+                    self.enqueue(path, upload)
+
+    def _settle(self):
+
+        while True:
+            self.settle()
+            time.sleep(config.Watcher.debounce / 2)
+
+    def _schedule(self):
+
+        while True:
+            with self.lock:
+                self.reap_jobs()
+                num_pending = len(self.pending)
+                while self.pending:
+                    n = self.select_next_job()
+                    event_src_path, pkl_path, time_queued = self.pending[n]
+                    if not self.has_free_slot(self.is_fast_lane(event_src_path)):
+                        break
+                    del self.pending[n]
+                    self.start_job(event_src_path, pkl_path)
+                if len(self.pending) != num_pending:
+                    self.save_pending()
+            time.sleep(config.Watcher.interval)
+
+    def _ship(self):
+        """copy results that jobs saved to the local spool to the shared drive - includes results of previous runs"""
+
+        while True:
+            for marker_path in find_spooled_jobs(config.WorkerDirs.spool):
+                try:
+                    dst = ship(marker_path)
+                except OSError as e:  # e.g. shared drive not available - try again later
+                    message = 'Failed to ship {}: {}'.format(marker_path.stem, e)
+                    custom_print(message)
+                    self.last_error = {'time': time.time(), 'message': message}
+                    break
+                custom_print('Shipped results to {}'.format(dst))
+            time.sleep(config.Watcher.ship_interval)
+
+    def _beat(self):
+        """publish the state of the worker to the shared drive, where ludwig-status reads it"""
+
+        while True:
+            with self.lock:
+                heartbeat = self.make_heartbeat()
+            heartbeat.update(self.stats())  # slow (nvidia-smi) - do not hold lock
+            heartbeat['total_memory'] = psutil.virtual_memory().total
+            self.save_heartbeat(heartbeat)  # shared drive may be slow - do not hold lock
+            time.sleep(config.Watcher.heartbeat_interval)
 
 
 def main():
@@ -112,6 +772,7 @@ def main():
     sys.stdout.flush()
     observer = Observer()
     handler = Handler()
+    handler.restore_pending()
     handler.start()
 
     observer.schedule(handler, str(config.WorkerDirs.watched), recursive=False)
@@ -130,4 +791,9 @@ if __name__ == '__main__':
     p = Path(config.WorkerDirs.stdout)
     if not p.exists():
         p.mkdir(parents=True)
+    config.WorkerDirs.spool.mkdir(parents=True, exist_ok=True)  # jobs only use spool if it exists
+    config.WorkerDirs.data_cache.mkdir(parents=True, exist_ok=True)
+    config.WorkerDirs.artifacts.mkdir(parents=True, exist_ok=True)
+    config.WorkerDirs.state.mkdir(parents=True, exist_ok=True)
+    config.WorkerDirs.job_status.mkdir(parents=True, exist_ok=True)  # jobs only report status if it exists
     main()